@@ -0,0 +1,7 @@
+"""
+Offline benchmarks of BBDD_MANAGEMENT, RAGManager and the views.
+
+The Azure OpenAI chat model and embeddings are replaced by deterministic local fakes with a
+configurable latency, and the catalogs are generated synthetically, so the benchmarks run without
+credentials or network. See benchmarks/run.py for the usage.
+"""
@@ -0,0 +1,44 @@
+import random
+
+PIECES = ["anillo", "collar", "pendientes", "pulsera", "colgante", "broche", "tobillera", "gargantilla"]
+STYLES = ["luna", "sol", "estrella", "flor", "corazón", "hoja", "ola", "trenza", "perla", "nudo"]
+COLORS = ["oro", "plata", "rosa", "negro", "blanco", "rojo", "azul", "verde"]
+MATERIALS = ["plata de ley", "oro de 18 quilates", "acero", "latón bañado", "cuero", "resina"]
+FINISHES = ["pulido", "mate", "martelé", "envejecido", "con circonitas", "esmaltado"]
+
+QUERIES = [
+    "pendientes de plata por menos de 50",
+    "anillo de oro",
+    "collar rosa desde 30",
+    "pulsera negra",
+    "regalo con forma de luna",
+    "colgante de estrella hasta 80",
+    "broche esmaltado azul",
+    "gargantilla blanca mas de 100",
+]
+
+
+def generate_catalog(size: int, seed: int = 0):
+    """
+    Generates a synthetic catalog of jewelry products, lazily, so that large catalogs fit in memory.
+
+    The catalog only depends on `size` and `seed`, so the benchmarks are comparable across runs.
+
+    Args:
+        size (int): Number of products.
+        seed (int): Seed of the random generator.
+
+    Yields:
+        dict: Product with name, color, price and description.
+    """
+    rng = random.Random(seed)
+    for number in range(size):
+        piece = rng.choice(PIECES)
+        style = rng.choice(STYLES)
+        color = rng.choice(COLORS)
+        yield {
+            "name": f"{piece.capitalize()} {style} {number}",
+            "color": color,
+            "price": round(rng.lognormvariate(3.8, 0.7)),
+            "description": f"{piece.capitalize()} artesanal de {rng.choice(MATERIALS)} en color {color}, {rng.choice(FINISHES)}, con motivo de {style}.",
+        }
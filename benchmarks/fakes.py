@@ -0,0 +1,105 @@
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from utils.embeddings import HashingEmbeddings
+import asyncio
+import time
+import re
+
+IDS_PATTERN = re.compile(r"Los ids de los elementos de la base de datos son: \[([^\]]*)\]")
+
+
+class FakeEmbeddings(HashingEmbeddings):
+    """
+    Deterministic local embeddings that simulate the latency of a remote embeddings API.
+
+    The vectors are those of HashingEmbeddings; every call (a whole batch for embed_documents)
+    waits `latency` seconds, like a network round trip would.
+    """
+
+    def __init__(self, dimension: int = 256, latency: float = 0.0):
+        """
+        Args:
+            dimension (int): Number of dimensions of the embeddings.
+            latency (float): Seconds each call waits.
+        """
+        super().__init__(dimension)
+        self.latency = latency
+        self.calls = 0
+
+    def embed_documents(self, texts: list):
+        self.calls += 1
+        time.sleep(self.latency)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text: str):
+        self.calls += 1
+        time.sleep(self.latency)
+        return super().embed_query(text)
+
+    async def aembed_documents(self, texts: list):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return HashingEmbeddings.embed_documents(self, texts)
+
+    async def aembed_query(self, text: str):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return HashingEmbeddings.embed_query(self, text)
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic chat model that simulates the latency of a remote LLM.
+
+    The answers depend only on the prompt: the metadata filter requests get an empty filter, and the
+    chatbot prompts get an answer with a <product> tag for each id retrieved by RAG. Each call waits
+    `latency` seconds before the first token and `token_latency` seconds per token.
+    """
+
+    latency: float = 0.0
+    token_latency: float = 0.0
+
+    @property
+    def _llm_type(self):
+        return "fake-chat-model"
+
+    def answer(self, messages: list):
+        prompt = messages[-1].content
+        match = IDS_PATTERN.search(prompt)
+        if match is None:
+            return "{}" if "filtro" in messages[0].content else "De acuerdo, aquí tienes un resumen de la conversación."
+        ids = [product_id.strip() for product_id in match.group(1).split(",") if product_id.strip()]
+        products = "".join(f"<product>{product_id}</product>" for product_id in ids)
+        return f"<root><p>Estos productos pueden interesarte:</p>{products}</root>"
+
+    def tokens(self, content: str):
+        return re.findall(r"\S+\s*", content)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        content = self.answer(messages)
+        time.sleep(self.latency + self.token_latency * len(self.tokens(content)))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        content = self.answer(messages)
+        await asyncio.sleep(self.latency + self.token_latency * len(self.tokens(content)))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        for token in self.tokens(self.answer(messages)):
+            time.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager is not None:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        for token in self.tokens(self.answer(messages)):
+            await asyncio.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager is not None:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
@@ -0,0 +1,613 @@
+"""
+Runs the offline benchmarks and stores their results as JSON.
+
+Usage (from the root of the repository):
+    python -m benchmarks.run
+    python -m benchmarks.run --suites database --db-sizes 1000 100000 1000000
+    python -m benchmarks.run --suites startup --cold-start-budget 1000
+    python -m benchmarks.run --suites workers --workers-size 100000 --worker-counts 1 4 8
+    python -m benchmarks.run --embedding-latency 0.05 --llm-latency 0.5 --compare benchmarks/results/<previous>.json
+"""
+from benchmarks.catalog import QUERIES, generate_catalog
+from benchmarks.fakes import FakeChatModel, FakeEmbeddings
+from datetime import datetime, timezone
+from sqlalchemy import Integer, String
+import subprocess
+import contextlib
+import statistics
+import tracemalloc
+import itertools
+import platform
+import tempfile
+import argparse
+import asyncio
+import random
+import json
+import time
+import sys
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PRODUCT_COLUMNS = {"id": Integer, "name": String, "color": String, "price": Integer, "description": String}
+
+
+def summarize(latencies: list, elapsed: float = None, items: int = None):
+    """
+    Summarizes the latencies of a benchmark.
+
+    Args:
+        latencies (list): Seconds taken by each operation.
+        elapsed (float, optional): Wall-clock seconds of the whole run, when the operations overlap.
+        items (int, optional): Number of items processed, when an operation processes several.
+
+    Returns:
+        dict: Throughput and latency percentiles, in operations (or items) per second and milliseconds.
+    """
+    latencies = sorted(latencies)
+    elapsed = elapsed if elapsed is not None else sum(latencies)
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+
+    summary = {
+        "count": len(latencies),
+        "throughput": (items or len(latencies)) / elapsed if elapsed else 0.0,
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+        "max_ms": latencies[-1] * 1000,
+    }
+    if items is not None:
+        summary["items"] = items
+    return summary
+
+
+def measure(function, arguments):
+    """
+    Calls a function once per argument.
+
+    Returns:
+        list: Seconds taken by each call.
+    """
+    latencies = []
+    for argument in arguments:
+        start = time.perf_counter()
+        function(argument)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+async def measure_concurrently(function, arguments, concurrency: int):
+    """
+    Awaits a coroutine function once per argument, with at most `concurrency` calls in flight.
+
+    Returns:
+        tuple: Seconds taken by each call and wall-clock seconds of the whole run.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def call(argument):
+        async with semaphore:
+            start = time.perf_counter()
+            await function(argument)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(call(argument) for argument in arguments))
+    return latencies, time.perf_counter() - start
+
+
+def measure_peak_memory(function):
+    """
+    Calls a function once, tracing the memory it allocates.
+
+    Returns:
+        dict: Milliseconds taken (with the overhead of tracing) and peak MB allocated by the call.
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"elapsed_ms": elapsed * 1000, "peak_mb": peak / 1024 / 1024}
+
+
+def stage_totals():
+    """
+    Returns:
+        dict: Total seconds and count of each stage measured by utils.metrics so far.
+    """
+    from utils.metrics import STAGE_DURATION
+
+    totals = {}
+    for metric in STAGE_DURATION.collect():
+        for sample in metric.samples:
+            stage = sample.labels.get("stage")
+            if sample.name.endswith("_sum"):
+                totals.setdefault(stage, {})["seconds"] = sample.value
+            elif sample.name.endswith("_count"):
+                totals.setdefault(stage, {})["count"] = sample.value
+    return totals
+
+
+def stage_breakdown(before: dict):
+    """
+    Returns:
+        dict: Seconds and count of each stage measured since `before` was taken with stage_totals.
+    """
+    breakdown = {}
+    for stage, total in stage_totals().items():
+        previous = before.get(stage, {})
+        count = total.get("count", 0) - previous.get("count", 0)
+        if count:
+            breakdown[stage] = {"count": int(count), "seconds": total.get("seconds", 0) - previous.get("seconds", 0)}
+    return breakdown
+
+
+def bench_database(size: int, directory: str, args):
+    """
+    Benchmarks BBDD_MANAGEMENT on a catalog of `size` products: startup, bulk add, add, concurrent add,
+    filtered reads before and after indexing, primary key reads (with the shared manager and with a
+    manager built per request), batch lookups, listing the whole table (streamed and as a DataFrame,
+    with its peak memory) and drops.
+    """
+    from utils.database_manager import BBDD_MANAGEMENT
+
+    rng = random.Random(args.seed)
+    before = stage_totals()
+    results = {}
+
+    start = time.perf_counter()
+    manager = BBDD_MANAGEMENT(os.path.join(directory, f"catalog_{size}"))
+    results["startup_ms"] = (time.perf_counter() - start) * 1000
+    manager.create_table("products", PRODUCT_COLUMNS)
+
+    start = time.perf_counter()
+    total = manager.bulk_add_data("products", generate_catalog(size, args.seed), chunk_size=args.chunk_size)
+    results["bulk_add"] = summarize([time.perf_counter() - start], items=total)
+
+    products = list(generate_catalog(args.operations, args.seed + 1))
+    results["add"] = summarize(measure(lambda product: manager.add_data("products", dict(product)), products))
+
+    async def add_concurrently():
+        return await measure_concurrently(
+            lambda product: manager.aadd_data("products", dict(product)), products, args.concurrency
+        )
+    latencies, elapsed = asyncio.run(add_concurrently())
+    results["add_concurrent"] = summarize(latencies, elapsed)
+
+    filters = [
+        {"color": "plata", "price": {"$lte": 50}},
+        {"price": {"$gte": 100, "$lte": 120}},
+        {"color": {"$in": ["oro", "rosa"]}, "price": {"$lt": 30}},
+    ]
+    queries = [filters[i % len(filters)] for i in range(args.operations)]
+    read = lambda query: manager.select_rows("products", query, limit=args.k)
+    results["filtered_read"] = summarize(measure(read, queries))
+    manager.create_index("products", ["color", "price"])
+    manager.create_index("products", ["price"])
+    results["filtered_read_indexed"] = summarize(measure(read, queries))
+
+    ids = [rng.randint(1, total) for _ in range(args.reads)]
+    results["primary_key_read"] = summarize(measure(lambda product_id: manager.select_rows("products", {"id": product_id}), ids))
+
+    # Before the shared managers, every request built its own BBDD_MANAGEMENT (engine, schema reflection)
+    def read_with_new_manager(product_id):
+        request_manager = BBDD_MANAGEMENT(os.path.join(directory, f"catalog_{size}"))
+        request_manager.select_rows("products", {"id": product_id})
+        request_manager.remove_session()
+        request_manager.engine.dispose()
+    results["primary_key_read_manager_per_request"] = summarize(measure(read_with_new_manager, ids[:args.operations]))
+    batches = [rng.sample(range(1, total + 1), min(50, total)) for _ in range(args.operations)]
+    results["batch_lookup_50"] = summarize(measure(lambda batch: manager.get_data_by_ids("products", batch), batches))
+    results["row_cache"] = manager.cache_stats()
+
+    # Listing the whole table: streamed rows (GET /{table_name}/rows) against the DataFrame of get_all_data
+    def list_rows():
+        for _ in manager.iter_rows("products"):
+            pass
+    results["list_rows_stream"] = measure_peak_memory(list_rows)
+    results["list_rows_dataframe"] = measure_peak_memory(lambda: manager.get_all_data("products"))
+
+    drops = rng.sample(range(1, total + 1), min(args.operations, total))
+    results["drop"] = summarize(measure(lambda product_id: manager.drop_data("products", {"id": product_id}), drops))
+
+    results["stages"] = stage_breakdown(before)
+    manager.remove_session()
+    manager.engine.dispose()
+    return results
+
+
+def create_rag_manager(directory: str, size: int, args):
+    from utils.rag_manager import RAGManager
+
+    os.environ["VECTORSTORE_PATH"] = os.path.join(directory, f"vectorstore_{size}")
+    os.environ["RAG_LEXICAL_INDEX_PATH"] = os.path.join(directory, f"lexical_{size}.db")
+    embeddings = FakeEmbeddings(dimension=args.dimension, latency=args.embedding_latency)
+    ai_client = FakeChatModel(latency=args.llm_latency, token_latency=args.token_latency)
+    return RAGManager(embedding_function=embeddings, ai_client=ai_client)
+
+
+def add_catalog(rag_manager, size: int, args):
+    """
+    Adds a generated catalog of `size` products to the vectorstore, in chunks of --chunk-size.
+
+    Returns:
+        int: Number of vectors added.
+    """
+    catalog = ({**product, "id": number} for number, product in enumerate(generate_catalog(size, args.seed), start=1))
+    total = 0
+    while True:
+        chunk = list(itertools.islice(catalog, args.chunk_size))
+        if not chunk:
+            break
+        total += rag_manager.add_data_bulk(chunk)
+    return total
+
+
+async def bench_rag(size: int, directory: str, args):
+    """
+    Benchmarks RAGManager on a catalog of `size` products: startup, bulk add, add, vector and hybrid
+    search, concurrent search, drop, restart from the persisted vectorstore, search with a manager built
+    per request against the shared one and chatbot end to end.
+
+    It runs in a single event loop, as the concurrency semaphore of the RAGManager is bound to it.
+    """
+    rng = random.Random(args.seed)
+    before = stage_totals()
+    results = {}
+
+    start = time.perf_counter()
+    rag_manager = create_rag_manager(directory, size, args)
+    results["startup_empty_ms"] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    total = add_catalog(rag_manager, size, args)
+    results["bulk_add"] = summarize([time.perf_counter() - start], items=total)
+
+    products = [{**product, "id": size + number} for number, product in enumerate(generate_catalog(args.operations, args.seed + 1), start=1)]
+    results["add"] = summarize(measure(rag_manager.add_data, products))
+
+    queries = [QUERIES[i % len(QUERIES)] for i in range(args.operations)]
+    for hybrid in (False, True):
+        rag_manager.hybrid = hybrid
+        name = "hybrid_search" if hybrid else "vector_search"
+        results[name] = summarize(measure(lambda query: rag_manager.retrieve_data(query, k=args.k), queries))
+        latencies, elapsed = await measure_concurrently(
+            lambda query: rag_manager.aretrieve_data(query, k=args.k), queries, args.concurrency
+        )
+        results[f"{name}_concurrent"] = summarize(latencies, elapsed)
+
+    drops = rng.sample(range(1, total + 1), min(args.drops, total))
+    results["drop"] = summarize(measure(lambda product_id: rag_manager.drop_data({"id": product_id}), drops))
+
+    start = time.perf_counter()
+    rag_manager.persistence.snapshot(rag_manager.vectorstore)
+    results["snapshot_ms"] = (time.perf_counter() - start) * 1000
+    rag_manager.close()
+    start = time.perf_counter()
+    rag_manager = create_rag_manager(directory, size, args)
+    results["startup_loaded_ms"] = (time.perf_counter() - start) * 1000
+
+    # Before the shared managers, every request built its own RAGManager, loading the vectorstore again
+    def retrieve_with_new_manager(query):
+        request_manager = create_rag_manager(directory, size, args)
+        request_manager.retrieve_data(query, k=args.k)
+        request_manager.close()
+    per_request_queries = queries[:max(1, args.operations // 10)]
+    results["search_manager_per_request"] = summarize(measure(retrieve_with_new_manager, per_request_queries))
+    results["search_shared_manager"] = summarize(measure(lambda query: rag_manager.retrieve_data(query, k=args.k), per_request_queries))
+
+    threads = itertools.count()
+    latencies, elapsed = await measure_concurrently(
+        lambda query: rag_manager.achatbot(query, f"thread-{next(threads)}"), queries, args.concurrency
+    )
+    results["chatbot"] = summarize(latencies, elapsed)
+
+    async def first_token(query):
+        start = time.perf_counter()
+        # Closed explicitly, so that the rest of the answer is not left pending when it is abandoned
+        async with contextlib.aclosing(rag_manager.astream_chatbot(query, f"stream-{query}")) as events:
+            async for event, data in events:
+                if event == "token":
+                    return time.perf_counter() - start
+    results["chatbot_first_token"] = summarize([await first_token(query) for query in queries[:args.k]])
+
+    results["filter_cache"] = rag_manager.filter_cache.stats()
+    results["stages"] = stage_breakdown(before)
+    return results
+
+
+def bench_http(directory: str, args):
+    """
+    Benchmarks the views and a fingerprinted asset: requests per second and bytes transferred, plain,
+    gzip-compressed and revalidated with If-None-Match. Also measures the latency of "/" while chatbot
+    requests are in flight.
+    """
+    from fastapi.testclient import TestClient
+    from utils.dependencies import asset_manifest
+    from main import app
+
+    # Used without its context manager, so the startup events (and the managers) are not run
+    client = TestClient(app)
+    results = {}
+    paths = ["/", "/cart", asset_manifest().url("styles/style.css")]
+    for path in paths:
+        etag = client.get(path).headers["etag"]
+        for mode, headers in {
+            "identity": {"Accept-Encoding": "identity"},
+            "gzip": {"Accept-Encoding": "gzip"},
+            "revalidate": {"Accept-Encoding": "gzip", "If-None-Match": etag},
+        }.items():
+            transferred = []
+
+            def request(_):
+                response = client.get(path, headers=headers)
+                transferred.append(response.num_bytes_downloaded)
+            summary = summarize(measure(request, range(args.requests)))
+            summary["bytes_per_request"] = statistics.fmean(transferred)
+            results[f"{path} {mode}"] = summary
+
+    results["chatbot_load"] = asyncio.run(bench_chatbot_load(directory, args))
+    return results
+
+
+async def bench_chatbot_load(directory: str, args):
+    """
+    Measures the latency of "/" alone and while --concurrency chatbot requests are kept in flight, all
+    served by the same event loop, so any chatbot work blocking the loop shows up in the p99 of "/".
+    """
+    import httpx
+    from utils.dependencies import get_rag_manager
+    from main import app
+
+    size = min(args.rag_sizes)
+    rag_manager = create_rag_manager(os.path.join(directory, "chatbot_load"), size, args)
+    add_catalog(rag_manager, size, args)
+    app.dependency_overrides[get_rag_manager] = lambda: rag_manager
+    results = {}
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmarks") as client:
+            async def home(_):
+                (await client.get("/")).raise_for_status()
+
+            latencies, elapsed = await measure_concurrently(home, range(args.requests), 1)
+            results["/ idle"] = summarize(latencies, elapsed)
+
+            stopped = asyncio.Event()
+            chatbot_latencies = []
+
+            async def chat(worker):
+                for number in itertools.count():
+                    if stopped.is_set():
+                        break
+                    start = time.perf_counter()
+                    response = await client.post("/database/chatbot", json={"text": QUERIES[number % len(QUERIES)]})
+                    response.raise_for_status()
+                    chatbot_latencies.append(time.perf_counter() - start)
+
+            chats = [asyncio.create_task(chat(worker)) for worker in range(args.concurrency)]
+            latencies, elapsed = await measure_concurrently(home, range(args.requests), 1)
+            stopped.set()
+            await asyncio.gather(*chats)
+            results["/ with chatbot in flight"] = summarize(latencies, elapsed)
+            results["chatbot"] = summarize(chatbot_latencies)
+    finally:
+        app.dependency_overrides.pop(get_rag_manager, None)
+        rag_manager.close()
+    return results
+
+
+# Run by bench_workers in each process: loads the vectorstore, searches it and waits until measured
+WORKER_SCRIPT = """
+import sys
+from benchmarks.fakes import FakeChatModel, FakeEmbeddings
+from utils.rag_manager import RAGManager
+rag_manager = RAGManager(embedding_function=FakeEmbeddings(dimension=DIMENSION), ai_client=FakeChatModel())
+embedding = rag_manager.embedding_function.embed_query("anillo de oro")
+for _ in range(10):
+    rag_manager.search_by_vector(embedding, 10)
+print("ready", flush=True)
+sys.stdin.read()
+rag_manager.close()
+"""
+
+
+def memory_usage(pid: int):
+    """
+    Returns:
+        dict: Resident memory of a process and its proportional share (Pss) of the pages shared with
+        other processes, in MB. Linux only.
+    """
+    usage = {}
+    with open(f"/proc/{pid}/smaps_rollup") as file:
+        for line in file:
+            key, _, value = line.partition(":")
+            if key in ("Rss", "Pss"):
+                usage[key.lower()] = int(value.split()[0]) / 1024
+    return usage
+
+
+def bench_workers(size: int, directory: str, args):
+    """
+    Measures the memory used by several processes serving the same vectorstore of `size` products, each
+    with its own copy of the vectorstore (local mode) or with a shared memory-mapped generation (shared mode).
+    """
+    if not os.path.exists("/proc/self/smaps_rollup"):
+        print("La suite workers necesita /proc/<pid>/smaps_rollup (Linux).")
+        return {}
+    rag_manager = create_rag_manager(os.path.join(directory, "workers"), size, args)
+    add_catalog(rag_manager, size, args)
+    rag_manager.close()
+
+    script = f"DIMENSION = {args.dimension}\n{WORKER_SCRIPT}"
+    results = {}
+    for mode in ("local", "shared"):
+        for workers in args.worker_counts:
+            environment = {**os.environ, "VECTORSTORE_MODE": mode}
+            start = time.perf_counter()
+            processes = [
+                subprocess.Popen([sys.executable, "-c", script], stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, env=environment, cwd=ROOT)
+                for _ in range(workers)
+            ]
+            for process in processes:
+                process.stdout.readline()
+            elapsed = time.perf_counter() - start
+            usages = [memory_usage(process.pid) for process in processes]
+            for process in processes:
+                process.communicate("")
+            results[f"{mode} {workers}"] = {
+                "ready_ms": elapsed * 1000,
+                "total_pss_mb": sum(usage["pss"] for usage in usages),
+                "rss_per_worker_mb": statistics.fmean(usage["rss"] for usage in usages),
+            }
+    return results
+
+
+# Run in a fresh interpreter by bench_startup, so that nothing is imported beforehand
+COLD_START_SCRIPT = """
+import json, sys, time
+from fastapi.testclient import TestClient
+client_imported = time.perf_counter()
+import main
+imported = time.perf_counter()
+with TestClient(main.app) as client:
+    status = client.get("/").status_code
+    served = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - client_imported) * 1000,
+    "first_response_ms": (served - client_imported) * 1000,
+    "status": status,
+    "heavy_modules": sorted(module for module in HEAVY_MODULES if module in sys.modules),
+}))
+"""
+
+# Modules that must not be imported to serve the views
+HEAVY_MODULES = ("pandas", "sqlalchemy", "langchain_openai", "langchain_community", "langgraph", "faiss", "PIL")
+
+
+def bench_startup(args):
+    """
+    Measures the cold start of the application: the time from launching a fresh process to the first
+    response of "/", checked against --cold-start-budget, and which heavy modules were imported to serve it.
+    """
+    environment = {**os.environ, "LAZY_STARTUP": "true"}
+    script = f"HEAVY_MODULES = {HEAVY_MODULES!r}\n{COLD_START_SCRIPT}"
+    runs, totals = [], []
+    for _ in range(args.cold_starts):
+        start = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, "-c", script], capture_output=True, text=True, env=environment, cwd=ROOT, check=True
+        ).stdout
+        totals.append((time.perf_counter() - start) * 1000)
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    process = statistics.median(totals)
+    results = {
+        "import_ms": statistics.median(run["import_ms"] for run in runs),
+        "first_response_ms": statistics.median(run["first_response_ms"] for run in runs),
+        "process_ms": process,
+        "budget_ms": args.cold_start_budget,
+        "within_budget": process <= args.cold_start_budget,
+        "heavy_modules": runs[-1]["heavy_modules"],
+    }
+    if not results["within_budget"]:
+        print(f"Arranque en frío de {process:.0f} ms, por encima del presupuesto de {args.cold_start_budget:.0f} ms")
+    if results["heavy_modules"]:
+        print(f"Módulos pesados importados al arrancar: {', '.join(results['heavy_modules'])}")
+    return results
+
+
+def flatten(results: dict, prefix: str = ""):
+    for key, value in results.items():
+        if isinstance(value, dict):
+            yield from flatten(value, f"{prefix}{key}.")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield f"{prefix}{key}", value
+
+
+def compare(previous: dict, current: dict):
+    """
+    Prints the change of the throughput and latency metrics found in both results.
+    """
+    old = dict(flatten(previous["results"]))
+    new = dict(flatten(current["results"]))
+    print(f"Comparación con {previous['commit']} ({previous['date']}):")
+    for key in sorted(old.keys() & new.keys()):
+        if key.endswith(("throughput", "_ms")) and old[key]:
+            print(f"  {key}: {old[key]:.2f} -> {new[key]:.2f} ({new[key] / old[key]:.2f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks of the database, the RAG pipeline and the views.")
+    parser.add_argument("--suites", nargs="+", default=["database", "rag", "http", "startup"], choices=["database", "rag", "http", "startup", "workers"])
+    parser.add_argument("--db-sizes", nargs="+", type=int, default=[1000, 10000, 100000], help="Catalog sizes of the database suite.")
+    parser.add_argument("--rag-sizes", nargs="+", type=int, default=[1000, 10000], help="Catalog sizes of the RAG suite.")
+    parser.add_argument("--operations", type=int, default=200, help="Operations of each latency benchmark.")
+    parser.add_argument("--reads", type=int, default=100000, help="Primary key reads of the database suite.")
+    parser.add_argument("--drops", type=int, default=20, help="Products dropped from the vectorstore.")
+    parser.add_argument("--requests", type=int, default=500, help="Requests of each HTTP benchmark.")
+    parser.add_argument("--concurrency", type=int, default=16, help="Operations in flight in the concurrent benchmarks.")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Rows per chunk of the bulk adds.")
+    parser.add_argument("--k", type=int, default=10, help="Products returned by each search.")
+    parser.add_argument("--dimension", type=int, default=256, help="Dimensions of the fake embeddings.")
+    parser.add_argument("--embedding-latency", type=float, default=0.0, help="Seconds each embeddings call waits.")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Seconds each LLM call waits before its first token.")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Seconds the LLM waits for each token.")
+    parser.add_argument("--workers-size", type=int, default=50000, help="Catalog size of the workers suite.")
+    parser.add_argument("--worker-counts", nargs="+", type=int, default=[1, 2, 4], help="Processes started by the workers suite.")
+    parser.add_argument("--cold-starts", type=int, default=5, help="Fresh processes started by the startup suite.")
+    parser.add_argument("--cold-start-budget", type=float, default=1500, help="Milliseconds allowed from launching a process to its first response of \"/\".")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON file of the results. Defaults to benchmarks/results/<date>-<commit>.json.")
+    parser.add_argument("--compare", help="JSON file of previous results to compare with.")
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ["EMBEDDINGS_CACHE_PATH"] = ""
+    os.environ["CHATBOT_CHECKPOINTER"] = "memory"
+    os.environ["RAG_RULE_BASED_FILTERS"] = "true"
+    os.environ["VECTORSTORE_FLUSH_SIZE"] = str(10 ** 9)
+    os.environ["VECTORSTORE_FLUSH_INTERVAL"] = str(10 ** 9)
+    from utils.logging_config import configure_logging
+    configure_logging()
+
+    commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip() or "unknown"
+    date = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="benchmarks-") as directory:
+        if "database" in args.suites:
+            results["database"] = {str(size): bench_database(size, directory, args) for size in args.db_sizes}
+        if "rag" in args.suites:
+            results["rag"] = {str(size): asyncio.run(bench_rag(size, directory, args)) for size in args.rag_sizes}
+        if "workers" in args.suites:
+            results["workers"] = bench_workers(args.workers_size, directory, args)
+        if "http" in args.suites:
+            results["http"] = bench_http(directory, args)
+    if "startup" in args.suites:
+        results["startup"] = bench_startup(args)
+
+    report = {
+        "commit": commit,
+        "date": date,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": vars(args),
+        "results": results,
+    }
+    output = args.output or os.path.join("benchmarks", "results", f"{date}-{commit}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"Resultados guardados en {output}")
+
+    if args.compare:
+        with open(args.compare) as file:
+            compare(json.load(file), report)
+
+
+if __name__ == "__main__":
+    main()
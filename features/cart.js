@@ -50,8 +50,10 @@ async function loadCartTable() {
             return button;
         }
         var total = 0;
+        // All the cart products are fetched in a single request
+        const productsValues = await getProducts(products.map(product => product["id"]));
         for (let product = 0; product < products.length; product++) {
-            let values = await getProduct(products[product]["id"]);
+            let values = productsValues[products[product]["id"]] || await getProduct(products[product]["id"]);
             row = document.createElement("tr");
             table.appendChild(row);
             for (let column in columns) {
@@ -65,7 +67,9 @@ async function loadCartTable() {
                 } else if (columns[column] == "preview") {
                     const preview = document.createElement("img");
                     cell.appendChild(preview);
-                    // preview.src = values[columns[column]]; TODO: implement preview retrieval
+                    if (values["image"]) {
+                        preview.src = getThumbnailUrl(values["image"], 64);
+                    }
                 } else if (["quantity"].includes(columns[column])) {
                     cell.textContent = products[product][columns[column]].toFixed(0) + "x";
                 } else if (columns[column] == "price") {
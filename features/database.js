@@ -80,4 +80,61 @@ async function getProduct(id) {
  */
 async function getCollection(id) {
     return await getObject("collection", id);
-}
\ No newline at end of file
+}
+
+/**
+ * Fetches several products in a single request.
+ *
+ * @async
+ * @param {string[]} ids - The identifiers of the products.
+ * @returns {Promise<Object.<string, Object>>} A promise that resolves to the products found, indexed by id.
+ * @throws {Error} Throws an error if the HTTP request fails.
+ */
+async function getProducts(ids) {
+    var products = {};
+    if (ids.length == 0) {
+        return products;
+    }
+    const url = "/database/products?ids=" + ids.map(encodeURIComponent).join(",");
+    try {
+        var response = await fetch(url);
+        if (!response.ok) {
+            throw new Error("HTTP error " + response.status + " while fetching products " + ids + ".");
+        }
+        var data = (await response.json())["data"];
+        for (let product = 0; product < data.length; product++) {
+            products[data[product]["id"]] = data[product];
+        }
+    } catch (error) {
+        console.error("Failed to fetch products " + ids + ":", error);
+    }
+    return products;
+}
+/**
+ * Returns the URL of the thumbnail of an uploaded image.
+ *
+ * @param {string} image - The digest of the image, as returned by uploadImage.
+ * @param {number} size - The minimum width and height of the thumbnail, in pixels.
+ * @returns {string} The URL of the thumbnail.
+ */
+function getThumbnailUrl(image, size) {
+    return "/database/image/" + image + "?size=" + Math.ceil(size * (window.devicePixelRatio || 1));
+}
+
+/**
+ * Uploads an image, generating its thumbnails on the server.
+ *
+ * @async
+ * @param {File} file - The image file to upload.
+ * @returns {Promise<Object>} A promise that resolves to the uploaded image, whose "image" key identifies it.
+ * @throws {Error} Throws an error if the HTTP request fails.
+ */
+async function uploadImage(file) {
+    const body = new FormData();
+    body.append("file", file);
+    const response = await fetch("/database/image", { method: "POST", body: body });
+    if (!response.ok) {
+        throw new Error("HTTP error " + response.status + " while uploading image " + file.name + ".");
+    }
+    return await response.json();
+}
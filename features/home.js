@@ -28,10 +28,12 @@ async function chat(question) {
     const answer = "<root><p>Hi, I'm glad to hear from you.\nThese following products might interest you:</p><product>1234</product><p>And also, you can check the entire collection here:</p><collection>3214</collection></root>"; // TODO: remove when chatbot is implemented.
     try {
         var objects = (new DOMParser()).parseFromString(answer, "application/xml").childNodes[0].childNodes;
+        // All the products of the answer are fetched in a single request
+        const products = await getProducts(Array.from(objects).filter(object => object.nodeName == "product").map(object => object.textContent));
         for (let object in objects) {
             let objectclass = objects[object].nodeName;
             let content = objects[object].textContent;
-            await addChatBubble("bot", objectclass, content);
+            await addChatBubble("bot", objectclass, content, products[content]);
         }
     } catch (error) {
         console.error("Failed to read chatbot response:", error);
@@ -45,12 +47,13 @@ async function chat(question) {
  * @param {string} side - The conversation side of the chat bubble ('user' or 'bot').
  * @param {string} objectclass - The class of content ('product', 'collection', or 'p').
  * @param {string} content - The content to be displayed in the chat bubble.
+ * @param {Object} [object] - The product or collection of the bubble, if already fetched.
  */
-async function addChatBubble(side, objectclass, content) {
+async function addChatBubble(side, objectclass, content, object) {
     if (objectclass == "p") {
         var object = content;
     } else if (objectclass == "product") {
-        var object = await getProduct(content);
+        var object = object || await getProduct(content);
         var rows = ["price", "name", "id", "description"];
     } else if (objectclass == "collection") {
         var object = await getCollection(content);
@@ -69,7 +72,7 @@ async function addChatBubble(side, objectclass, content) {
             let preview = document.createElement("img");
             bubble.appendChild(preview);
             preview.classList.add("preview");
-            preview.src = object.preview;
+            preview.src = object.image ? getThumbnailUrl(object.image, 160) : object.preview;
             // Info
             let info = document.createElement("div");
             bubble.appendChild(info);
@@ -44,8 +44,7 @@ function loadStrings() {
  * @throws Will throw an error if the fetch request fails.
  */
 async function getStrings(language) {
-    // const url = "/strings"; // TODO: uncomment when getStrings is implemented.
-    const url = "../data/strings.json"; // TODO: remove when getStrings is implemented.
+    const url = "/string";
     try {
         var response = await fetch(url);
         if (!response.ok) {
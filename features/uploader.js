@@ -0,0 +1,34 @@
+/**
+ * Handles the submit event for the uploader form.
+ *
+ * The image is uploaded first, so the server generates its thumbnails, and the product is then
+ * added with the digest identifying the image.
+ *
+ * @async
+ * @param {Event} event - The event object from the submit event.
+ */
+async function submitUploader(event) {
+    event.preventDefault();
+    const form = event.currentTarget;
+    const fields = form.elements;
+    try {
+        const image = await uploadImage(fields["image"].files[0]);
+        const response = await fetch("/database/product", {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify({
+                "name": fields["name"].value,
+                "color": fields["color"].value,
+                "price": parseFloat(fields["price"].value),
+                "description": fields["description"].value,
+                "image": image["image"]
+            })
+        });
+        if (!response.ok) {
+            throw new Error("HTTP error " + response.status + " while adding product " + fields["name"].value + ".");
+        }
+        form.reset();
+    } catch (error) {
+        console.error("Failed to upload product:", error);
+    }
+}
@@ -1,18 +1,88 @@
 from fastapi import FastAPI, Depends
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import Response, JSONResponse
+from contextlib import asynccontextmanager
 from routes.bbdd_route import bbdd_manager_route
 from routes.index_route import index_route
-import uvicorn
-from utils.database_manager import BBDD_MANAGEMENT
-from utils.rag_manager import RAGManager
+from utils.dependencies import rag_manager, asset_manifest, image_pipeline, initialized, warm_up
+from utils.static_assets import CachedStaticFiles
+from utils.request_context import catalog_queries
+from utils.metrics import RequestDurationMiddleware, timed, render_metrics
+from utils.logging_config import configure_logging
+import asyncio
+import logging
+import time
+import os
 
-app = FastAPI()
+configure_logging()
 
-rag_manager = RAGManager()
+logger = logging.getLogger(__name__)
 
-bbdd_manager = BBDD_MANAGEMENT("retail_web_jewelry.db", rag_manager)
+PROCESS_START = time.perf_counter()
 
-app.mount("/assets", StaticFiles(directory="assets"), name="assets")
+
+async def warm_up_components(app: FastAPI):
+    # Runs in a worker thread, so the views and assets are served while the vectorstore loads
+    start = time.perf_counter()
+    try:
+        await timed("warm_up", asyncio.to_thread(warm_up))
+    except Exception:
+        logger.exception("Error al inicializar los componentes", extra={"stage": "warm_up"})
+        app.state.warm_up_error = True
+        return
+    app.state.ready = True
+    logger.info("Componentes listos en %.2f s", time.perf_counter() - start, extra={"stage": "warm_up"})
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The components are created on first use; unless LAZY_STARTUP is set, they are also created
+    # in the background as soon as the server starts, so that the first chatbot request does not pay it
+    warming = None
+    if os.getenv("LAZY_STARTUP", "false").lower() == "true":
+        app.state.ready = True
+    else:
+        warming = asyncio.create_task(warm_up_components(app))
+    logger.info("Servidor iniciado en %.2f s", time.perf_counter() - PROCESS_START, extra={"stage": "startup"})
+    yield
+    if warming is not None:
+        await warming
+    # Only the components that were used have something to release
+    if initialized(rag_manager):
+        rag_manager().close()
+    if initialized(image_pipeline):
+        image_pipeline().shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
+app.state.ready = False
+app.state.warm_up_error = False
+
+app.add_middleware(RequestDurationMiddleware)
+
+@app.middleware("http")
+async def count_catalog_queries(request, call_next):
+    # Reports in a header how many SQLite catalog queries were needed to serve the request
+    counter = [0]
+    catalog_queries.set(counter)
+    response = await call_next(request)
+    response.headers["X-Catalog-Queries"] = str(counter[0])
+    return response
+
+@app.get("/ready")
+def ready():
+    # Readiness probe: 503 until the database managers and the RAGManager have been created
+    if app.state.ready:
+        return {"status": "ready"}
+    status = "error" if app.state.warm_up_error else "starting"
+    return JSONResponse(status_code=503, content={"status": status})
+
+@app.get("/metrics")
+def metrics():
+    body, content_type = render_metrics()
+    return Response(body, media_type=content_type)
+
+# Assets are served precompressed, and forever cacheable under their fingerprinted URLs
+app.mount("/assets", CachedStaticFiles(directory="assets", manifest=asset_manifest()), name="assets")
 
 
 app.include_router(bbdd_manager_route, prefix="/database")
@@ -1,13 +1,29 @@
-from fastapi import APIRouter, Request, Form, Depends
+from fastapi import APIRouter, Request, Form, Depends, HTTPException, Query, UploadFile, File
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, Response, FileResponse
-from utils.database_manager import BBDD_MANAGEMENT
-from utils.rag_manager import RAGManager
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, Response, FileResponse, StreamingResponse
 from utils.request_classes import *
+from pydantic import ValidationError
+from utils.static_assets import IMMUTABLE
+from utils.dependencies import get_bbdd_manager, get_rag_manager, get_image_pipeline
+from typing import TYPE_CHECKING
+import json
+import orjson
+import os
+import uuid
+
+if TYPE_CHECKING:
+    # Only used in annotations: the managers are imported when the dependency providers create them
+    from utils.database_manager import BBDD_MANAGEMENT
+    from utils.rag_manager import RAGManager
+    from utils.image_pipeline import ImagePipeline
 
 
 bbdd_manager_route = APIRouter()
 
+# Tables whose rows GET /{table_name}/rows lists without authentication
+PUBLIC_TABLES = set(filter(None, os.getenv("PUBLIC_TABLES", "products,collections").split(",")))
+
 templates = Jinja2Templates(directory="templates")
 
 @bbdd_manager_route.get("/read_bbdd", response_class=HTMLResponse)
@@ -15,67 +31,180 @@ async def read_bbdd(request: Request):
     return templates.TemplateResponse("read_bbdd.html", {"request": request})
 
 @bbdd_manager_route.post("/create_table", response_class=HTMLResponse)
-async def create_table(request: Request, table_name: str = Form(...), columns: dict = Form(...), relationships: dict = Form(...), primary_key: str = Form(...), ddbb_manager: BBDD_MANAGEMENT = Depends()):
+async def create_table(request: Request, table_name: str = Form(...), columns: dict = Form(...), relationships: dict = Form(...), primary_key: str = Form(...), ddbb_manager: "BBDD_MANAGEMENT" = Depends(get_bbdd_manager)):
     ddbb_manager.create_table(table_name, columns, relationships, primary_key)
     return templates.TemplateResponse("read_bbdd.html", {"request": request})
 
 @bbdd_manager_route.post("/drop_table", response_class=HTMLResponse)
-async def drop_table(request: Request, table_name: str = Form(...), ddbb_manager: BBDD_MANAGEMENT = Depends()):
+async def drop_table(request: Request, table_name: str = Form(...), ddbb_manager: "BBDD_MANAGEMENT" = Depends(get_bbdd_manager)):
     ddbb_manager.drop_table(table_name)
     return templates.TemplateResponse("read_bbdd.html", {"request": request})
 
 @bbdd_manager_route.post("/drop_data", response_class=HTMLResponse)
-async def drop_data(request: Request, table_name: str = Form(...), filters: dict = Form(...), ddbb_manager: BBDD_MANAGEMENT = Depends()):
+async def drop_data(request: Request, table_name: str = Form(...), filters: dict = Form(...), ddbb_manager: "BBDD_MANAGEMENT" = Depends(get_bbdd_manager)):
     ddbb_manager.drop_data(table_name, filters)
     return templates.TemplateResponse("read_bbdd.html", {"request": request})
 
 @bbdd_manager_route.post("/add_data", response_class=HTMLResponse)
-async def add_data(request: Request, table_name: str = Form(...), data: dict = Form(...), ddbb_manager: BBDD_MANAGEMENT = Depends()):
+async def add_data(request: Request, table_name: str = Form(...), data: dict = Form(...), ddbb_manager: "BBDD_MANAGEMENT" = Depends(get_bbdd_manager)):
     ddbb_manager.add_data(table_name, data)
     return templates.TemplateResponse("read_bbdd.html", {"request": request})
 
 @bbdd_manager_route.post("/modify_data", response_class=HTMLResponse)
-async def modify_data(request: Request, table_name: str = Form(...), filters: dict = Form(...), data: dict = Form(...), ddbb_manager: BBDD_MANAGEMENT = Depends()):
+async def modify_data(request: Request, table_name: str = Form(...), filters: dict = Form(...), data: dict = Form(...), ddbb_manager: "BBDD_MANAGEMENT" = Depends(get_bbdd_manager)):
     ddbb_manager.modify_data(table_name, filters, data)
     return templates.TemplateResponse("read_bbdd.html", {"request": request})
 
+@bbdd_manager_route.post("/create_index", response_class=HTMLResponse)
+async def create_index(request: Request, table_name: str = Form(...), columns: list[str] = Form(...), unique: bool = Form(False), ddbb_manager: "BBDD_MANAGEMENT" = Depends(get_bbdd_manager)):
+    ddbb_manager.create_index(table_name, columns, unique)
+    return templates.TemplateResponse("read_bbdd.html", {"request": request})
+
+@bbdd_manager_route.post("/drop_index", response_class=HTMLResponse)
+async def drop_index(request: Request, table_name: str = Form(...), index_name: str = Form(...), ddbb_manager: "BBDD_MANAGEMENT" = Depends(get_bbdd_manager)):
+    ddbb_manager.drop_index(table_name, index_name)
+    return templates.TemplateResponse("read_bbdd.html", {"request": request})
+
+@bbdd_manager_route.post("/explain", response_class=JSONResponse)
+async def explain(request: ExplainQuery, ddbb_manager: "BBDD_MANAGEMENT" = Depends(get_bbdd_manager)):
+    plan = ddbb_manager.explain(request.table_name, request.filters)
+    return JSONResponse(status_code=200, content={"plan": plan, "indexes": [index["name"] for index in ddbb_manager.get_indexes(request.table_name)]})
+
 @bbdd_manager_route.post("/get_data_filtered", response_class=HTMLResponse)
-async def get_data_filtered(request: Request, table_name: str = Form(...), filters: dict = Form(...), ddbb_manager: BBDD_MANAGEMENT = Depends()):
+async def get_data_filtered(request: Request, table_name: str = Form(...), filters: dict = Form(...), ddbb_manager: "BBDD_MANAGEMENT" = Depends(get_bbdd_manager)):
     data = ddbb_manager.get_data_filtered(table_name, filters)
     return templates.TemplateResponse("read_bbdd.html", {"request": request, "data": data})
 
 @bbdd_manager_route.post("/get_all_data", response_class=HTMLResponse)
-async def get_all_data(request: Request, table_name: str = Form(...), ddbb_manager: BBDD_MANAGEMENT = Depends()):
+async def get_all_data(request: Request, table_name: str = Form(...), ddbb_manager: "BBDD_MANAGEMENT" = Depends(get_bbdd_manager)):
     data = ddbb_manager.get_all_data(table_name)
     return templates.TemplateResponse("read_bbdd.html", {"request": request, "data": data})
 
 @bbdd_manager_route.post("/get_columns", response_class=JSONResponse)
-async def get_columns(request: Request, table_name: str = Form(...), ddbb_manager: BBDD_MANAGEMENT = Depends()):
+async def get_columns(request: Request, table_name: str = Form(...), ddbb_manager: "BBDD_MANAGEMENT" = Depends(get_bbdd_manager)):
     data = ddbb_manager.get_columns(table_name)
     return JSONResponse(status_code=200, content={"data": data})
 
+@bbdd_manager_route.get("/cache_stats", response_class=JSONResponse)
+async def cache_stats(ddbb_manager: "BBDD_MANAGEMENT" = Depends(get_bbdd_manager), rag_manager: "RAGManager" = Depends(get_rag_manager)):
+    return JSONResponse(status_code=200, content={"rows": ddbb_manager.cache_stats(), "rag_filters": rag_manager.filter_cache.stats(), "embeddings": rag_manager.embedding_cache_stats(), "chatbot_threads": rag_manager.checkpointer.stats()})
+
 @bbdd_manager_route.get("/search", response_class=JSONResponse)
-async def search(request: RetriveRequest, rag_manager: RAGManager = Depends()):
-    id_list, texts_list = rag_manager.retrieve_data(request.query)
-    return JSONResponse(status_code=200, content={"ids_lists": id_list, "texts_list": texts_list})
+async def search(request: RetriveRequest, rag_manager: "RAGManager" = Depends(get_rag_manager)):
+    id_list, texts_list = await rag_manager.aretrieve_data(request.query, k=request.page_size, offset=request.page * request.page_size)
+    return JSONResponse(status_code=200, content={"ids_lists": id_list, "texts_list": texts_list, "page": request.page, "page_size": request.page_size})
 
 
 @bbdd_manager_route.get("/product", response_class=JSONResponse)
-async def product(request: GetProduct, ddbb_manager: BBDD_MANAGEMENT = Depends()):
-    data_filtered = ddbb_manager.get_data_filtered("products", {"id": request.id})
-    return JSONResponse(status_code=200, content={"data": data_filtered})
+async def product(request: GetProduct, ddbb_manager: "BBDD_MANAGEMENT" = Depends(get_bbdd_manager)):
+    data_filtered = ddbb_manager.select_rows("products", {"id": request.id})
+    return Response(orjson.dumps({"data": data_filtered}), media_type="application/json")
+
+@bbdd_manager_route.get("/products", response_class=JSONResponse)
+async def products(ids: str = Query(..., description="Comma separated product ids"), ddbb_manager: "BBDD_MANAGEMENT" = Depends(get_bbdd_manager)):
+    try:
+        id_list = [int(product_id) for product_id in ids.split(",") if product_id.strip()]
+    except ValueError:
+        raise HTTPException(status_code=422, detail="ids must be a comma separated list of integers")
+    data = ddbb_manager.get_data_by_ids("products", id_list)
+    return Response(orjson.dumps({"data": data}), media_type="application/json")
 
 @bbdd_manager_route.get("/collection", response_class=JSONResponse)
-async def read_bbdd_manager(request: Collection, ddbb_manager: BBDD_MANAGEMENT = Depends()): 
-    data_filtered = ddbb_manager.get_data_filtered("collections", {"collection": request.id})
-    return JSONResponse(status_code=200, content={"data": data_filtered})
+async def read_bbdd_manager(request: Collection, ddbb_manager: "BBDD_MANAGEMENT" = Depends(get_bbdd_manager)): 
+    data_filtered = ddbb_manager.select_rows("collections", {"collection": request.id})
+    return Response(orjson.dumps({"data": data_filtered}), media_type="application/json")
 
 @bbdd_manager_route.post("/product", response_class=JSONResponse)
-async def product(request: AddProduct, ddbb_manager: BBDD_MANAGEMENT = Depends()):
-    ddbb_manager.add_data("products", {"name": request.name, "color": request.color, "price": request.price, "description": request.description})
+async def product(request: AddProduct, ddbb_manager: "BBDD_MANAGEMENT" = Depends(get_bbdd_manager)):
+    await ddbb_manager.aadd_data("products", {"name": request.name, "color": request.color, "price": request.price, "description": request.description, "image": request.image})
     return JSONResponse(status_code=200, content={"message": f"Product {request.name} added successfully"})
 
+@bbdd_manager_route.post("/products/bulk", response_class=JSONResponse)
+async def products_bulk(request: Request, chunk_size: int = Query(1000, gt=0), ddbb_manager: "BBDD_MANAGEMENT" = Depends(get_bbdd_manager)):
+    # Newline-delimited JSON, one product per line: the body is read as it arrives and each chunk of
+    # products is inserted and embedded in the threadpool, so the import never blocks the event loop
+    total = 0
+    chunk = []
+    async for line_number, line in ndjson_lines(request):
+        try:
+            chunk.append(AddProduct.model_validate_json(line).model_dump())
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail=f"Line {line_number}: {e.errors(include_url=False)}. {total} products were added before it.")
+        if len(chunk) == chunk_size:
+            total += await run_in_threadpool(ddbb_manager.bulk_add_data, "products", chunk, chunk_size)
+            chunk = []
+    if chunk:
+        total += await run_in_threadpool(ddbb_manager.bulk_add_data, "products", chunk, chunk_size)
+    return JSONResponse(status_code=200, content={"message": f"{total} products added successfully", "total": total})
+
+async def ndjson_lines(request: Request):
+    """
+    Yields the number and content of each non-empty line of the request body, as it is received.
+    """
+    buffer = b""
+    line_number = 0
+    async for data in request.stream():
+        buffer += data
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_number += 1
+            if line.strip():
+                yield line_number, line
+    if buffer.strip():
+        yield line_number + 1, buffer
+
+@bbdd_manager_route.post("/image", response_class=JSONResponse)
+async def upload_image(file: UploadFile = File(...), images: "ImagePipeline" = Depends(get_image_pipeline)):
+    # The thumbnails are generated in the worker processes of the pipeline
+    try:
+        image = await images.process(await file.read())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return JSONResponse(status_code=200, content={**image, "url": f"/database/image/{image['image']}"})
+
+@bbdd_manager_route.get("/image/{digest}")
+async def image(request: Request, digest: str, size: int = Query(160, gt=0), images: "ImagePipeline" = Depends(get_image_pipeline)):
+    # Images are content-addressed, so a thumbnail URL always returns the same bytes
+    thumbnail = images.thumbnail(digest, size, webp="image/webp" in request.headers.get("accept", ""))
+    if thumbnail is None:
+        raise HTTPException(status_code=404, detail=f"Image {digest} not found")
+    path, media_type = thumbnail
+    return FileResponse(path, media_type=media_type, headers={"Cache-Control": IMMUTABLE, "Vary": "Accept"})
+
 @bbdd_manager_route.post("/chatbot", response_class=JSONResponse)
-async def chatbot(request: Chatbot, ddbb_manager: RAGManager = Depends()):
-    response = ddbb_manager.chatbot(request.text)
-    return JSONResponse(status_code=200, content={"response": response})
\ No newline at end of file
+async def chatbot(request: Chatbot, ddbb_manager: "RAGManager" = Depends(get_rag_manager)):
+    # A conversation without a thread id gets a new one, which the client sends back to continue it
+    thread = request.thread or str(uuid.uuid4())
+    response = await ddbb_manager.achatbot(request.text, thread)
+    return JSONResponse(status_code=200, content={"response": response, "thread": thread})
+
+@bbdd_manager_route.post("/chatbot/stream")
+async def chatbot_stream(request: Chatbot, ddbb_manager: "RAGManager" = Depends(get_rag_manager)):
+    thread = request.thread or str(uuid.uuid4())
+
+    async def events():
+        yield f"event: thread\ndata: {json.dumps(thread)}\n\n"
+        async for event, data in ddbb_manager.astream_chatbot(request.text, thread):
+            yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        yield "event: done\ndata: {}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@bbdd_manager_route.get("/{table_name}/rows")
+async def table_rows(table_name: str, columns: list[str] = Query(None), limit: int = 100, offset: int = None, after: int = None, ddbb_manager: "BBDD_MANAGEMENT" = Depends(get_bbdd_manager)):
+    if table_name not in PUBLIC_TABLES or table_name not in ddbb_manager.tables:
+        raise HTTPException(status_code=404, detail=f"Table {table_name} not found")
+    # Checked before streaming: once the body has started, an error can only truncate the response
+    unknown_columns = sorted(set(columns or []) - set(ddbb_manager.get_column_names(table_name)))
+    if unknown_columns:
+        raise HTTPException(status_code=400, detail=f"Unknown columns: {', '.join(unknown_columns)}")
+    rows = ddbb_manager.iter_rows(table_name, columns=columns, limit=limit, offset=offset, after=after)
+
+    def body():
+        # Rows are serialized one by one as they are read, without materializing the table
+        yield b"["
+        for index, row in enumerate(rows):
+            yield (b"," if index else b"") + orjson.dumps(row)
+        yield b"]"
+
+    return StreamingResponse(body(), media_type="application/json")
\ No newline at end of file
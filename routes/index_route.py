@@ -1,70 +1,88 @@
-from fastapi import APIRouter, Request, Form, Depends
+from fastapi import APIRouter, Request, Form, Depends, HTTPException
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, Response, FileResponse
-from utils.database_manager import BBDD_MANAGEMENT
-from utils.languages_bbdd_manager import LANGUAJE_BBDD_MANAGEMENT
+from utils.dependencies import get_languaje_bbdd_manager, asset_manifest
+from utils.static_assets import ViewCache
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    # Only used in annotations: the managers are imported when the dependency providers create them
+    from utils.languages_bbdd_manager import LANGUAJE_BBDD_MANAGEMENT
 
 index_route = APIRouter()
 
 templates = Jinja2Templates(directory="views")
+templates.env.globals["asset"] = lambda name: asset_manifest().url(name)
+
+# The views take no dynamic data, so each one is rendered only once
+views = ViewCache(templates)
 
 @index_route.get("/", response_class=HTMLResponse)
 async def read_index(request: Request): 
-    return templates.TemplateResponse("home.html", {"request": request})
+    return views.response(request, "home.html")
 
 @index_route.get("/collections", response_class=HTMLResponse)
 async def read_collections(request: Request): 
-    return templates.TemplateResponse("collections.hmtl", {"request": request})
+    return views.response(request, "collections.html")
 
 @index_route.get("/about", response_class=HTMLResponse)
 async def read_about(request: Request): 
-    return templates.TemplateResponse("about.html", {"request": request})
+    return views.response(request, "about.html")
 
 @index_route.get("/cart", response_class=HTMLResponse)
 async def read_cart(request: Request): 
-    return templates.TemplateResponse("cart.html", {"request": request})
+    return views.response(request, "cart.html")
 
 @index_route.get("/purchase", response_class=HTMLResponse)
 async def read_purchase(request: Request): 
-    return templates.TemplateResponse("purchase.html", {"request": request})
+    return views.response(request, "purchase.html")
 
 @index_route.get("/login", response_class=HTMLResponse)
 async def read_login(request: Request): 
-    return templates.TemplateResponse("login.html", {"request": request})
+    return views.response(request, "login.html")
 
 @index_route.get("/signup", response_class=HTMLResponse)
 async def read_signup(request: Request): 
-    return templates.TemplateResponse("signup.html", {"request": request})
+    return views.response(request, "signup.html")
 
 @index_route.get("/profile", response_class=HTMLResponse)
 async def read_profile(request: Request): 
-    return templates.TemplateResponse("profile.html", {"request": request})
+    return views.response(request, "profile.html")
 
 @index_route.get("/admin", response_class=HTMLResponse)
 async def read_admin(request: Request): 
-    return templates.TemplateResponse("admin.html", {"request": request})
+    return views.response(request, "admin.html")
 
 @index_route.get("/stock", response_class=HTMLResponse)
 async def read_stock(request: Request): 
-    return templates.TemplateResponse("stock.html", {"request": request})
+    return views.response(request, "stock.html")
 
 @index_route.get("/uploader", response_class=HTMLResponse)
 async def read_uploader(request: Request): 
-    return templates.TemplateResponse("uploader.html", {"request": request})
+    return views.response(request, "uploader.html")
 
 @index_route.get("/product", response_class=HTMLResponse)
 async def read_product(request: Request): 
-    return templates.TemplateResponse("product.html", {"request": request})
+    return views.response(request, "product.html")
 
 @index_route.get("/collection", response_class=HTMLResponse)
 async def read_collection(request: Request): 
-    return templates.TemplateResponse("collection.html", {"request": request})
+    return views.response(request, "collection.html")
 
 @index_route.get("/bbdd_manager", response_class=HTMLResponse)
 async def read_bbdd_manager(request: Request): 
-    return templates.TemplateResponse("bbdd_manager.html", {"request": request})
+    return views.response(request, "bbdd_manager.html")
 
 @index_route.get("/string", response_class=JSONResponse)
-async def read_languaje_string(request: Request, languaje_bbdd_manager: LANGUAJE_BBDD_MANAGEMENT = Depends()):
-    strings = languaje_bbdd_manager.get_language_data()
-    return JSONResponse(status_code=200, content={"strings": strings})
\ No newline at end of file
+async def read_languaje_string(request: Request, language: str = None, languaje_bbdd_manager: "LANGUAJE_BBDD_MANAGEMENT" = Depends(get_languaje_bbdd_manager)):
+    # The strings are served from the bundle precompiled at startup
+    bundle = languaje_bbdd_manager.get_bundle(language)
+    if bundle is None:
+        raise HTTPException(status_code=404, detail=f"Language {language} not found")
+    body, gzip_body, etag = bundle
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=3600", "Vary": "Accept-Encoding"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        return Response(gzip_body, media_type="application/json", headers={**headers, "Content-Encoding": "gzip"})
+    return Response(body, media_type="application/json", headers=headers)
\ No newline at end of file
@@ -0,0 +1,35 @@
+from benchmarks.fakes import FakeChatModel, FakeEmbeddings
+from benchmarks.catalog import generate_catalog
+from benchmarks.run import PRODUCT_COLUMNS
+import pytest
+
+
+@pytest.fixture
+def rag_manager(tmp_path, monkeypatch):
+    """
+    RAGManager with fake embeddings and chat model, and its files in a temporary folder.
+    """
+    from utils.rag_manager import RAGManager
+
+    monkeypatch.setenv("VECTORSTORE_PATH", str(tmp_path / "faiss_index"))
+    monkeypatch.setenv("RAG_LEXICAL_INDEX_PATH", str(tmp_path / "lexical.db"))
+    monkeypatch.setenv("CHATBOT_CHECKPOINTER", "memory")
+    monkeypatch.setenv("RAG_RULE_BASED_FILTERS", "true")
+    manager = RAGManager(embedding_function=FakeEmbeddings(dimension=32), ai_client=FakeChatModel())
+    yield manager
+    manager.close()
+
+
+@pytest.fixture
+def bbdd_manager(tmp_path):
+    """
+    BBDD_MANAGEMENT on a temporary database with a products table of 100 generated products.
+    """
+    from utils.database_manager import BBDD_MANAGEMENT
+
+    manager = BBDD_MANAGEMENT(str(tmp_path / "catalog"))
+    manager.create_table("products", PRODUCT_COLUMNS)
+    manager.bulk_add_data("products", generate_catalog(100, 0))
+    yield manager
+    manager.remove_session()
+    manager.engine.dispose()
@@ -0,0 +1,130 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from routes.bbdd_route import bbdd_manager_route
+from utils.dependencies import get_bbdd_manager, get_rag_manager
+import asyncio
+import httpx
+import json
+
+
+class RecordingManager:
+    """
+    Stands in for BBDD_MANAGEMENT, recording the chunks imported.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def bulk_add_data(self, table_name: str, rows, chunk_size: int = 1000, progress=None):
+        self.chunks.append(list(rows))
+        return len(self.chunks[-1])
+
+
+class RowsManager:
+    """
+    Stands in for BBDD_MANAGEMENT, with a products table and an internal users table.
+    """
+
+    tables = ["products", "users"]
+
+    def get_column_names(self, table_name: str):
+        return ["id", "name", "price"]
+
+    def iter_rows(self, table_name: str, columns: list = None, **kwargs):
+        for i in range(3):
+            row = {"id": i, "name": f"Anillo {i}", "price": i}
+            yield {column: row[column] for column in columns or row}
+
+
+class RecordingChatbot:
+    """
+    Stands in for RAGManager, answering with the thread id of each conversation.
+    """
+
+    async def achatbot(self, query: str, thread_number):
+        return f"{thread_number}: {query}"
+
+
+def create_client(manager=None, rag_manager=None):
+    app = FastAPI()
+    app.include_router(bbdd_manager_route, prefix="/database")
+    app.dependency_overrides[get_bbdd_manager] = lambda: manager
+    app.dependency_overrides[get_rag_manager] = lambda: rag_manager
+    return TestClient(app)
+
+
+def product_lines(count: int):
+    for i in range(count):
+        yield json.dumps({"name": f"Anillo {i}", "color": "oro", "price": i, "description": "Anillo de prueba"}).encode() + b"\n"
+
+
+def test_products_bulk_imports_ndjson_in_chunks():
+    manager = RecordingManager()
+    response = create_client(manager).post("/database/products/bulk?chunk_size=100", content=product_lines(250))
+
+    assert response.status_code == 200
+    assert response.json()["total"] == 250
+    assert [len(chunk) for chunk in manager.chunks] == [100, 100, 50]
+    assert manager.chunks[2][-1]["name"] == "Anillo 249"
+
+
+def test_products_bulk_rejects_invalid_line():
+    manager = RecordingManager()
+    body = b"".join(product_lines(3)) + b'{"name": "Anillo"}\n'
+    response = create_client(manager).post("/database/products/bulk?chunk_size=2", content=body)
+
+    assert response.status_code == 422
+    assert response.json()["detail"].startswith("Line 4")
+    assert [len(chunk) for chunk in manager.chunks] == [2]
+
+
+def test_chatbot_starts_a_new_thread_without_thread_id():
+    client = create_client(rag_manager=RecordingChatbot())
+    first = client.post("/database/chatbot", json={"text": "hola"}).json()
+    second = client.post("/database/chatbot", json={"text": "hola"}).json()
+    assert first["thread"] != second["thread"]
+    assert first["response"] == f"{first['thread']}: hola"
+
+    followup = client.post("/database/chatbot", json={"text": "y en plata?", "thread": first["thread"]}).json()
+    assert followup["thread"] == first["thread"]
+
+
+def test_table_rows_streams_the_selected_columns():
+    response = create_client(RowsManager()).get("/database/products/rows", params={"columns": ["id", "name"]})
+    assert response.status_code == 200
+    assert response.json() == [{"id": i, "name": f"Anillo {i}"} for i in range(3)]
+
+
+def test_table_rows_rejects_unknown_columns_before_streaming():
+    response = create_client(RowsManager()).get("/database/products/rows", params={"columns": ["id", "password"]})
+    assert response.status_code == 400
+
+
+def test_table_rows_only_lists_public_tables():
+    assert create_client(RowsManager()).get("/database/users/rows").status_code == 404
+
+
+def test_search_rejects_out_of_range_pages():
+    client = create_client(rag_manager=RecordingChatbot())
+    for page in ({"page": -1}, {"page_size": 0}, {"page_size": 100000}):
+        assert client.request("GET", "/database/search", json={"query": "anillo", **page}).status_code == 422
+
+
+def test_parallel_product_posts_get_distinct_gap_free_ids(bbdd_manager):
+    app = FastAPI()
+    app.include_router(bbdd_manager_route, prefix="/database")
+    app.dependency_overrides[get_bbdd_manager] = lambda: bbdd_manager
+
+    async def post_products():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await asyncio.gather(*(
+                client.post("/database/product", json={"name": f"Anillo {i}", "color": "oro", "price": i, "description": "Anillo de prueba"})
+                for i in range(200)
+            ))
+
+    assert [response.status_code for response in asyncio.run(post_products())] == [200] * 200
+    rows = bbdd_manager.select_rows("products", {"id": {"$gt": 100}})
+    assert sorted(row["id"] for row in rows) == list(range(101, 301))
+    assert sorted(row["name"] for row in rows) == sorted(f"Anillo {i}" for i in range(200))
+    # The concurrent inserts were coalesced by the write queue
+    assert bbdd_manager.write_queue.batches < 200
@@ -0,0 +1,55 @@
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.graph import START, MessagesState, StateGraph
+from utils.checkpointer import EvictingMemorySaver
+from utils.sqlite_checkpointer import EvictingSqliteSaver
+import asyncio
+import pytest
+
+
+def echo(state: MessagesState):
+    return {"messages": [AIMessage(content=f"{len(state['messages'])}: {state['messages'][-1].content}")]}
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def checkpointer(request, tmp_path):
+    if request.param == "sqlite":
+        checkpointer = EvictingSqliteSaver.from_path(str(tmp_path / "checkpoints.db"), max_threads=2, eviction_interval=0)
+        yield checkpointer
+        checkpointer.conn.close()
+    else:
+        yield EvictingMemorySaver(max_threads=2)
+
+
+def create_app(checkpointer):
+    workflow = StateGraph(state_schema=MessagesState)
+    workflow.add_node("model", echo)
+    workflow.add_edge(START, "model")
+    return workflow.compile(checkpointer=checkpointer)
+
+
+def ask(app, text: str, thread_id: str):
+    config = {"configurable": {"thread_id": thread_id}}
+    return asyncio.run(app.ainvoke({"messages": [HumanMessage(content=text)]}, config=config))["messages"][-1].content
+
+
+def test_threads_keep_their_history_and_are_evicted(checkpointer):
+    app = create_app(checkpointer)
+    assert ask(app, "hola", "a") == "1: hola"
+    assert ask(app, "adios", "a") == "3: adios"
+    assert ask(app, "hola", "b") == "1: hola"
+
+    # Beyond max_threads the least recently used thread is evicted, and starts over
+    ask(app, "hola", "c")
+    ask(app, "hola", "d")
+    assert ask(app, "otra vez", "a") == "1: otra vez"
+    assert checkpointer.evicted >= 1
+
+
+def test_stats_only_report_aggregates(checkpointer):
+    app = create_app(checkpointer)
+    ask(app, "hola", "secret-thread")
+    stats = checkpointer.stats()
+
+    assert stats["threads"] == 1
+    assert stats["bytes"] > 0
+    assert "secret-thread" not in repr(stats)
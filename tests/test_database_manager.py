@@ -0,0 +1,56 @@
+from sqlalchemy.exc import IntegrityError
+import asyncio
+
+
+def test_not_equal_filter(bbdd_manager):
+    rows = bbdd_manager.select_rows("products", {"color": {"$neq": "oro"}})
+    assert rows
+    assert all(row["color"] != "oro" for row in rows)
+    assert len(rows) + len(bbdd_manager.select_rows("products", {"color": "oro"})) == 100
+
+
+def test_drop_index_only_drops_reflected_indexes(bbdd_manager):
+    index_name = bbdd_manager.create_index("products", ["price"], index_name='ix "price"')
+    bbdd_manager.create_index("products", ["color"])
+
+    bbdd_manager.drop_index("products", 'ix_products_color"; DROP TABLE products; --')
+    assert "products" in bbdd_manager.tables
+
+    bbdd_manager.drop_index("products", index_name)
+    assert [index["name"] for index in bbdd_manager.get_indexes("products")] == ["ix_products_color"]
+
+
+def test_read_during_a_write_does_not_cache_the_old_row(bbdd_manager, monkeypatch):
+    assert bbdd_manager.select_rows("products", {"id": 1})[0]["price"] != 12345
+    session = bbdd_manager.session
+    commit = session.commit
+
+    def read_then_commit():
+        # A concurrent read lands between the update and its commit, and caches the old row
+        bbdd_manager.select_rows("products", {"id": 1})
+        commit()
+    monkeypatch.setattr(session, "commit", read_then_commit)
+
+    bbdd_manager.modify_data("products", {"id": 1}, {"price": 12345})
+    assert bbdd_manager.select_rows("products", {"id": 1})[0]["price"] == 12345
+
+    bbdd_manager.drop_data("products", {"id": 1})
+    assert bbdd_manager.select_rows("products", {"id": 1}) == []
+
+
+def test_failing_insert_does_not_fail_the_inserts_batched_with_it(bbdd_manager):
+    bbdd_manager.create_index("products", ["name"], unique=True)
+    duplicate = {"name": "Tobillera ola 0", "color": "oro", "price": 1, "description": "Duplicada", "image": None}
+    valid = {"name": "Anillo nuevo", "color": "plata", "price": 2, "description": "Nuevo", "image": None}
+
+    async def add_both():
+        return await asyncio.gather(
+            bbdd_manager.aadd_data("products", duplicate), bbdd_manager.aadd_data("products", valid), return_exceptions=True
+        )
+
+    results = asyncio.run(add_both())
+    assert isinstance(results[0], IntegrityError)
+    assert results[1] is None
+    assert [row["id"] for row in bbdd_manager.select_rows("products", {"name": "Anillo nuevo"})] == [101]
+    # Both were written by the same batch of the write queue
+    assert bbdd_manager.write_queue.batches == 1
@@ -0,0 +1,24 @@
+import time
+from utils.embeddings import CachedEmbeddings, HashingEmbeddings
+
+
+def test_query_cache_is_bounded(tmp_path):
+    embeddings = CachedEmbeddings(HashingEmbeddings(32), str(tmp_path / "embeddings.db"), "local", max_queries=3, query_ttl=60)
+    embeddings.embed_documents([f"product {i}" for i in range(5)])
+    for i in range(5):
+        embeddings.embed_query(f"query {i}")
+    embeddings.embed_query("query 2")
+    embeddings.embed_query("query 5")
+
+    stats = embeddings.stats()
+    assert stats["queries"] == 3
+    assert stats["size"] == 8
+    # The least recently used queries were evicted, the recently read one was kept
+    assert set(embeddings.get_many("query", [embeddings.key("query", f"query {i}") for i in (2, 4, 5)])) == {
+        embeddings.key("query", f"query {i}") for i in (2, 4, 5)
+    }
+
+    embeddings.query_ttl = 0
+    time.sleep(0.01)
+    assert embeddings.get_many("query", [embeddings.key("query", "query 5")]) == {}
+    assert len(embeddings.get_many("document", [embeddings.key("document", "product 0")])) == 1
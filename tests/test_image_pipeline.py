@@ -0,0 +1,46 @@
+from concurrent.futures import ThreadPoolExecutor
+from utils.image_pipeline import ImagePipeline, build_derivatives
+from PIL import Image
+import asyncio
+import json
+import io
+import os
+import pytest
+
+
+def image_bytes(size=(300, 200), format="PNG"):
+    data = io.BytesIO()
+    Image.new("RGB", size, "red").save(data, format)
+    return data.getvalue()
+
+
+def test_decompression_bomb_is_an_invalid_image(tmp_path, monkeypatch):
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 1000)
+    with pytest.raises(ValueError, match="Invalid image"):
+        build_derivatives(image_bytes(), str(tmp_path / "bomb"), (64,))
+
+
+def test_truncated_image_is_an_invalid_image(tmp_path):
+    with pytest.raises(ValueError, match="Invalid image"):
+        build_derivatives(image_bytes(format="JPEG")[:200], str(tmp_path / "truncated"), (64,))
+
+
+def test_same_image_processed_concurrently(tmp_path):
+    folder = str(tmp_path / "image")
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        manifests = list(executor.map(lambda _: build_derivatives(image_bytes(), folder, (64, 160)), range(8)))
+
+    assert all(manifest == manifests[0] for manifest in manifests)
+    assert sorted(os.listdir(folder)) == ["160.jpeg", "160.webp", "64.jpeg", "64.webp", "manifest.json"]
+    with open(os.path.join(folder, "manifest.json")) as file:
+        assert json.load(file) == manifests[0]
+
+
+def test_pipeline_workers_are_not_forked(tmp_path):
+    pipeline = ImagePipeline(str(tmp_path), sizes=(64,), max_workers=1)
+    try:
+        result = asyncio.run(pipeline.process(image_bytes()))
+        assert pipeline.get_executor()._mp_context.get_start_method() in ("forkserver", "spawn")
+    finally:
+        pipeline.shutdown()
+    assert result["sizes"]
@@ -0,0 +1,38 @@
+from utils.languages_bbdd_manager import LANGUAJE_BBDD_MANAGEMENT
+import shutil
+import json
+import os
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def strings_manager(tmp_path):
+    shutil.copy(os.path.join(ROOT, "data", "strings.db"), tmp_path / "strings.db")
+    manager = LANGUAJE_BBDD_MANAGEMENT(str(tmp_path / "strings"), table_name="strings")
+    yield manager
+    manager.engine.dispose()
+
+
+def load_json_strings():
+    with open(os.path.join(ROOT, "data", "strings.json"), encoding="utf-8") as file:
+        return json.load(file)
+
+
+def test_strings_table_has_every_key_of_the_json(strings_manager):
+    assert strings_manager.missing_keys(load_json_strings()) == {}
+
+
+def test_bundle_has_the_language_names_read_by_the_client(strings_manager):
+    # features/language.js builds the language menu from the "language" key of each language
+    body, _, _ = strings_manager.get_bundle()
+    bundle = json.loads(body)
+    assert {language: strings["language"] for language, strings in bundle.items()} == {"en": "english", "es": "español"}
+
+
+def test_import_strings_only_inserts_new_keys(strings_manager):
+    added = strings_manager.import_strings({"en": {"home": "changed", "gift": "gift"}, "es": {"gift": "regalo"}})
+    assert added == ["gift"]
+    assert strings_manager.strings["es"]["gift"] == "regalo"
+    assert strings_manager.strings["en"]["home"] == "home"
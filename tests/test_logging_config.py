@@ -0,0 +1,13 @@
+import json
+import logging
+from utils.logging_config import JSONFormatter
+
+
+def test_extra_fields_are_json_keys(bbdd_manager, caplog):
+    with caplog.at_level(logging.INFO, logger="utils.database_manager"):
+        bbdd_manager.drop_index("products", "missing_index")
+
+    entry = json.loads(JSONFormatter().format(caplog.records[-1]))
+    assert entry["message"] == "El índice missing_index no existe en la tabla products."
+    assert entry["table"] == "products"
+    assert entry["index"] == "missing_index"
@@ -0,0 +1,26 @@
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from utils.metrics import RequestDurationMiddleware
+import asyncio
+
+
+def test_streamed_request_is_measured_until_its_last_chunk():
+    app = FastAPI()
+    app.add_middleware(RequestDurationMiddleware)
+
+    @app.get("/slow_stream/{name}")
+    async def slow_stream(name: str):
+        async def events():
+            for _ in range(3):
+                await asyncio.sleep(0.1)
+                yield b"data\n"
+        return StreamingResponse(events())
+
+    labels = {"method": "GET", "route": "/slow_stream/{name}", "status": "200"}
+    before = REGISTRY.get_sample_value("http_request_duration_seconds_sum", labels) or 0.0
+    assert TestClient(app).get("/slow_stream/a").content == b"data\n" * 3
+
+    assert REGISTRY.get_sample_value("http_request_duration_seconds_count", labels) == 1
+    assert REGISTRY.get_sample_value("http_request_duration_seconds_sum", labels) - before >= 0.3
@@ -0,0 +1,107 @@
+from benchmarks.catalog import generate_catalog
+from langchain_core.messages import HumanMessage
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import pytest
+
+
+def add_products(rag_manager, count: int):
+    rag_manager.add_data_bulk([{**product, "id": number} for number, product in enumerate(generate_catalog(count, 0), start=1)])
+
+
+def test_concurrent_adds_and_searches(rag_manager):
+    products = [{**product, "id": number} for number, product in enumerate(generate_catalog(4000, 0), start=1)]
+    embedding = rag_manager.embedding_function.embed_query("anillo de oro")
+
+    def add(product):
+        rag_manager.add_data(product)
+        rag_manager.search_by_vector(embedding, 5, {"color": product["color"]})
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        list(executor.map(add, products))
+
+    assert rag_manager.vectorstore.index.ntotal == 4000
+    assert rag_manager.lexical_index.count() == 4000
+    assert {document.metadata["id"] for _, document in rag_manager.documents()} == set(range(1, 4001))
+
+
+def test_stream_chatbot_yields_only_the_answer_on_every_turn(rag_manager):
+    add_products(rag_manager, 50)
+    queries = ["anillo de oro", "collar de plata", "pulsera negra"]
+
+    async def conversation():
+        # The third turn on the thread summarizes the previous ones before answering
+        return [[event async for event in rag_manager.astream_chatbot(query, "thread-1")] for query in queries]
+
+    for query, events in zip(queries, asyncio.run(conversation())):
+        ids, texts = rag_manager.retrieve_data(query)
+        prompt = HumanMessage(content=rag_manager.chatbot_prompt(query, ids, texts))
+        answer = "".join(data for event, data in events if event == "token")
+
+        assert answer == rag_manager.ai_client.answer([prompt])
+        assert [data for event, data in events if event == "product"] == [str(product_id) for product_id in ids]
+        assert not [data for event, data in events if event == "collection"]
+
+
+def test_not_equal_filter_matches_in_sql_and_faiss(rag_manager):
+    add_products(rag_manager, 200)
+    embedding = rag_manager.embedding_function.embed_query("anillo")
+    filters = {"color": {"$neq": "oro"}, "price": {"$lte": 100}}
+
+    prefiltered = rag_manager.hybrid_search("anillo", embedding, 20, filters)
+    rag_manager.prefilter_limit = 0
+    faiss_filtered = rag_manager.hybrid_search("anillo", embedding, 20, filters)
+
+    assert prefiltered
+    for documents in (prefiltered, faiss_filtered):
+        assert all(doc.metadata["color"] != "oro" and doc.metadata["price"] <= 100 for doc in documents)
+    assert {doc.metadata["id"] for doc in prefiltered} == {doc.metadata["id"] for doc in faiss_filtered}
+
+
+def test_drop_data_looks_the_product_up_without_scanning_the_docstore(rag_manager, monkeypatch):
+    add_products(rag_manager, 200)
+    color = rag_manager.vectorstore.docstore.search(rag_manager.vectorstore.index_to_docstore_id[0]).metadata["color"]
+
+    search = rag_manager.vectorstore.docstore.search
+    searched = []
+    monkeypatch.setattr(rag_manager.vectorstore.docstore, "search", lambda docstore_id: searched.append(docstore_id) or search(docstore_id))
+    assert rag_manager.drop_data({"id": 7}) == 1
+    assert rag_manager.drop_data({"color": color, "id": 1}) == 1
+    # Only the documents removed are read from the docstore
+    assert len(searched) == 2
+
+    # Not indexed: compared with the metadata of every document
+    assert rag_manager.drop_data({"name": "anillo"}) == 0
+    assert rag_manager.vectorstore.index.ntotal == rag_manager.lexical_index.count() == 198
+    assert 7 not in {document.metadata["id"] for _, document in rag_manager.documents()}
+
+
+def test_sync_and_async_chatbot_keep_the_same_history(rag_manager):
+    add_products(rag_manager, 50)
+    queries = ["anillo de oro", "collar de plata", "pulsera negra"]
+
+    answers = [rag_manager.chatbot(query, "sync") for query in queries]
+
+    async def conversation():
+        return [await rag_manager.achatbot(query, "async") for query in queries]
+
+    assert asyncio.run(conversation()) == answers
+    # The third turn summarized the history: summary, user input and answer are left
+    histories = [
+        rag_manager.app.get_state({"configurable": {"thread_id": thread}}).values["messages"] for thread in ("sync", "async")
+    ]
+    assert [len(messages) for messages in histories] == [3, 3]
+    assert [message.content for message in histories[0]] == [message.content for message in histories[1]]
+
+
+def test_pages_never_search_beyond_the_max_results(rag_manager, monkeypatch):
+    add_products(rag_manager, 100)
+    rag_manager.max_results = 30
+    searches = []
+    search = rag_manager.search
+    monkeypatch.setattr(rag_manager, "search", lambda query, embedding, k, filters=None: searches.append(k) or search(query, embedding, k, filters))
+
+    assert len(rag_manager.retrieve_data("anillo", k=10, offset=25)[0]) <= 5
+    assert rag_manager.retrieve_data("anillo", k=10, offset=30) == ([], [])
+    assert asyncio.run(rag_manager.aretrieve_data("anillo", k=10, offset=10000)) == ([], [])
+    assert searches == [30]
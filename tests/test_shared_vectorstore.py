@@ -0,0 +1,75 @@
+from benchmarks.fakes import FakeChatModel, FakeEmbeddings
+from benchmarks.catalog import generate_catalog
+from langchain_community.vectorstores import FAISS
+import pytest
+
+
+def add_products(rag_manager, count: int):
+    rag_manager.add_data_bulk([{**product, "id": number} for number, product in enumerate(generate_catalog(count, 0), start=1)])
+
+
+@pytest.fixture
+def shared_rag_manager(tmp_path, monkeypatch):
+    """
+    RAGManager in the shared mode, which only publishes the mutations when forced.
+    """
+    from utils.rag_manager import RAGManager
+
+    monkeypatch.setenv("VECTORSTORE_MODE", "shared")
+    monkeypatch.setenv("VECTORSTORE_PATH", str(tmp_path / "faiss_index"))
+    monkeypatch.setenv("RAG_LEXICAL_INDEX_PATH", str(tmp_path / "lexical.db"))
+    monkeypatch.setenv("VECTORSTORE_REFRESH_INTERVAL", "3600")
+    monkeypatch.setenv("VECTORSTORE_PUBLISH_INTERVAL", "3600")
+    monkeypatch.setenv("CHATBOT_CHECKPOINTER", "memory")
+    manager = RAGManager(embedding_function=FakeEmbeddings(dimension=32), ai_client=FakeChatModel())
+    yield manager
+    manager.close()
+
+
+def test_writer_publishes_the_mutations_together(shared_rag_manager):
+    shared = shared_rag_manager.shared
+    generation = shared.generation
+    add_products(shared_rag_manager, 10)
+    add_products(shared_rag_manager, 10)
+
+    assert shared.writer.apply() == 2
+    shared.refresh()
+    assert shared.generation == generation
+
+    shared.writer.apply(publish=True)
+    shared.refresh()
+    assert shared.generation != generation
+    assert shared_rag_manager.vectorstore.index.ntotal == 20
+
+
+def test_filtered_search_reads_the_documents_in_batches(shared_rag_manager):
+    shared = shared_rag_manager.shared
+    add_products(shared_rag_manager, 1200)
+    shared.writer.apply(publish=True)
+    shared.refresh()
+
+    vectorstore = shared_rag_manager.vectorstore
+    queries = []
+    vectorstore.docstore.connection.set_trace_callback(queries.append)
+    embedding = shared_rag_manager.embedding_function.embed_query("anillo de oro")
+    result = vectorstore.similarity_search_with_score_by_vector(
+        embedding, k=5, filter=lambda metadata: metadata["id"] % 7 == 0, fetch_k=1200
+    )
+
+    # The same search, position by position, on the in-memory vectorstore of the writer
+    expected = FAISS.similarity_search_with_score_by_vector(
+        shared.writer.vectorstore, embedding, k=5, filter=lambda metadata: metadata["id"] % 7 == 0, fetch_k=1200
+    )
+    assert [doc.metadata["id"] for doc, score in result] == [doc.metadata["id"] for doc, score in expected]
+    assert len(queries) == 3
+
+
+def test_writer_drops_the_product_by_id(shared_rag_manager):
+    shared = shared_rag_manager.shared
+    add_products(shared_rag_manager, 50)
+    shared_rag_manager.drop_data({"id": 7})
+    shared.writer.apply(publish=True)
+    shared.refresh()
+
+    assert shared_rag_manager.vectorstore.index.ntotal == shared_rag_manager.lexical_index.count() == 49
+    assert shared_rag_manager.lexical_index.candidates({"id": 7}) == []
@@ -0,0 +1,10 @@
+from starlette.datastructures import Headers
+from utils.static_assets import negotiate, precompress
+
+
+def test_precompress_prefers_brotli():
+    encoded = precompress(b"body { color: red; }\n" * 100)
+    assert list(encoded) == ["br", "gzip"]
+    assert negotiate(Headers({"accept-encoding": "gzip, deflate, br"}), encoded) == "br"
+    assert negotiate(Headers({"accept-encoding": "gzip"}), encoded) == "gzip"
+    assert negotiate(Headers({}), encoded) is None
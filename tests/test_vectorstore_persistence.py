@@ -0,0 +1,116 @@
+from benchmarks.fakes import FakeEmbeddings
+from utils.vectorstore_persistence import VectorstorePersistence
+import subprocess
+import json
+import signal
+import sys
+import os
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Adds documents without end and removes every fifth one a bit later, printing each acknowledged operation
+WRITER = """
+import sys
+from benchmarks.fakes import FakeEmbeddings
+from utils.vectorstore_persistence import VectorstorePersistence
+from tests.test_vectorstore_persistence import operation
+
+embeddings = FakeEmbeddings(dimension=16)
+persistence = VectorstorePersistence(sys.argv[1], embeddings, flush_interval=0.05, flush_size=7)
+vectorstore = persistence.load()
+persistence.start(vectorstore)
+i = 0
+while True:
+    op, docstore_id = operation(i)
+    if op == "add":
+        entry = {"op": "add", "ids": [docstore_id], "texts": [docstore_id], "embeddings": [embeddings.embed_query(docstore_id)], "metadatas": [{"id": i}]}
+    else:
+        entry = {"op": "remove", "ids": [docstore_id]}
+    persistence.apply(vectorstore, entry)
+    print(i, flush=True)
+    i += 1
+"""
+
+
+def operation(i: int):
+    """
+    Returns:
+        tuple: Operation number i of the writer and the docstore id it adds or removes.
+    """
+    if i % 5 == 4:
+        return "remove", f"doc-{i - 3}"
+    return "add", f"doc-{i}"
+
+
+def expected_ids(count: int):
+    """
+    Returns:
+        set: Docstore ids in the vectorstore after the first `count` operations of the writer.
+    """
+    ids = set()
+    for i in range(count):
+        op, docstore_id = operation(i)
+        if op == "add":
+            ids.add(docstore_id)
+        else:
+            ids.discard(docstore_id)
+    return ids
+
+
+@pytest.mark.parametrize("kill_after", [1, 40, 300])
+def test_recovers_acknowledged_mutations_after_kill(tmp_path, kill_after):
+    folder_path = str(tmp_path / "faiss_index")
+    process = subprocess.Popen(
+        [sys.executable, "-c", WRITER, folder_path], cwd=ROOT, stdout=subprocess.PIPE, text=True
+    )
+    try:
+        for _ in range(kill_after):
+            assert process.stdout.readline(), "el proceso ha terminado antes de tiempo"
+    finally:
+        process.send_signal(signal.SIGKILL)
+        process.wait()
+    # Operations acknowledged before the kill, including those still unread in the pipe
+    acknowledged = kill_after + sum(1 for line in process.stdout if line.strip())
+
+    persistence = VectorstorePersistence(folder_path, FakeEmbeddings(dimension=16))
+    ids = set(persistence.load().index_to_docstore_id.values())
+    # The operation in flight when the process was killed may or may not have reached the log
+    assert ids in (expected_ids(acknowledged), expected_ids(acknowledged + 1))
+
+def test_snapshot_keeps_mutations_logged_meanwhile(tmp_path):
+    folder_path = str(tmp_path / "faiss_index")
+    embeddings = FakeEmbeddings(dimension=16)
+    persistence = VectorstorePersistence(folder_path, embeddings, flush_interval=3600, flush_size=10 ** 6)
+    vectorstore = persistence.load()
+    for i in range(20):
+        persistence.apply(vectorstore, {"op": "add", "ids": [f"doc-{i}"], "texts": ["x"], "embeddings": [embeddings.embed_query(str(i))], "metadatas": [{}]})
+    persistence.snapshot(vectorstore)
+    persistence.apply(vectorstore, {"op": "remove", "ids": ["doc-0"]})
+
+    reloaded = VectorstorePersistence(folder_path, embeddings)
+    assert set(reloaded.load().index_to_docstore_id.values()) == {f"doc-{i}" for i in range(1, 20)}
+    assert reloaded.pending == 1
+
+
+def test_snapshot_drops_the_covered_log_without_reading_it(tmp_path, monkeypatch):
+    folder_path = str(tmp_path / "faiss_index")
+    embeddings = FakeEmbeddings(dimension=16)
+    persistence = VectorstorePersistence(folder_path, embeddings, flush_interval=3600, flush_size=10 ** 6)
+    vectorstore = persistence.load()
+    persistence.apply(vectorstore, {"op": "add", "ids": ["doc-0", "doc-1"], "texts": ["x", "y"], "embeddings": embeddings.embed_documents(["x", "y"]), "metadatas": [{}, {}]})
+    with open(persistence.wal_file) as file:
+        # Binary float32 embeddings, in base64
+        assert isinstance(json.loads(file.readline())["embeddings"], str)
+
+    monkeypatch.setattr(persistence, "_read_wal", lambda path: pytest.fail("log read by the snapshot"))
+    persistence.snapshot(vectorstore)
+    persistence.apply(vectorstore, {"op": "remove", "ids": ["doc-0"]})
+    monkeypatch.undo()
+    assert [name for name in os.listdir(folder_path) if name.startswith("wal")] == [os.path.basename(persistence.wal_file)]
+
+    reloaded = VectorstorePersistence(folder_path, embeddings)
+    vectorstore = reloaded.load()
+    assert set(vectorstore.index_to_docstore_id.values()) == {"doc-1"}
+    assert reloaded.pending == 1
+    assert vectorstore.index.reconstruct(0).tolist() == pytest.approx(embeddings.embed_query("y"))
@@ -0,0 +1,70 @@
+from collections import OrderedDict
+import threading
+import time
+
+
+class TTLCache:
+    """
+    Thread-safe, size-bounded LRU cache whose entries expire after a time to live.
+
+    Keeps hit/miss counters so the effectiveness of the cache can be reported.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = None):
+        """
+        Args:
+            maxsize (int): Maximum number of entries; the least recently used entry is evicted beyond it.
+            ttl (float, optional): Seconds an entry is valid for. Entries never expire if None.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            item = self.data.get(key)
+            if item is not None:
+                value, expires = item
+                if expires is None or expires > time.monotonic():
+                    self.data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        with self.lock:
+            expires = time.monotonic() + self.ttl if self.ttl is not None else None
+            self.data[key] = (value, expires)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def pop(self, key):
+        with self.lock:
+            item = self.data.pop(key, None)
+            return item[0] if item is not None else None
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def stats(self):
+        """
+        Returns:
+            dict: Size, bounds and hit/miss counters of the cache.
+        """
+        with self.lock:
+            requests = self.hits + self.misses
+            return {
+                "size": len(self.data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / requests if requests else 0.0,
+            }
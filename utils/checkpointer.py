@@ -0,0 +1,122 @@
+from langgraph.checkpoint.memory import MemorySaver
+from collections import OrderedDict
+import threading
+import time
+import os
+
+
+def payload_size(value):
+    """
+    Approximates the memory used by a stored checkpoint as the size of its serialized payloads.
+    """
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(payload_size(item) for item in value.values())
+    if isinstance(value, (tuple, list)):
+        return sum(payload_size(item) for item in value)
+    return 0
+
+
+class EvictingMemorySaver(MemorySaver):
+    """
+    In-memory LangGraph checkpointer that evicts idle conversation threads.
+
+    Threads are kept in least recently used order; a thread is evicted when it has not been read or
+    written for `ttl` seconds, or when more than `max_threads` threads are stored.
+    """
+
+    def __init__(self, max_threads: int = 1000, ttl: float = 3600, **kwargs):
+        """
+        Args:
+            max_threads (int): Maximum number of threads kept in memory.
+            ttl (float): Seconds of inactivity after which a thread is evicted.
+        """
+        super().__init__(**kwargs)
+        self.max_threads = max_threads
+        self.ttl = ttl
+        self.last_access = OrderedDict()
+        self.access_lock = threading.Lock()
+        self.evicted = 0
+
+    def get_tuple(self, config):
+        self.touch(config["configurable"]["thread_id"])
+        return super().get_tuple(config)
+
+    def put(self, config, *args, **kwargs):
+        self.touch(config["configurable"]["thread_id"])
+        return super().put(config, *args, **kwargs)
+
+    def put_writes(self, config, *args, **kwargs):
+        self.touch(config["configurable"]["thread_id"])
+        return super().put_writes(config, *args, **kwargs)
+
+    def touch(self, thread_id: str):
+        """
+        Marks a thread as used now and evicts the idle threads.
+        """
+        with self.access_lock:
+            now = time.monotonic()
+            self.last_access[thread_id] = now
+            self.last_access.move_to_end(thread_id)
+
+            while self.last_access:
+                oldest, last_access = next(iter(self.last_access.items()))
+                if len(self.last_access) <= self.max_threads and now - last_access < self.ttl:
+                    break
+                self.last_access.popitem(last=False)
+                self.evict(oldest)
+
+    def evict(self, thread_id: str):
+        self.storage.pop(thread_id, None)
+        for key in [key for key in self.writes if key[0] == thread_id]:
+            self.writes.pop(key, None)
+        self.evicted += 1
+
+    def thread_usage(self):
+        """
+        Returns:
+            dict: Approximate bytes used by each active thread.
+        """
+        usage = {thread_id: payload_size(checkpoints) for thread_id, checkpoints in list(self.storage.items())}
+        for key, writes in list(self.writes.items()):
+            if key[0] in usage:
+                usage[key[0]] += payload_size(writes)
+        return usage
+
+    def stats(self):
+        """
+        Returns:
+            dict: Aggregate counts of the stored threads, which never include the thread ids.
+        """
+        usage = self.thread_usage()
+        return {
+            "backend": "memory",
+            "threads": len(usage),
+            "max_threads": self.max_threads,
+            "ttl": self.ttl,
+            "evicted": self.evicted,
+            "bytes": sum(usage.values()),
+        }
+
+
+def create_checkpointer():
+    """
+    Creates the checkpointer for the chatbot conversations configured by the environment.
+
+    CHATBOT_CHECKPOINTER selects "memory" (default) or "sqlite". Both evict threads idle for
+    CHATBOT_THREAD_TTL seconds and keep at most CHATBOT_MAX_THREADS threads. The SQLite backend
+    stores the threads in CHATBOT_CHECKPOINT_DB so they are shared by every uvicorn worker.
+    """
+    backend = os.getenv("CHATBOT_CHECKPOINTER", "memory").lower()
+    max_threads = int(os.getenv("CHATBOT_MAX_THREADS", 1000))
+    ttl = float(os.getenv("CHATBOT_THREAD_TTL", 3600))
+
+    if backend == "sqlite":
+        # langgraph-checkpoint-sqlite is only needed for this backend
+        from utils.sqlite_checkpointer import EvictingSqliteSaver
+        return EvictingSqliteSaver.from_path(
+            os.getenv("CHATBOT_CHECKPOINT_DB", "./data/checkpoints.db"), max_threads=max_threads, ttl=ttl
+        )
+
+    return EvictingMemorySaver(max_threads=max_threads, ttl=ttl)
@@ -1,25 +1,111 @@
-from sqlalchemy import create_engine, Column, Integer, String, inspect, DateTime, text, ForeignKey
+from sqlalchemy import create_engine, Column, Integer, String, inspect, DateTime, text, ForeignKey, event, select, Index
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.orm import sessionmaker, scoped_session, relationship
+from datetime import datetime
+from itertools import islice
+import time
+import re
+import asyncio
 import pandas as pd
+from utils.write_queue import WriteQueue
+from utils.cache import TTLCache
+from utils.metrics import span, observe
+from utils.request_context import session_scope, catalog_queries
+import logging
+
+logger = logging.getLogger(__name__)
+
+CATALOG_QUERY_PATTERN = re.compile(r"sqlite_master|sqlite_temp_master|PRAGMA", re.IGNORECASE)
+
+# Operators accepted in the filters, with the same names as the vectorstore metadata filters
+# (LangChain FAISS spells "not equal" as $neq)
+FILTER_OPERATORS = {
+    "$eq": lambda column, value: column == value,
+    "$neq": lambda column, value: column != value,
+    "$gt": lambda column, value: column > value,
+    "$gte": lambda column, value: column >= value,
+    "$lt": lambda column, value: column < value,
+    "$lte": lambda column, value: column <= value,
+    "$in": lambda column, value: column.in_(value),
+    "$nin": lambda column, value: column.not_in(value),
+}
+
 
 class BBDD_MANAGEMENT():
-    def __init__(self, database_path, rag_manager = None):
-        self.engine = create_engine(f"sqlite:///{database_path}.db")
+    def __init__(self, database_path, rag_manager = None, pool_size: int = 5, max_overflow: int = 10, cache_size: int = 10000, cache_ttl: float = 300):
+        self.engine = create_engine(
+            f"sqlite:///{database_path}.db",
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_pre_ping=True,
+            connect_args={"check_same_thread": False}
+        )
         with self.engine.connect() as conn:
             pass
         self.Base = declarative_base()
-        self.Session = sessionmaker(bind=self.engine)
-        self.session = self.Session()
-        self.tables = inspect(self.engine).get_table_names()
+        # One session per request (or per thread outside of requests), see remove_session
+        self.Session = scoped_session(sessionmaker(bind=self.engine), scopefunc=session_scope)
+        self.catalog_query_count = 0
+        self.write_queue = WriteQueue(self.engine)
+        # Read-through cache of rows keyed by (table, primary key), invalidated by the writes
+        self.row_cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        event.listen(self.engine, "before_cursor_execute", self._count_catalog_query)
+        event.listen(self.engine, "before_cursor_execute", self._start_query)
+        event.listen(self.engine, "after_cursor_execute", self._end_query)
+        self._reflect_schema()
         self.models = self._generate_models()
         self.rag_manager = rag_manager
+
+    @property
+    def session(self):
+        return self.Session()
+
+    def remove_session(self):
+        """
+        Closes the session of the current request and returns its connection to the pool.
+        """
+        self.Session.remove()
+
+    def _count_catalog_query(self, conn, cursor, statement, parameters, context, executemany):
+        if CATALOG_QUERY_PATTERN.search(statement):
+            self.catalog_query_count += 1
+            counter = catalog_queries.get()
+            if counter is not None:
+                counter[0] += 1
+
+    def _start_query(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    def _end_query(self, conn, cursor, statement, parameters, context, executemany):
+        observe("sql_query", time.perf_counter() - conn.info["query_start"].pop())
+
+    def _reflect_schema(self):
+        """
+        Reflects the tables, columns and primary keys of the database into the schema cache.
+
+        The cache is only refreshed by create_table and drop_table, so the read and write paths
+        never query the SQLite catalog.
+        """
+        with span("schema_reflection"):
+            inspector = inspect(self.engine)
+            self.tables = inspector.get_table_names()
+            self.table_columns = {table_name: inspector.get_columns(table_name) for table_name in self.tables}
+            self.primary_keys = {
+                table_name: inspector.get_pk_constraint(table_name)["constrained_columns"] for table_name in self.tables
+            }
+            self.indexes = {table_name: inspector.get_indexes(table_name) for table_name in self.tables}
+
+    def get_column_names(self, table_name: str):
+        return [col['name'] for col in self.table_columns[table_name]]
+
+    def get_primary_keys(self, table_name: str):
+        return self.primary_keys[table_name]
             
     def _generate_models(self):
         """
         Generates dynamic SQLAlchemy model classes for each table in the database.
 
-        This function inspects the database schema to retrieve the list of tables and their
+        This function uses the cached database schema to retrieve the list of tables and their
         corresponding columns. For each table, it dynamically creates a SQLAlchemy model class
         with the appropriate column definitions, including primary keys. The model classes are
         stored in a dictionary with the table name (capitalized) as the key.
@@ -28,12 +114,11 @@ class BBDD_MANAGEMENT():
             dict: A dictionary mapping table names (capitalized) to their corresponding SQLAlchemy model classes.
         """
 
-        inspector = inspect(self.engine)
         models = {}
 
         for table_name in self.tables:
             columns = []
-            for column_info in inspector.get_columns(table_name):
+            for column_info in self.table_columns[table_name]:
                 column_name = column_info['name']
                 column_type = column_info['type']
                 columns.append(Column(column_name, column_type, primary_key=column_info.get('primary_key', False)))
@@ -50,9 +135,8 @@ class BBDD_MANAGEMENT():
 
     def create_table(self, table_name: str, columns: dict, relationships: dict = None, primary_key: str = 'id'):
         # verify if the table already exists
-        inspector = inspect(self.engine)
-        if table_name in inspector.get_table_names():
-            print(f"La tabla {table_name} ya existe en la base de datos.")
+        if table_name in self.tables:
+            logger.warning("La tabla %s ya existe en la base de datos.", table_name, extra={"table": table_name})
             return
 
         # Create a class for the table
@@ -68,7 +152,8 @@ class BBDD_MANAGEMENT():
             for column_name, rel_info in relationships.items():
                 ref_table = rel_info['reference_table']
                 ref_column = rel_info['reference_column']
-                attrs[column_name] = Column(columns[column_name], ForeignKey(f"{ref_table}.{ref_column}"))
+                # Indexed so that lookups and joins by the foreign key do not scan the table
+                attrs[column_name] = Column(columns[column_name], ForeignKey(f"{ref_table}.{ref_column}"), index=True)
                 relationship_name = f"{ref_table}_relation"
                 attrs[relationship_name] = relationship(ref_table.capitalize())
         
@@ -79,103 +164,408 @@ class BBDD_MANAGEMENT():
         model = type(table_name.capitalize(), (self.Base,), attrs)
         self.Base.metadata.create_all(self.engine)
         self.models[table_name.capitalize()] = model
+        self._reflect_schema()
 
-        print(f"La tabla {table_name} ha sido creada en la base de datos.")
+        logger.info("La tabla %s ha sido creada en la base de datos.", table_name, extra={"table": table_name})
 
     def drop_table(self, table_name: str):
-        inspector = inspect(self.engine)
-        if table_name in inspector.get_table_names():
-            self.models[table_name.capitalize()].__table__.drop(self.engine)
-            print(f"La tabla {table_name} ha sido eliminada de la base de datos.")
+        if table_name in self.tables:
+            model = self.models.pop(table_name.capitalize())
+            model.__table__.drop(self.engine)
+            self.Base.metadata.remove(model.__table__)
+            self._reflect_schema()
+            self.row_cache.clear()
+            logger.info("La tabla %s ha sido eliminada de la base de datos.", table_name, extra={"table": table_name})
         else:
-            print(f"La tabla {table_name} no existe en la base de datos.")
+            logger.warning("La tabla %s no existe en la base de datos.", table_name, extra={"table": table_name})
+
+    def _autoincrement_column(self, table_name: str):
+        """
+        Returns the id column whose values are allocated by the database, or None if the table has none.
+        """
+        return "id" if self.get_primary_keys(table_name) == ["id"] else None
+
+    def _prepare_row(self, table_name: str, data: dict, now: datetime):
+        data["create_date"] = now
+        data["update_date"] = now
+        autoincrement = self._autoincrement_column(table_name)
+        return {column: data.get(column) for column in self.get_column_names(table_name) if column != autoincrement}
+
+    def _submit_row(self, table_name: str, data: dict):
+        """
+        Submits the insert of a row to the write queue.
+
+        Returns:
+            Future: Id allocated by the database, or None if the table has no autoincrement id.
+        """
+        table = self.models[table_name.capitalize()].__table__
+        row = self._prepare_row(table_name, data, datetime.now())
+        return self.write_queue.submit(table, row, self._autoincrement_column(table_name))
+
+    def _row_added(self, table_name: str, data: dict, row_id):
+        if row_id is not None:
+            data['id'] = row_id
+            self.row_cache.pop((table_name, row_id))
 
     def add_data(self, table_name: str, data: dict):
-        inspector = inspect(self.engine)
-        
+        """
+        Inserts a row in a table and adds it to the vectorstore.
 
-        if table_name in inspector.get_table_names():
-            columns = [col['name'] for col in inspector.get_columns(table_name)]
-            if "id" in columns:
-                with self.engine.connect() as connection:
-                    query = f"SELECT MAX(id) FROM {table_name}"
-                    result = connection.execute(text(query))
-                    max_id = result.scalar()
-                    next_id = (max_id or 0) + 1
-                data['id'] = next_id
-            
-            data["create_date"] = pd.to_datetime("now")
-            data["update_date"] = pd.to_datetime("now")
-            df = pd.DataFrame([data])
-            df.to_sql(table_name, self.engine, if_exists='append', index=False)
-            
-            self.rag_manager.add_data(data)
+        The insert goes through the write queue, which writes it together with the inserts submitted
+        concurrently in one transaction; the id is allocated by the database and returned with RETURNING.
+        """
+        if table_name in self.tables:
+            self._row_added(table_name, data, self._submit_row(table_name, data).result())
+
+            if self.rag_manager is not None:
+                self.rag_manager.add_data(data)
 
-            print(f"Los datos han sido cargados en la tabla {table_name} de la base de datos.")
+            logger.info("Los datos han sido cargados en la tabla %s de la base de datos.", table_name, extra={"table": table_name})
         else:
-            print(f"La tabla {table_name} no existe en la base de datos.")
+            logger.warning("La tabla %s no existe en la base de datos.", table_name, extra={"table": table_name})
+
+    async def aadd_data(self, table_name: str, data: dict):
+        """
+        Asynchronous version of add_data, so that concurrent requests are coalesced by the write queue.
+        """
+        if table_name in self.tables:
+            self._row_added(table_name, data, await asyncio.wrap_future(self._submit_row(table_name, data)))
 
+            if self.rag_manager is not None:
+                await asyncio.to_thread(self.rag_manager.add_data, data)
 
-    def get_data_filtered(self, table_name: str, filters: dict):
-        query = self.session.query(self.models[table_name.capitalize()])
-        primary_key = self.models[table_name.capitalize()].__table__.primary_key.columns[0].name
-        for key, value in filters.items():
-            query = query.filter(getattr(self.models[table_name.capitalize()], key) == value)
-        
-        # Ejecutar la consulta
-        result = query.all()
-        
-        # Convertir el resultado a un DataFrame
-        data = [row.__dict__ for row in result]  # Convierte las filas a diccionarios
-        for item in data:
-            item.pop('_sa_instance_state', None)  # Elimina metadatos internos de SQLAlchemy
+            logger.info("Los datos han sido cargados en la tabla %s de la base de datos.", table_name, extra={"table": table_name})
+        else:
+            logger.warning("La tabla %s no existe en la base de datos.", table_name, extra={"table": table_name})
+
+    def bulk_add_data(self, table_name: str, rows, chunk_size: int = 1000, progress=None):
+        """
+        Inserts many rows in a table, streaming them in chunks.
+
+        Each chunk is inserted with a single executemany statement inside one transaction, with its ids
+        allocated by the database and returned with RETURNING, and then its texts are embedded in one
+        batched call to the vectorstore. Rows are consumed lazily, so any iterable (e.g. a generator reading a file) can be used.
+
+        Args:
+            table_name (str): Name of the table.
+            rows (iterable): Dicts with the data of each row.
+            chunk_size (int): Number of rows inserted and embedded per chunk.
+            progress (callable, optional): Called after each chunk with the number of rows inserted so far.
+
+        Returns:
+            int: Number of rows inserted.
+        """
+        if table_name not in self.tables:
+            logger.warning("La tabla %s no existe en la base de datos.", table_name, extra={"table": table_name})
+            return 0
 
-        df = pd.DataFrame(data)
-        df = df.set_index(primary_key)
+        table = self.models[table_name.capitalize()].__table__
+        autoincrement = self._autoincrement_column(table_name)
+        rows = iter(rows)
+        total = 0
+        start = time.perf_counter()
+
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+
+            now = datetime.now()
+            values = [self._prepare_row(table_name, data, now) for data in chunk]
+            with self.engine.begin() as connection:
+                if autoincrement is not None:
+                    statement = table.insert().returning(table.c[autoincrement], sort_by_parameter_order=True)
+                    for data, row_id in zip(chunk, connection.execute(statement, values).scalars().all()):
+                        data[autoincrement] = row_id
+                else:
+                    connection.execute(table.insert(), values)
+
+            if self.rag_manager is not None:
+                self.rag_manager.add_data_bulk(chunk)
+
+            total += len(chunk)
+            elapsed = time.perf_counter() - start
+            logger.info(
+                "%d filas cargadas en la tabla %s (%.0f filas/s).", total, table_name, total / elapsed,
+                extra={"stage": "bulk_insert", "table": table_name, "rows": total}
+            )
+            if progress is not None:
+                progress(total)
+
+        return total
+
+
+    def _where(self, table, filters: dict):
+        """
+        Translates filters into SQL conditions.
+
+        Each filter maps a column to a value (equality), a list of values (IN) or a dict of operators
+        (e.g. {"price": {"$gte": 20, "$lt": 50}}, {"id": {"$in": [1, 2, 3]}}); see FILTER_OPERATORS.
+        """
+        conditions = []
+        for key, value in (filters or {}).items():
+            column = table.c[key]
+            if isinstance(value, dict):
+                conditions.extend(FILTER_OPERATORS[operator](column, operand) for operator, operand in value.items())
+            elif isinstance(value, (list, tuple, set)):
+                conditions.append(column.in_(value))
+            else:
+                conditions.append(column == value)
+        return conditions
+
+    def _select(self, table_name: str, filters: dict = None, columns: list = None, limit: int = None, offset: int = None, after=None):
+        table = self.models[table_name.capitalize()].__table__
+        primary_key = table.c[self.get_primary_keys(table_name)[0]]
+        statement = select(*[table.c[column] for column in columns]) if columns else select(table)
+        statement = statement.where(*self._where(table, filters))
+        if after is not None:
+            statement = statement.where(primary_key > after)
+        if limit is not None or offset is not None or after is not None:
+            statement = statement.order_by(primary_key).limit(limit).offset(offset)
+        return statement
+
+    def iter_rows(self, table_name: str, filters: dict = None, columns: list = None, limit: int = None, offset: int = None, after=None, batch_size: int = 1000):
+        """
+        Streams the rows of a table as dicts, without building ORM objects or DataFrames.
+
+        Args:
+            table_name (str): Name of the table.
+            filters (dict, optional): Column values the rows must match.
+            columns (list, optional): Columns to return. All columns if None.
+            limit (int, optional): Maximum number of rows.
+            offset (int, optional): Number of rows to skip.
+            after (optional): Keyset pagination; only rows whose primary key is greater are returned.
+            batch_size (int): Number of rows fetched from SQLite at a time.
+
+        Yields:
+            dict: The values of each row.
+        """
+        statement = self._select(table_name, filters, columns, limit, offset, after)
+        with self.engine.connect() as connection:
+            result = connection.execution_options(yield_per=batch_size).execute(statement)
+            for row in result.mappings():
+                yield dict(row)
+
+    def select_rows(self, table_name: str, filters: dict = None, columns: list = None, limit: int = None, offset: int = None, after=None):
+        """
+        Returns the rows of a table as a list of dicts. See iter_rows for the arguments.
+
+        Lookups that only filter by primary key are served from the row cache.
+        """
+        ids = self._primary_key_lookup(table_name, filters)
+        if ids is not None and limit is None and offset is None and after is None:
+            return self.get_data_by_ids(table_name, ids, columns)
+
+        return self._fetch_rows(table_name, filters, columns, limit, offset, after)
+
+    def _fetch_rows(self, table_name: str, filters: dict = None, columns: list = None, limit: int = None, offset: int = None, after=None):
+        statement = self._select(table_name, filters, columns, limit, offset, after)
+        with self.engine.connect() as connection:
+            return [dict(row) for row in connection.execute(statement).mappings()]
+
+    def get_data_by_ids(self, table_name: str, ids: list, columns: list = None, chunk_size: int = 500):
+        """
+        Returns the rows with the given primary keys with one IN query per chunk of ids.
+
+        Args:
+            table_name (str): Name of the table.
+            ids (list): Primary keys of the rows.
+            columns (list, optional): Columns to return. The primary key is always included.
+            chunk_size (int): Maximum number of ids bound in one query.
+
+        Returns:
+            list: The rows found, as dicts, in the order of ids.
+        """
+        primary_key = self.get_primary_keys(table_name)[0]
+        if columns and primary_key not in columns:
+            columns = [primary_key] + list(columns)
+        unique_ids = list(dict.fromkeys(ids))
+        rows = self._get_cached_rows(table_name, unique_ids, chunk_size)
+        return [
+            {column: rows[row_id][column] for column in columns} if columns else rows[row_id]
+            for row_id in unique_ids if row_id in rows
+        ]
+
+    def _get_cached_rows(self, table_name: str, ids: list, chunk_size: int = 500):
+        """
+        Returns full rows by primary key from the row cache, reading the missing ones with IN queries.
+        """
+        primary_key = self.get_primary_keys(table_name)[0]
+        rows = {}
+        missing = []
+        for row_id in ids:
+            row = self.row_cache.get((table_name, row_id))
+            if row is None:
+                missing.append(row_id)
+            else:
+                rows[row_id] = dict(row)
+
+        for start in range(0, len(missing), chunk_size):
+            for row in self._fetch_rows(table_name, {primary_key: missing[start:start + chunk_size]}):
+                self.row_cache.set((table_name, row[primary_key]), dict(row))
+                rows[row[primary_key]] = row
+        return rows
+
+    def _primary_key_lookup(self, table_name: str, filters: dict):
+        """
+        Returns the primary keys looked up by filters that only filter by primary key, or None otherwise.
+        """
+        primary_keys = self.get_primary_keys(table_name)
+        if not filters or len(primary_keys) != 1 or list(filters) != primary_keys:
+            return None
+        value = filters[primary_keys[0]]
+        if isinstance(value, (list, tuple, set)):
+            return list(dict.fromkeys(value))
+        if isinstance(value, dict):
+            return list(dict.fromkeys(value["$in"])) if list(value) == ["$in"] else None
+        return [value]
+
+    def _matching_ids(self, table_name: str, filters: dict):
+        """
+        Returns the primary keys of the rows matching filters, looked up before they are modified or deleted.
+        """
+        ids = self._primary_key_lookup(table_name, filters)
+        if ids is None:
+            primary_key = self.get_primary_keys(table_name)[0]
+            ids = [row[primary_key] for row in self._fetch_rows(table_name, filters, [primary_key])]
+        return ids
+
+    def _invalidate(self, table_name: str, ids: list):
+        """
+        Removes rows from the row cache once their modification has been committed or rolled back, so that
+        a read running meanwhile cannot cache the old row again.
+        """
+        for row_id in ids:
+            self.row_cache.pop((table_name, row_id))
+
+    def cache_stats(self):
+        return self.row_cache.stats()
+
+    def _select_frame(self, table_name: str, filters: dict = None, columns: list = None):
+        statement = self._select(table_name, filters, columns)
+        with self.engine.connect() as connection:
+            result = connection.execute(statement)
+            df = pd.DataFrame.from_records(result.all(), columns=list(result.keys()))
+        primary_key = self.get_primary_keys(table_name)[0]
+        if primary_key in df.columns:
+            df = df.set_index(primary_key)
         return df
+
+    def get_data_filtered(self, table_name: str, filters: dict):
+        ids = self._primary_key_lookup(table_name, filters)
+        if ids is not None:
+            primary_key = self.get_primary_keys(table_name)[0]
+            rows = self.get_data_by_ids(table_name, ids)
+            return pd.DataFrame.from_records(rows, columns=self.get_column_names(table_name)).set_index(primary_key)
+        return self._select_frame(table_name, filters)
     
     def modify_data(self, table_name: str, filters: dict, data: dict):
-        query = self.session.query(self.models[table_name.capitalize()])
-        data["date_update"] = pd.to_datetime("now")
-        for key, value in filters.items():
-            query = query.filter(getattr(self.models[table_name.capitalize()], key) == value)
-        
+        model = self.models[table_name.capitalize()]
+        query = self.session.query(model)
+        data["update_date"] = pd.to_datetime("now")
+        query = query.filter(*self._where(model.__table__, filters))
+        ids = self._matching_ids(table_name, filters)
 
-        # Actualizar los registros con los nuevos valores
-        rows_updated = query.update(data, synchronize_session='fetch')
-        self.session.commit()
+        try:
+            # Actualizar los registros con los nuevos valores
+            rows_updated = query.update(data, synchronize_session='fetch')
+            self.session.commit()
+        except Exception:
+            self.session.rollback()
+            raise
+        finally:
+            self._invalidate(table_name, ids)
 
-        print(f"{rows_updated} registros han sido actualizados en la tabla {table_name} de la base de datos.")
+        logger.info(
+            "%d registros han sido actualizados en la tabla %s de la base de datos.", rows_updated, table_name,
+            extra={"table": table_name, "rows": rows_updated}
+        )
     
     def get_all_data(self, table_name: str):
-        query = self.session.query(self.models[table_name.capitalize()])
-        primary_key = self.models[table_name.capitalize()].__table__.primary_key.columns[0].name
-        result = query.all()
-        
-        # Convertir el resultado a un DataFrame
-        data = [row.__dict__ for row in result]  # Convierte las filas a diccionarios
-        for item in data:
-            item.pop('_sa_instance_state', None)  # Elimina metadatos internos de SQLAlchemy
-
-        df = pd.DataFrame(data)
-        df = df.set_index(primary_key)
-        return df
+        return self._select_frame(table_name)
     
     def get_columns(self, table_name: str):
-        inspector = inspect(self.engine)
-        columns = inspector.get_columns(table_name)
-        return columns
+        return self.table_columns[table_name]
+
+    def get_indexes(self, table_name: str):
+        return self.indexes[table_name]
+
+    def create_index(self, table_name: str, columns: list, unique: bool = False, index_name: str = None):
+        """
+        Creates a secondary index on columns of a table.
+
+        Args:
+            table_name (str): Name of the table.
+            columns (list): Columns of the index, in order.
+            unique (bool): Whether the index enforces unique values.
+            index_name (str, optional): Name of the index. Defaults to ix_<table>_<columns>.
+
+        Returns:
+            str: Name of the index.
+        """
+        index_name = index_name or f"ix_{table_name}_{'_'.join(columns)}"
+        if any(index["name"] == index_name for index in self.indexes.get(table_name, [])):
+            logger.warning("El índice %s ya existe en la base de datos.", index_name, extra={"table": table_name, "index": index_name})
+            return index_name
+
+        table = self.models[table_name.capitalize()].__table__
+        index = Index(index_name, *[table.c[column] for column in columns], unique=unique)
+        index.create(self.engine)
+        self._reflect_schema()
+
+        logger.info("El índice %s ha sido creado en la tabla %s.", index_name, table_name, extra={"table": table_name, "index": index_name})
+        return index_name
+
+    def drop_index(self, table_name: str, index_name: str):
+        table = self.models[table_name.capitalize()].__table__
+        index = next((index for index in table.indexes if index.name == index_name), None)
+        if index is not None:
+            index.drop(self.engine)
+            table.indexes.discard(index)
+        elif any(index["name"] == index_name for index in self.indexes.get(table_name, [])):
+            # Only an index reflected on this table is dropped, with its name quoted by the dialect
+            with self.engine.begin() as connection:
+                connection.execute(text(f"DROP INDEX {self.engine.dialect.identifier_preparer.quote(index_name)}"))
+        else:
+            logger.warning("El índice %s no existe en la tabla %s.", index_name, table_name, extra={"table": table_name, "index": index_name})
+            return
+        self._reflect_schema()
+
+        logger.info("El índice %s ha sido eliminado de la tabla %s.", index_name, table_name, extra={"table": table_name, "index": index_name})
+
+    def explain(self, table_name: str, filters: dict = None, columns: list = None):
+        """
+        Returns the SQLite query plan of the select that get_data_filtered would run.
+
+        Useful to check whether a filter uses an index ("SEARCH ... USING INDEX") or scans the table ("SCAN").
+
+        Returns:
+            list: The details of each step of the plan.
+        """
+        statement = self._select(table_name, filters, columns)
+        sql = str(statement.compile(self.engine, compile_kwargs={"literal_binds": True}))
+        with self.engine.connect() as connection:
+            plan = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}").all()
+        return [row[-1] for row in plan]
     
     def drop_data(self, table_name: str, filters: dict):
-        query = self.session.query(self.models[table_name.capitalize()])
+        model = self.models[table_name.capitalize()]
+        query = self.session.query(model)
+        ids = []
         try:
-            for key, value in filters.items():
-                query = query.filter(getattr(self.models[table_name.capitalize()], key) == value)
-            
+            query = query.filter(*self._where(model.__table__, filters))
+            ids = self._matching_ids(table_name, filters)
+
             # Eliminar los registros
             rows_deleted = query.delete(synchronize_session='fetch')
             self.session.commit()
 
-            print(f"{rows_deleted} registros han sido eliminados de la tabla {table_name} de la base de datos.")
+            logger.info(
+                "%d registros han sido eliminados de la tabla %s de la base de datos.", rows_deleted, table_name,
+                extra={"table": table_name, "rows": rows_deleted}
+            )
         except Exception as e:
-            print(f"Error al eliminar los registros de la tabla {table_name}: {str(e)}")
\ No newline at end of file
+            self.session.rollback()
+            logger.error("Error al eliminar los registros de la tabla %s: %s", table_name, e, extra={"table": table_name})
+        finally:
+            self._invalidate(table_name, ids)
\ No newline at end of file
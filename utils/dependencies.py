@@ -0,0 +1,158 @@
+from utils.request_context import request_scope
+from functools import lru_cache, wraps
+import itertools
+import threading
+import asyncio
+import os
+
+# The managers are imported by their providers: pandas, SQLAlchemy, LangChain and FAISS are only
+# loaded when a component is first needed, not when the application is imported
+
+
+request_counter = itertools.count()
+
+# Reentrant, as creating a component may create the components it depends on
+creation_lock = threading.RLock()
+
+
+def component(function):
+    """
+    Turns a factory into the provider of a component shared by the whole application.
+
+    The component is created on the first call and cached; concurrent first calls (e.g. the warm-up
+    thread and a request) wait for the same creation instead of building it twice.
+    """
+    cached = lru_cache(maxsize=None)(function)
+
+    @wraps(function)
+    def provider():
+        if cached.cache_info().currsize:
+            return cached()
+        with creation_lock:
+            return cached()
+
+    provider.cache_info = cached.cache_info
+    provider.cache_clear = cached.cache_clear
+    return provider
+
+
+def initialized(provider):
+    """
+    Returns:
+        bool: Whether the component of a provider has already been created.
+    """
+    return provider.cache_info().currsize > 0
+
+
+async def resolve(provider):
+    """
+    Returns the component of a provider, creating it in a worker thread if needed so that the event
+    loop keeps serving other requests meanwhile.
+    """
+    if initialized(provider):
+        return provider()
+    return await asyncio.to_thread(provider)
+
+
+def warm_up():
+    """
+    Creates the components needed to serve the catalog and the chatbot: the database managers and the
+    RAGManager, with its vectorstore, clients and workflow. Blocking, meant to run in a worker thread.
+    """
+    bbdd_manager()
+    languaje_bbdd_manager()
+
+
+@component
+def rag_manager():
+    """
+    Returns the RAGManager shared by the whole application, creating it on first use.
+    """
+    from utils.rag_manager import RAGManager
+
+    return RAGManager()
+
+
+@component
+def bbdd_manager():
+    """
+    Returns the BBDD_MANAGEMENT shared by the whole application, creating it on first use.
+    """
+    from utils.database_manager import BBDD_MANAGEMENT
+
+    return BBDD_MANAGEMENT(
+        os.getenv("DATABASE_PATH", "retail_web_jewelry.db"),
+        rag_manager(),
+        pool_size=int(os.getenv("DATABASE_POOL_SIZE", 5)),
+        max_overflow=int(os.getenv("DATABASE_MAX_OVERFLOW", 10)),
+        cache_size=int(os.getenv("DATABASE_CACHE_SIZE", 10000)),
+        cache_ttl=float(os.getenv("DATABASE_CACHE_TTL", 300))
+    )
+
+
+@component
+def languaje_bbdd_manager():
+    """
+    Returns the LANGUAJE_BBDD_MANAGEMENT shared by the whole application, creating it on first use.
+    """
+    from utils.languages_bbdd_manager import LANGUAJE_BBDD_MANAGEMENT
+
+    return LANGUAJE_BBDD_MANAGEMENT(
+        os.getenv("STRINGS_DATABASE_PATH", "data/strings"),
+        table_name=os.getenv("STRINGS_TABLE", "strings")
+    )
+
+
+@component
+def asset_manifest():
+    """
+    Returns the AssetManifest of the static assets, hashing them on first use.
+    """
+    from utils.static_assets import AssetManifest
+
+    return AssetManifest(os.getenv("ASSETS_DIRECTORY", "assets"), prefix="/assets")
+
+
+@component
+def image_pipeline():
+    """
+    Returns the ImagePipeline shared by the whole application; its worker processes start on the first upload.
+    """
+    from utils.image_pipeline import ImagePipeline
+
+    return ImagePipeline(
+        os.getenv("IMAGES_DIRECTORY", "data/images"),
+        max_workers=int(os.getenv("IMAGE_WORKERS", 0)) or None
+    )
+
+
+async def get_image_pipeline():
+    return await resolve(image_pipeline)
+
+
+async def get_rag_manager():
+    return await resolve(rag_manager)
+
+
+async def get_bbdd_manager():
+    """
+    Dependency providing the shared BBDD_MANAGEMENT with a session scoped to the request.
+    """
+    manager = await resolve(bbdd_manager)
+    request_scope.set(f"request-{next(request_counter)}")
+    try:
+        yield manager
+    finally:
+        manager.remove_session()
+
+
+async def get_languaje_bbdd_manager():
+    """
+    Dependency providing the shared LANGUAJE_BBDD_MANAGEMENT with a session scoped to the request.
+    """
+    manager = await resolve(languaje_bbdd_manager)
+    request_scope.set(f"request-{next(request_counter)}")
+    try:
+        yield manager
+    finally:
+        manager.remove_session()
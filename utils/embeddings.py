@@ -0,0 +1,227 @@
+from langchain_core.embeddings import Embeddings
+from langchain_openai import AzureOpenAIEmbeddings
+import numpy as np
+import threading
+import unicodedata
+import hashlib
+import sqlite3
+import asyncio
+import time
+import re
+import os
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Local embedding backend that needs no model nor external service.
+
+    Each text is normalized and its words and character trigrams are hashed into a fixed number of
+    dimensions (feature hashing), and the vector is L2-normalized. Texts sharing words get similar
+    vectors, which is enough for lexical search, development and benchmarks without any network call,
+    but it has no semantic knowledge: synonyms and translations are not close.
+    """
+
+    def __init__(self, dimension: int = 1536):
+        """
+        Args:
+            dimension (int): Number of dimensions of the embeddings.
+        """
+        self.dimension = dimension
+        self.model = f"hashing-{dimension}"
+
+    def features(self, text: str):
+        text = unicodedata.normalize("NFKD", text.lower()).encode("ascii", "ignore").decode("ascii")
+        words = re.findall(r"\w+", text)
+        features = list(words)
+        for word in words:
+            padded = f" {word} "
+            features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+        return features
+
+    def embed(self, text: str):
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for feature in self.features(text):
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dimension
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: list):
+        return [self.embed(text) for text in texts]
+
+    def embed_query(self, text: str):
+        return self.embed(text)
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings of any backend with an on-disk cache indexed by the hash of the text.
+
+    Texts already embedded are read from a SQLite table instead of calling the backend, so the same
+    product text or query is embedded only once, even across restarts. Only the texts missing from the
+    cache are sent to the backend, in a single batched call. The key includes the backend model and
+    whether the text is a query or a document, as some models embed them differently.
+
+    Document entries are bounded by the catalog. Query entries come from the users, so they are kept
+    in least recently used order and evicted when unused for `query_ttl` seconds or beyond the
+    `max_queries` most recently used.
+    """
+
+    def __init__(self, backend: Embeddings, path: str, namespace: str, max_queries: int = 10000, query_ttl: float = 7 * 24 * 3600):
+        """
+        Args:
+            backend (Embeddings): Embeddings used for the texts missing from the cache.
+            path (str): Path of the SQLite cache file.
+            namespace (str): Identifier of the backend model, so that models never share entries.
+            max_queries (int): Maximum number of query embeddings kept.
+            query_ttl (float): Seconds after which an unused query embedding is evicted.
+        """
+        self.backend = backend
+        self.path = path
+        self.namespace = namespace
+        self.max_queries = max_queries
+        self.query_ttl = query_ttl
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        columns = {row[1] for row in self.connection.execute("PRAGMA table_info(embeddings)")}
+        if columns and "last_access" not in columns:
+            # Cache of a previous version, which did not record the kind of each entry: it is rebuilt
+            self.connection.execute("DROP TABLE embeddings")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, kind TEXT NOT NULL, vector BLOB NOT NULL, last_access REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS ix_embeddings_kind_last_access ON embeddings (kind, last_access)")
+        self.connection.commit()
+
+    def key(self, kind: str, text: str):
+        return hashlib.sha256(f"{self.namespace}\x00{kind}\x00{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, kind: str, keys: list):
+        """
+        Returns:
+            dict: Cached embedding of each key found. Query entries found are marked as used now.
+        """
+        found = {}
+        now = time.time()
+        with self.lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = self.connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))}) AND (kind = 'document' OR last_access >= ?)",
+                    chunk + [now - self.query_ttl]
+                ).fetchall()
+                found.update((key, np.frombuffer(vector, dtype=np.float32).tolist()) for key, vector in rows)
+            if kind == "query" and found:
+                self.connection.executemany("UPDATE embeddings SET last_access = ? WHERE key = ?", [(now, key) for key in found])
+                self.connection.commit()
+        return found
+
+    def set_many(self, kind: str, items: dict):
+        now = time.time()
+        with self.lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, kind, vector, last_access) VALUES (?, ?, ?, ?)",
+                [(key, kind, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in items.items()]
+            )
+            if kind == "query":
+                self.connection.execute("DELETE FROM embeddings WHERE kind = 'query' AND last_access < ?", (now - self.query_ttl,))
+                self.connection.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings WHERE kind = 'query' ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                    (self.max_queries,)
+                )
+            self.connection.commit()
+
+    def lookup(self, kind: str, texts: list):
+        keys = [self.key(kind, text) for text in texts]
+        found = self.get_many(kind, list(set(keys)))
+        missing = list(dict.fromkeys(text for text, key in zip(texts, keys) if key not in found))
+        return keys, found, missing
+
+    def store(self, kind: str, keys: list, found: dict, missing: list, embeddings: list):
+        computed = {self.key(kind, text): embedding for text, embedding in zip(missing, embeddings)}
+        if computed:
+            self.set_many(kind, computed)
+        found.update(computed)
+        with self.lock:
+            self.misses += len(missing)
+            self.hits += len(keys) - len(missing)
+        return [found[key] for key in keys]
+
+    def embed_documents(self, texts: list):
+        keys, found, missing = self.lookup("document", texts)
+        embeddings = self.backend.embed_documents(missing) if missing else []
+        return self.store("document", keys, found, missing, embeddings)
+
+    def embed_query(self, text: str):
+        keys, found, missing = self.lookup("query", [text])
+        embeddings = [self.backend.embed_query(text)] if missing else []
+        return self.store("query", keys, found, missing, embeddings)[0]
+
+    async def aembed_documents(self, texts: list):
+        keys, found, missing = await asyncio.to_thread(self.lookup, "document", texts)
+        embeddings = await self.backend.aembed_documents(missing) if missing else []
+        return await asyncio.to_thread(self.store, "document", keys, found, missing, embeddings)
+
+    async def aembed_query(self, text: str):
+        keys, found, missing = await asyncio.to_thread(self.lookup, "query", [text])
+        embeddings = [await self.backend.aembed_query(text)] if missing else []
+        return (await asyncio.to_thread(self.store, "query", keys, found, missing, embeddings))[0]
+
+    def stats(self):
+        with self.lock:
+            size, queries = self.connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(kind = 'query'), 0) FROM embeddings"
+            ).fetchone()
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            "backend": self.namespace,
+            "size": size,
+            "queries": queries,
+            "max_queries": self.max_queries,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / total if total else 0.0,
+        }
+
+
+def create_embeddings():
+    """
+    Creates the embeddings of the RAGManager configured by the environment.
+
+    EMBEDDINGS_BACKEND selects "azure" (default, the EMB_OPENAI_* deployment) or "local" (HashingEmbeddings
+    of EMBEDDINGS_DIMENSION dimensions, which runs offline). Unless EMBEDDINGS_CACHE_PATH is set to an
+    empty string, the embeddings are cached in that SQLite file, with at most EMBEDDINGS_CACHE_MAX_QUERIES
+    query embeddings, each evicted after EMBEDDINGS_CACHE_QUERY_TTL seconds unused.
+    """
+    backend = os.getenv("EMBEDDINGS_BACKEND", "azure").lower()
+
+    if backend == "local":
+        embeddings = HashingEmbeddings(dimension=int(os.getenv("EMBEDDINGS_DIMENSION", 1536)))
+        namespace = embeddings.model
+    else:
+        embeddings = AzureOpenAIEmbeddings(
+            model=os.getenv("EMB_OPENAI_DEPLOIMENT_MODEL"),  # Nombre del modelo desplegado
+            api_key=os.getenv("EMB_OPENAI_API_KEY"),
+            azure_endpoint=os.getenv("EMB_OPENAI_ENDPOINT"),
+            openai_api_version=os.getenv("EMB_OPENAI_API_VERSION"),
+        )
+        namespace = f"azure-{os.getenv('EMB_OPENAI_DEPLOIMENT_MODEL')}"
+
+    cache_path = os.getenv("EMBEDDINGS_CACHE_PATH", "./data/embeddings_cache.db")
+    if not cache_path:
+        return embeddings
+    return CachedEmbeddings(
+        embeddings,
+        cache_path,
+        namespace,
+        max_queries=int(os.getenv("EMBEDDINGS_CACHE_MAX_QUERIES", 10000)),
+        query_ttl=float(os.getenv("EMBEDDINGS_CACHE_QUERY_TTL", 7 * 24 * 3600))
+    )
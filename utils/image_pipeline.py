@@ -0,0 +1,184 @@
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageOps, UnidentifiedImageError
+import multiprocessing
+import threading
+import tempfile
+import asyncio
+import hashlib
+import json
+import re
+import io
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SIZES = (64, 160, 320, 640)
+DIGEST_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+FALLBACK_TYPES = {"jpeg": "image/jpeg", "png": "image/png"}
+
+
+def build_derivatives(data: bytes, folder: str, sizes: tuple):
+    """
+    Generates the thumbnails of an image, in WebP and in JPEG (PNG if it has transparency).
+
+    It runs in the worker processes of the ImagePipeline. Each file is written under a temporary
+    name and renamed, and `manifest.json` is written last, so a folder with a manifest is complete.
+
+    Args:
+        data (bytes): Content of the uploaded image.
+        folder (str): Folder where the derivatives are stored.
+        sizes (tuple): Maximum width and height of each thumbnail.
+
+    Returns:
+        dict: Manifest with the dimensions of the original image, the sizes generated and the fallback format.
+    """
+    try:
+        image = Image.open(io.BytesIO(data))
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        # DecompressionBombError (too many pixels) is not an OSError
+        raise ValueError(f"Invalid image: {e}")
+
+    transparent = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+    image = image.convert("RGBA" if transparent else "RGB")
+    fallback = "png" if transparent else "jpeg"
+    fallback_options = {"quality": 85, "optimize": True, "progressive": True} if fallback == "jpeg" else {"optimize": True}
+    os.makedirs(folder, exist_ok=True)
+
+    def save(thumbnail, name, format, **options):
+        write_atomic(os.path.join(folder, name), lambda file: thumbnail.save(file, format=format, **options))
+
+    # Sizes bigger than the original would only be upscaled copies, so the original size is used instead
+    generated = sorted({min(size, max(image.size)) for size in sizes})
+    for size in generated:
+        thumbnail = image.copy()
+        thumbnail.thumbnail((size, size), Image.LANCZOS)
+        save(thumbnail, f"{size}.webp", "WEBP", quality=80, method=6)
+        save(thumbnail, f"{size}.{fallback}", fallback.upper(), **fallback_options)
+
+    manifest = {"width": image.size[0], "height": image.size[1], "sizes": generated, "fallback": fallback}
+    write_atomic(os.path.join(folder, "manifest.json"), lambda file: file.write(json.dumps(manifest).encode()))
+    return manifest
+
+
+def write_atomic(path: str, write):
+    """
+    Writes a file under a unique temporary name in its folder and renames it, so that processes
+    writing the same file at the same time never share a temporary file.
+
+    Args:
+        path (str): Path of the file.
+        write (callable): Called with the temporary file, opened in binary mode.
+    """
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), suffix=".tmp", delete=False) as file:
+        try:
+            write(file)
+        except BaseException:
+            file.close()
+            os.remove(file.name)
+            raise
+    # NamedTemporaryFile creates the file readable only by its owner
+    os.chmod(file.name, 0o644)
+    os.replace(file.name, path)
+
+
+class ImagePipeline:
+    """
+    Generates and locates the thumbnails of the product images.
+
+    Images are content-addressed: they are stored in `directory` under the hash of their content,
+    so uploading the same image twice reuses its derivatives, and the URL of a derivative never
+    changes its content, which allows caching it forever. Resizing runs in a pool of worker
+    processes, so uploads do not block the event loop.
+    """
+
+    def __init__(self, directory: str = "data/images", sizes: tuple = THUMBNAIL_SIZES, max_workers: int = None, max_bytes: int = 10 * 1024 * 1024):
+        """
+        Args:
+            directory (str): Directory where the derivatives are stored.
+            sizes (tuple): Maximum width and height of each thumbnail.
+            max_workers (int, optional): Number of worker processes (default is the number of CPUs).
+            max_bytes (int): Maximum size of an uploaded image.
+        """
+        self.directory = directory
+        self.sizes = tuple(sizes)
+        self.max_workers = max_workers
+        self.max_bytes = max_bytes
+        self.executor = None
+        self.lock = threading.Lock()
+
+    def get_executor(self):
+        with self.lock:
+            if self.executor is None:
+                # Created after the server threads started: forking them could leave a lock held in the
+                # workers, so they are started by a fork server (spawned on Windows) instead
+                method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+                self.executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context(method))
+        return self.executor
+
+    def folder(self, digest: str):
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def get_manifest(self, digest: str):
+        """
+        Returns:
+            dict: Manifest of the derivatives of an image, or None if the image is unknown.
+        """
+        if not DIGEST_PATTERN.match(digest):
+            return None
+        try:
+            with open(os.path.join(self.folder(digest), "manifest.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    async def process(self, data: bytes):
+        """
+        Stores an uploaded image and generates its thumbnails, unless it was already uploaded.
+
+        Args:
+            data (bytes): Content of the image.
+
+        Returns:
+            dict: Digest identifying the image ("image") and its manifest.
+
+        Raises:
+            ValueError: If the image is too big or cannot be read.
+        """
+        if len(data) > self.max_bytes:
+            raise ValueError(f"Image bigger than {self.max_bytes} bytes")
+
+        digest = hashlib.sha256(data).hexdigest()[:32]
+        manifest = self.get_manifest(digest)
+        if manifest is None:
+            loop = asyncio.get_running_loop()
+            manifest = await loop.run_in_executor(self.get_executor(), build_derivatives, data, self.folder(digest), self.sizes)
+            logger.info("Se han generado %d miniaturas de la imagen %s", len(manifest["sizes"]), digest, extra={"stage": "thumbnails", "image": digest})
+        return {"image": digest, **manifest}
+
+    def thumbnail(self, digest: str, size: int, webp: bool = True):
+        """
+        Finds the smallest thumbnail of an image that covers the size requested.
+
+        Args:
+            digest (str): Digest of the image.
+            size (int): Minimum width and height wanted.
+            webp (bool): Whether the client accepts WebP.
+
+        Returns:
+            tuple: Path and media type of the thumbnail, or None if the image is unknown.
+        """
+        manifest = self.get_manifest(digest)
+        if manifest is None:
+            return None
+        size = next((generated for generated in manifest["sizes"] if generated >= size), manifest["sizes"][-1])
+        if webp:
+            return os.path.join(self.folder(digest), f"{size}.webp"), "image/webp"
+        fallback = manifest["fallback"]
+        return os.path.join(self.folder(digest), f"{size}.{fallback}"), FALLBACK_TYPES[fallback]
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown()
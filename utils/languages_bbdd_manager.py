@@ -1,66 +1,111 @@
 from utils.database_manager import BBDD_MANAGEMENT
 from sqlalchemy import String
-from sqlalchemy import inspect, text
-import pandas as pd
+from types import MappingProxyType
+import hashlib
+import gzip
+import json
 
 
 class LANGUAJE_BBDD_MANAGEMENT(BBDD_MANAGEMENT):
-    def __init__(self, database_path):
+    def __init__(self, database_path, table_name: str = "languajes"):
         self.columns = {"keywords": String,
                         "word_es": String, "word_en": String}
         super().__init__(database_path)
-        self.table_name = "languajes"
+        self.table_name = table_name
         self.primary_key = "keywords"
+        self.strings = MappingProxyType({})
+        self.bundles = {}
+        if self.table_name in self.tables:
+            self.load_strings()
 
     def create_table_languajes(self):
         self.create_table(self.table_name, self.columns,
                           primary_key=self.primary_key)
 
     def add_data(self, data: dict):
-        inspector = inspect(self.engine)
-
-        if self.table_name in inspector.get_table_names():
-            columns = [col['name']
-                       for col in inspector.get_columns(self.table_name)]
-            if "id" in columns:
-                with self.engine.connect() as connection:
-                    query = f"SELECT MAX(id) FROM {self.table_name}"
-                    result = connection.execute(text(query))
-                    max_id = result.scalar()
-                    next_id = (max_id or 0) + 1
-                data['id'] = next_id
-
-            data["create_date"] = pd.to_datetime("now")
-            data["update_date"] = pd.to_datetime("now")
-            df = pd.DataFrame([data])
-            df.to_sql(self.table_name, self.engine,
-                      if_exists='append', index=False)
-
-            print(
-                f"Los datos han sido cargados en la tabla {self.table_name} de la base de datos.")
-        else:
-            print(f"La tabla {self.table_name} no existe en la base de datos.")
+        super().add_data(self.table_name, data)
+        self.load_strings()
 
-    def get_all_data(self):
-        query = self.session.query(self.models[self.table_name.capitalize()])
-        primary_key = self.models[self.table_name.capitalize(
-        )].__table__.primary_key.columns[0].name
-        result = query.all()
+    def missing_keys(self, strings: dict):
+        """
+        Checks the key parity of the strings table with a set of strings.
+
+        Args:
+            strings (dict): Strings of each language, with the shape of `data/strings.json`.
+
+        Returns:
+            dict: Keys of each language that are missing or empty in the strings table. Empty if there are none.
+        """
+        missing = {}
+        for language, language_strings in strings.items():
+            stored = self.strings.get(language, {})
+            keys = sorted(key for key in language_strings if stored.get(key) is None)
+            if keys:
+                missing[language] = keys
+        return missing
 
-        # Convertir el resultado a un DataFrame
-        # Convierte las filas a diccionarios
-        data = [row.__dict__ for row in result]
-        for item in data:
-            # Elimina metadatos internos de SQLAlchemy
-            item.pop('_sa_instance_state', None)
+    def import_strings(self, strings: dict):
+        """
+        Inserts the keys of a set of strings that are not in the strings table yet; existing rows are kept.
 
-        df = pd.DataFrame(data)
-        df = df.set_index(primary_key)
+        Args:
+            strings (dict): Strings of each language, with the shape of `data/strings.json`.
 
-        return df
+        Returns:
+            list: Keys inserted.
+        """
+        stored = set().union(*(language_strings.keys() for language_strings in self.strings.values()))
+        keys = sorted(set().union(*(language_strings.keys() for language_strings in strings.values())) - stored)
+        rows = [
+            {self.primary_key: key, **{f"word_{language}": language_strings.get(key) for language, language_strings in strings.items()}}
+            for key in keys
+        ]
+        self.bulk_add_data(self.table_name, rows)
+        self.load_strings()
+        return keys
+
+    def get_all_data(self):
+        return super().get_all_data(self.table_name)
 
     def get_language_data(self):
-        all_data_df = self.get_all_data()
-        json_filtered = all_data_df[["word_en", "word_es"]].to_json()
+        rows = self.select_rows(self.table_name, columns=[self.primary_key, "word_en", "word_es"])
+        json_filtered = json.dumps(
+            {column: {row[self.primary_key]: row[column] for row in rows} for column in ["word_en", "word_es"]}
+        )
 
         return json_filtered
+
+    def load_strings(self):
+        """
+        Loads the strings of every language into immutable dicts and precompiles their bundles.
+
+        Each `word_<language>` column becomes a language. A bundle is the serialized JSON of the strings,
+        its gzip-compressed version and its ETag; there is one bundle per language and one (under None)
+        with every language, with the same shape as `data/strings.json`. Called at startup and whenever
+        add_data writes to the strings table.
+        """
+        languages = [column[len("word_"):] for column in self.get_column_names(self.table_name) if column.startswith("word_")]
+        rows = self.select_rows(self.table_name)
+        strings = {
+            language: MappingProxyType({row[self.primary_key]: row[f"word_{language}"] for row in rows})
+            for language in languages
+        }
+
+        bundles = {language: self._compile_bundle(dict(language_strings)) for language, language_strings in strings.items()}
+        bundles[None] = self._compile_bundle({language: dict(language_strings) for language, language_strings in strings.items()})
+
+        self.strings = MappingProxyType(strings)
+        self.bundles = bundles
+
+    def _compile_bundle(self, content: dict):
+        body = json.dumps(content, ensure_ascii=False, sort_keys=True).encode("utf-8")
+        etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        return body, gzip.compress(body, compresslevel=9, mtime=0), etag
+
+    def get_bundle(self, language: str = None):
+        """
+        Returns:
+            tuple: (body, gzip_body, etag) of the strings of a language, or of every language if None.
+                   None if the language does not exist.
+        """
+        return self.bundles.get(language)
@@ -0,0 +1,226 @@
+import threading
+import sqlite3
+import re
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Metadata of the vectorstore documents that can be filtered in SQL, with the operators supported
+FILTER_COLUMNS = ("id", "color", "price")
+SQL_OPERATORS = {"$eq": "=", "$neq": "!=", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+
+# Fields of the text of a vectorstore document, used to rebuild the index from the docstore
+DOCUMENT_PATTERN = re.compile(r"^Producto: (?P<name>.*?)\. Color: .*?\. Precio: .*?\. Descripción: (?P<description>.*)\.$", re.S)
+
+# Words too common to rank the products: matching them would make BM25 score almost the whole catalog
+STOPWORDS = frozenset(
+    "de del la las el los un una unos unas y o en con sin por para que se su sus al lo mas menos desde hasta "
+    "entre sobre como muy me mi quiero busco algo tienes hay es son "
+    "the a an and or of in on with without for to from by under over less more than is are".split()
+)
+
+
+def reciprocal_rank_fusion(rankings: list, k: int = 60):
+    """
+    Merges several rankings of the same items with reciprocal rank fusion.
+
+    Each item scores the sum of 1 / (k + rank) over the rankings it appears in, so items ranked high
+    by several retrievers come first without having to compare their heterogeneous scores.
+
+    Args:
+        rankings (list): Lists of items, most relevant first.
+        k (int): Constant that dampens the weight of the first ranks.
+
+    Returns:
+        list: Items sorted by fused score.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def matching_documents(lexical_index, vectorstore, filters: dict):
+    """
+    Returns the docstore ids of the documents of a vectorstore whose metadata are equal to all the filters.
+
+    A filter on indexed metadata is looked up in the lexical index, so its cost does not grow with the
+    catalog; any other filter is compared with the metadata of every document in the docstore.
+
+    Args:
+        lexical_index (LexicalIndex): Lexical index in sync with the vectorstore.
+        vectorstore (FAISS): Vectorstore of the documents.
+        filters (dict): Metadata values a document must be equal to (e.g. {"id": 3}).
+
+    Returns:
+        list: Docstore ids of the matching documents.
+    """
+    # Lists and dicts would be read as operators by the lexical index, and are compared as values here
+    if not any(isinstance(value, (dict, list)) for value in filters.values()):
+        docstore_ids = lexical_index.candidates(filters)
+        if docstore_ids is not None:
+            return docstore_ids
+    return [
+        docstore_id for docstore_id in vectorstore.index_to_docstore_id.values()
+        if all(vectorstore.docstore.search(docstore_id).metadata.get(key) == value for key, value in filters.items())
+    ]
+
+
+class LexicalIndex:
+    """
+    SQLite FTS5 index of the products in the vectorstore, with their filterable metadata.
+
+    Each vectorstore document is stored under its docstore id with the id, color and price of the
+    product in an indexed table, and its name and description in an FTS5 table ranked by BM25. The
+    metadata filters are translated to SQL, so the candidates of a filtered search are found by the
+    database before the vector search.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): Path of the SQLite file of the index.
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS documents (
+                rowid INTEGER PRIMARY KEY, docstore_id TEXT UNIQUE NOT NULL, id INTEGER, color TEXT, price REAL
+            );
+            CREATE INDEX IF NOT EXISTS ix_documents_id ON documents (id);
+            CREATE INDEX IF NOT EXISTS ix_documents_color_price ON documents (color, price);
+            CREATE INDEX IF NOT EXISTS ix_documents_price ON documents (price);
+            CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(name, description, tokenize='unicode61 remove_diacritics 2');
+            """
+        )
+
+    def add(self, docstore_ids: list, metadatas: list, names: list, descriptions: list):
+        with self.lock, self.connection:
+            for docstore_id, metadata, name, description in zip(docstore_ids, metadatas, names, descriptions):
+                self.connection.execute(
+                    "DELETE FROM documents_fts WHERE rowid IN (SELECT rowid FROM documents WHERE docstore_id = ?)", (docstore_id,)
+                )
+                rowid = self.connection.execute(
+                    "INSERT OR REPLACE INTO documents (docstore_id, id, color, price) VALUES (?, ?, ?, ?)",
+                    (docstore_id, metadata.get("id"), metadata.get("color"), metadata.get("price"))
+                ).lastrowid
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO documents_fts (rowid, name, description) VALUES (?, ?, ?)",
+                    (rowid, name, description)
+                )
+
+    def remove(self, docstore_ids: list):
+        with self.lock, self.connection:
+            for start in range(0, len(docstore_ids), 500):
+                chunk = docstore_ids[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                self.connection.execute(
+                    f"DELETE FROM documents_fts WHERE rowid IN (SELECT rowid FROM documents WHERE docstore_id IN ({placeholders}))", chunk
+                )
+                self.connection.execute(f"DELETE FROM documents WHERE docstore_id IN ({placeholders})", chunk)
+
+    def rebuild(self, documents):
+        """
+        Rebuilds the index from the documents of a vectorstore.
+
+        Args:
+            documents (iterable): Pairs of docstore id and Document.
+        """
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM documents")
+            self.connection.execute("DELETE FROM documents_fts")
+        docstore_ids, metadatas, names, descriptions = [], [], [], []
+        for docstore_id, document in documents:
+            match = DOCUMENT_PATTERN.match(document.page_content)
+            docstore_ids.append(docstore_id)
+            metadatas.append(document.metadata)
+            names.append(match["name"] if match else "")
+            descriptions.append(match["description"] if match else document.page_content)
+        self.add(docstore_ids, metadatas, names, descriptions)
+        logger.info("Índice léxico reconstruido con %d documentos.", len(docstore_ids), extra={"stage": "lexical_rebuild"})
+
+    def count(self):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def where(self, filters: dict):
+        """
+        Translates a metadata filter to a SQL condition over the documents table.
+
+        Returns:
+            tuple: SQL condition and its parameters, or None if the filter uses metadata or operators
+            that are not indexed.
+        """
+        conditions, parameters = [], []
+        for column, value in (filters or {}).items():
+            if column not in FILTER_COLUMNS:
+                return None
+            if isinstance(value, list):
+                value = {"$in": value}
+            if not isinstance(value, dict):
+                value = {"$eq": value}
+            for operator, operand in value.items():
+                if operator in ("$in", "$nin"):
+                    operand = list(operand)
+                    if not operand:
+                        conditions.append("0" if operator == "$in" else "1")
+                        continue
+                    negation = "NOT " if operator == "$nin" else ""
+                    conditions.append(f"d.{column} {negation}IN ({','.join('?' * len(operand))})")
+                    parameters.extend(operand)
+                elif operator in SQL_OPERATORS:
+                    conditions.append(f"d.{column} {SQL_OPERATORS[operator]} ?")
+                    parameters.append(operand)
+                else:
+                    return None
+        return " AND ".join(conditions) or "1", parameters
+
+    def candidates(self, filters: dict):
+        """
+        Returns:
+            list: Docstore ids of the documents matching the filter, or None if it cannot be evaluated in SQL.
+        """
+        where = self.where(filters)
+        if where is None:
+            return None
+        condition, parameters = where
+        with self.lock:
+            rows = self.connection.execute(f"SELECT d.docstore_id FROM documents d WHERE {condition}", parameters).fetchall()
+        return [row[0] for row in rows]
+
+    def search(self, query: str, limit: int, filters: dict = None):
+        """
+        Returns the documents that best match the words of a query according to BM25.
+
+        Args:
+            query (str): Query of the user.
+            limit (int): Maximum number of documents to return.
+            filters (dict, optional): Metadata filter; nothing is returned if it cannot be evaluated in SQL.
+
+        Returns:
+            list: Docstore ids of the documents, most relevant first.
+        """
+        # Accents are removed by the FTS5 tokenizer, on the indexed texts and on the query words alike
+        words = {
+            word for word in re.findall(r"\w+", query.lower())
+            if len(word) > 1 and not word.isdigit() and word not in STOPWORDS
+        }
+        if not words:
+            return []
+        where = self.where(filters)
+        if where is None:
+            return []
+        condition, parameters = where
+        with self.lock:
+            rows = self.connection.execute(
+                f"SELECT d.docstore_id FROM documents_fts f JOIN documents d ON d.rowid = f.rowid "
+                f"WHERE documents_fts MATCH ? AND {condition} ORDER BY bm25(documents_fts) LIMIT ?",
+                [" OR ".join(f'"{word}"' for word in sorted(words)), *parameters, limit]
+            ).fetchall()
+        return [row[0] for row in rows]
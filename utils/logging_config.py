@@ -0,0 +1,38 @@
+import logging
+import json
+import os
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    Formats each record as one JSON object, with the fields passed in `extra` as keys.
+    """
+
+    RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in self.RESERVED})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def configure_logging():
+    """
+    Configures the logging of the application from the environment.
+
+    LOG_LEVEL sets the minimum level logged (INFO by default; DEBUG also logs the filters, retrieved
+    products and prompts). LOG_FORMAT selects "json" (default), one JSON object per line, or "text".
+    """
+    handler = logging.StreamHandler()
+    if os.getenv("LOG_FORMAT", "json").lower() == "json":
+        handler.setFormatter(JSONFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(), handlers=[handler], force=True)
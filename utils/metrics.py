@@ -0,0 +1,101 @@
+from prometheus_client import Histogram, CollectorRegistry, CONTENT_TYPE_LATEST, generate_latest, multiprocess
+from contextlib import contextmanager
+import time
+import os
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Duration of the HTTP requests.", ["method", "route", "status"], buckets=LATENCY_BUCKETS
+)
+
+# Stages measured on the hot paths: schema_reflection, sql_query, embedding, faiss_search, lexical_search,
+# filter_llm and chat_llm
+STAGE_DURATION = Histogram(
+    "stage_duration_seconds", "Duration of the stages of the requests.", ["stage"], buckets=LATENCY_BUCKETS
+)
+
+
+def observe(stage: str, seconds: float):
+    STAGE_DURATION.labels(stage).observe(seconds)
+
+
+@contextmanager
+def span(stage: str):
+    """
+    Measures the duration of a stage in the stage_duration_seconds histogram.
+
+    Args:
+        stage (str): Name of the stage.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+
+async def timed(stage: str, awaitable):
+    """
+    Awaits an awaitable measuring it as a stage, so that it can be measured inside asyncio.gather.
+    """
+    with span(stage):
+        return await awaitable
+
+
+class RequestDurationMiddleware:
+    """
+    ASGI middleware that measures each HTTP request in the http_request_duration_seconds histogram.
+
+    The request ends when the last chunk of its body is sent, so a streamed response is measured until
+    its last event and not only until its headers. It is labelled with the route template, not the
+    path, so that the number of series stays bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+        finished = False
+
+        def finish():
+            nonlocal finished
+            if finished:
+                return
+            finished = True
+            route = scope.get("route")
+            label = route.path if route is not None else scope.get("root_path") or "unmatched"
+            REQUEST_DURATION.labels(scope["method"], label, str(status)).observe(time.perf_counter() - start)
+
+        async def measured_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                finish()
+
+        try:
+            await self.app(scope, receive, measured_send)
+        finally:
+            # Failed or disconnected before the end of the body
+            finish()
+
+
+def render_metrics():
+    """
+    Returns:
+        tuple: Metrics in the Prometheus text format and their content type.
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        # With several workers each process writes its samples to that folder, and they are aggregated here
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
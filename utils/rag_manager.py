@@ -1,90 +1,359 @@
 
 from langchain_openai import AzureChatOpenAI
 import os
-from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.messages import AIMessageChunk, HumanMessage, SystemMessage
+from langchain_core.documents import Document
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.runnables import RunnableLambda
 from langchain_core.messages import HumanMessage, RemoveMessage
-from langgraph.checkpoint.memory import MemorySaver
 from langgraph.graph import START, MessagesState, StateGraph
-from langchain_community.vectorstores import FAISS
-from langchain_openai import AzureOpenAIEmbeddings
+from langgraph.constants import TAG_NOSTREAM
+from utils.embeddings import CachedEmbeddings, create_embeddings
+from utils.vectorstore_persistence import VectorstorePersistence
+from utils.shared_vectorstore import SharedVectorstore
+from utils.lexical_index import LexicalIndex, matching_documents, reciprocal_rank_fusion
+from utils.cache import TTLCache
+from utils.checkpointer import create_checkpointer
+from utils.metrics import span, timed
+import numpy as np
+import contextlib
+import threading
+import asyncio
+import faiss
+import unicodedata
+import uuid
 import re
 import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Color words recognised by the rule-based filter, mapped to the color stored in the metadata
+COLORS = {
+    "oro": "oro", "dorado": "oro", "dorada": "oro", "gold": "oro", "golden": "oro",
+    "plata": "plata", "plateado": "plata", "plateada": "plata", "silver": "plata",
+    "rosa": "rosa", "pink": "rosa", "rose": "rosa",
+    "negro": "negro", "negra": "negro", "black": "negro",
+    "blanco": "blanco", "blanca": "blanco", "white": "blanco",
+    "rojo": "rojo", "roja": "rojo", "red": "rojo",
+    "azul": "azul", "blue": "azul",
+    "verde": "verde", "green": "verde",
+}
+
+# Price expressions recognised by the rule-based filter, mapped to the FAISS filter operator
+PRICE_PATTERNS = [
+    (re.compile(r"(?:menos de|por debajo de|hasta|maximo|under|below|less than|up to|max|<=?)\s*(\d+(?:[.,]\d+)?)"), "$lte"),
+    (re.compile(r"(?:mas de|por encima de|desde|minimo|over|above|more than|from|min|>=?)\s*(\d+(?:[.,]\d+)?)"), "$gte"),
+]
+
+
+SYSTEM_PROMPT = (
+    "You are a helpful assistant. "
+    "Answer all questions to the best of your ability. "
+    "The provided chat history includes a summary of the earlier conversation."
+)
+SUMMARY_PROMPT = (
+    "Distill the above chat messages into a single summary message. "
+    "Include as many specific details as you can."
+)
+# Tagged so that the summary tokens are not streamed to the user
+SUMMARY_CONFIG = {"tags": [TAG_NOSTREAM]}
 
 
 class RAGManager:
 
-    def __init__(self):
-        self.embedding_function = AzureOpenAIEmbeddings(
-            model=os.getenv("EMB_OPENAI_DEPLOIMENT_MODEL"),  # Nombre del modelo desplegado
-            api_key=os.getenv("EMB_OPENAI_API_KEY"),
-            azure_endpoint=os.getenv("EMB_OPENAI_ENDPOINT"),
-            openai_api_version=os.getenv("EMB_OPENAI_API_VERSION"),
-        )
-        self.faiss_index_file = "./data/vectorstore/faiss_index"
-        self.vectorstore = FAISS.load_local(
-            folder_path=self.faiss_index_file,
-            embeddings=self.embedding_function,
-            allow_dangerous_deserialization=True
+    def __init__(self, embedding_function=None, ai_client=None):
+        """
+        Args:
+            embedding_function (Embeddings, optional): Embeddings to use instead of the ones configured by the environment.
+            ai_client (BaseChatModel, optional): Chat model to use instead of the Azure OpenAI deployment.
+        """
+        # Azure OpenAI or local embeddings, behind a cache of the texts already embedded
+        self.embedding_function = embedding_function or create_embeddings()
+        self.faiss_index_file = os.getenv("VECTORSTORE_PATH", "./data/vectorstore/faiss_index")
+        flush_interval = float(os.getenv("VECTORSTORE_FLUSH_INTERVAL", 300))
+        flush_size = int(os.getenv("VECTORSTORE_FLUSH_SIZE", 1000))
+        # FTS5 index of the product names and descriptions, whose metadata also serve to pre-filter in SQL
+        self.lexical_index = LexicalIndex(os.getenv("RAG_LEXICAL_INDEX_PATH", "./data/vectorstore/lexical.db"))
+        self.docstore_positions = None
+        self.shared = None
+        # FAISS indexes are not thread-safe: every mutation of the in-memory vectorstore, and every search
+        # of it from the threads of the threadpool, holds this lock
+        self.lock = threading.RLock()
+        if os.getenv("VECTORSTORE_MODE", "local").lower() == "shared":
+            # Several processes (e.g. uvicorn --workers) search the same memory-mapped generations of the
+            # vectorstore, and a single writer process applies the mutations
+            self.persistence = None
+            self.shared = SharedVectorstore(
+                self.faiss_index_file,
+                self.embedding_function,
+                self.lexical_index,
+                on_generation=self.set_vectorstore,
+                refresh_interval=float(os.getenv("VECTORSTORE_REFRESH_INTERVAL", 1)),
+                flush_interval=flush_interval,
+                flush_size=flush_size,
+                publish_interval=float(os.getenv("VECTORSTORE_PUBLISH_INTERVAL", 10))
+            )
+        else:
+            self.persistence = VectorstorePersistence(
+                self.faiss_index_file, self.embedding_function, flush_interval, flush_size, lock=self.lock
+            )
+            self.vectorstore = self.persistence.load()
+            if self.lexical_index.count() != len(self.vectorstore.index_to_docstore_id):
+                self.lexical_index.rebuild(self.documents())
+            self.persistence.start(self.vectorstore)
+        # The generations of the shared mode are immutable, so their searches need no lock
+        self.search_lock = self.lock if self.shared is None else contextlib.nullcontext()
+        self.hybrid = os.getenv("RAG_HYBRID", "true").lower() == "true"
+        self.prefilter_limit = int(os.getenv("RAG_PREFILTER_LIMIT", 20000))
+        self.filter_cache = TTLCache(
+            maxsize=int(os.getenv("RAG_FILTER_CACHE_SIZE", 1024)),
+            ttl=float(os.getenv("RAG_FILTER_CACHE_TTL", 3600))
         )
-        self.ai_client = AzureChatOpenAI(
+        self.rule_based_filters = os.getenv("RAG_RULE_BASED_FILTERS", "false").lower() == "true"
+        self.ai_client = ai_client or AzureChatOpenAI(
             azure_endpoint=os.getenv("OPENAI_ENDPOINT"),
             api_key=os.getenv("OPENAI_API_KEY"),
             deployment_name=os.getenv("OPENAI_DEPLOIMENT_MODEL"),
             api_version=os.getenv("OPENAI_API_VERSION")
         )
+        self.top_k = int(os.getenv("RAG_TOP_K", 10))
+        self.fetch_k = int(os.getenv("RAG_FETCH_K", 40))
+        # Deepest result a page can reach, so that paginating never scores the whole catalog
+        self.max_results = int(os.getenv("RAG_MAX_RESULTS", 200))
+        score_threshold = os.getenv("RAG_SCORE_THRESHOLD")
+        self.score_threshold = float(score_threshold) if score_threshold else None
+        # Limits the RAG requests running concurrently on the event loop
+        self.semaphore = asyncio.Semaphore(int(os.getenv("RAG_MAX_CONCURRENCY", 8)))
 
         self.app = self.set_chatbot_workflow()
 
     def set_chatbot_workflow(self):
         workflow = StateGraph(state_schema=MessagesState)
 
-        workflow.add_node("model", self.call_model)
+        workflow.add_node("model", RunnableLambda(self.call_model, afunc=self.acall_model))
         workflow.add_edge(START, "model")
 
-        # Add simple in-memory checkpointer
-        memory = MemorySaver()
-        app = workflow.compile(checkpointer=memory)
+        # Checkpointer that evicts idle conversation threads, in memory or in SQLite
+        self.checkpointer = create_checkpointer()
+        app = workflow.compile(checkpointer=self.checkpointer)
 
         return app
+
+    def set_vectorstore(self, vectorstore):
+        self.vectorstore = vectorstore
+        self.docstore_positions = None
+
+    def close(self):
+        """
+        Persists the vectorstore before the process exits: takes a snapshot of the logged mutations or,
+        in the shared mode, stops synchronizing and lets the writer publish the queued mutations.
+        """
+        if self.shared is not None:
+            self.shared.close()
+        else:
+            self.persistence.stop()
+            self.persistence.snapshot(self.vectorstore)
+
+    def embedding_cache_stats(self):
+        """
+        Returns:
+            dict: Statistics of the embedding cache, or None if the embeddings are not cached.
+        """
+        if isinstance(self.embedding_function, CachedEmbeddings):
+            return self.embedding_function.stats()
+        return None
+
+    def documents(self):
+        """
+        Yields the docstore id and the Document of every vector of the vectorstore.
+        """
+        for docstore_id in self.vectorstore.index_to_docstore_id.values():
+            yield docstore_id, self.vectorstore.docstore.search(docstore_id)
+
+    def get_docstore_positions(self):
+        """
+        Returns:
+            dict: Position in the FAISS index of each docstore id.
+        """
+        positions = self.docstore_positions
+        if positions is None or len(positions) != self.vectorstore.index.ntotal:
+            positions = {docstore_id: position for position, docstore_id in self.vectorstore.index_to_docstore_id.items()}
+            self.docstore_positions = positions
+        return positions
     
     def add_data(self, data: dict):
-        text = f"Producto: {data['name']}. Color: {data['color']}. Precio: {data['price']}. Descripción: {data['description']}."
-        metadata = {"id": data['id'], "color": data['color'], "price": data['price']}
-        self.vectorstore.add_texts(
-            texts=[text],
-            metadatas=[metadata]
+        self.add_data_bulk([data])
+
+    def add_data_bulk(self, data_list: list):
+        """
+        Adds several products to the vectorstore embedding all their texts in a single batched call.
+
+        Args:
+            data_list (list): Products to add, each a dict with id, name, color, price and description.
+
+        Returns:
+            int: Number of vectors added to the vectorstore.
+        """
+        if not data_list:
+            return 0
+        texts = [
+            f"Producto: {data['name']}. Color: {data['color']}. Precio: {data['price']}. Descripción: {data['description']}."
+            for data in data_list
+        ]
+        metadatas = [{"id": data['id'], "color": data['color'], "price": data['price']} for data in data_list]
+        names = [data['name'] for data in data_list]
+        descriptions = [data['description'] for data in data_list]
+        with span("embedding"):
+            embeddings = self.embedding_function.embed_documents(texts)
+        ids = [str(uuid.uuid4()) for _ in texts]
+        if self.shared is not None:
+            # Queued for the writer, and searchable once it publishes the next generation
+            self.shared.add(ids, texts, embeddings, metadatas, names, descriptions)
+            logger.info("%d productos encolados para el vectorstore compartido.", len(ids), extra={"stage": "vectorstore_add", "documents": len(ids)})
+            return len(ids)
+        with self.lock:
+            self.persistence.apply(self.vectorstore, {
+                "op": "add", "ids": ids, "texts": texts, "embeddings": embeddings,
+                "metadatas": metadatas
+            })
+            self.lexical_index.add(ids, metadatas, names, descriptions)
+            self.docstore_positions = None
+        logger.info(
+            "%d productos han sido añadidos al vectorstore (IDs %s a %s).", len(ids), data_list[0]["id"], data_list[-1]["id"],
+            extra={"stage": "vectorstore_add", "documents": len(ids)}
         )
-        print(
-            f"El producto con ID {data['id']} ha sido añadido al vectorstore.")
+
+        return len(ids)
 
     def drop_data(self, filters: dict):
-        documents = self.vectorstore.similarity_search(
-            " ", k=len(self.vectorstore.index))
-        # Filtrar documentos que no coincidan con los filtros
-        filtered_documents = [
-            doc for doc in documents
-            if not all(doc.metadata.get(key) == value for key, value in filters.items())
-        ]
+        """
+        Removes from the vectorstore the documents whose metadata match all the filters.
+
+        The matching documents are looked up in the lexical index when the filters are on indexed metadata,
+        and their vectors are removed in place from the FAISS index, so the remaining embeddings are kept
+        and nothing is re-embedded.
+
+        In the shared mode the removal is queued for the writer, which looks the documents up, so
+        0 is returned.
+
+        Args:
+            filters (dict): Metadata values a document must match to be removed (e.g. {"id": 3}).
+
+        Returns:
+            int: Number of vectors removed from the vectorstore.
+        """
+        if self.shared is not None:
+            self.shared.drop(filters)
+            logger.info(
+                "Eliminación de los documentos que cumplen los filtros %s encolada para el vectorstore compartido.", filters,
+                extra={"stage": "vectorstore_remove"}
+            )
+            return 0
+
+        with self.lock:
+            docstore_ids = matching_documents(self.lexical_index, self.vectorstore, filters)
 
-        # Reconstruir el vectorstore sin los documentos eliminados
-        texts = [doc.page_content for doc in filtered_documents]
-        metadatas = [doc.metadata for doc in filtered_documents]
+            if docstore_ids:
+                self.persistence.apply(self.vectorstore, {"op": "remove", "ids": docstore_ids})
+                self.lexical_index.remove(docstore_ids)
+                self.docstore_positions = None
 
-        # Crear un nuevo vectorstore
-        self.vectorstore = FAISS.from_texts(
-            texts=texts,
-            embedding=self.embedding_function,
-            metadatas=metadatas
+        logger.info(
+            "%d documentos que cumplen los filtros %s han sido eliminados del vectorstore.", len(docstore_ids), filters,
+            extra={"stage": "vectorstore_remove", "documents": len(docstore_ids)}
         )
 
-        print(
-            f"Los datos que cumplen los filtros {filters} han sido eliminados del vectorstore.")
+        return len(docstore_ids)
         
-    def retrieve_data(self, query: str):
-        total_len_doc = self.vectorstore.index.ntotal
-        print(f"total_len_doc:{total_len_doc}")
+    def normalize_query(self, query: str):
+        """
+        Normalizes a query so that near-identical queries share the same filter cache key.
 
+        Lowercases, strips accents and punctuation (keeping decimal separators and comparison signs)
+        and collapses whitespace.
+        """
+        query = unicodedata.normalize("NFKD", query.lower())
+        query = "".join(char for char in query if not unicodedata.combining(char))
+        query = re.sub(r"[^\w\s.,<>=]|(?<!\d)[.,]|[.,](?!\d)", " ", query)
+        return " ".join(query.split())
+
+    def extract_rule_based_filters(self, query: str):
+        """
+        Extracts color and price filters from a normalized query without calling the LLM.
+
+        Args:
+            query (str): Normalized query.
+
+        Returns:
+            dict: Metadata filter, empty if no color or price was recognised.
+        """
+        filters = {}
+        colors = {COLORS[word] for word in query.split() if word in COLORS}
+        if len(colors) == 1:
+            filters["color"] = colors.pop()
+        elif colors:
+            filters["color"] = {"$in": sorted(colors)}
+
+        price = {}
+        for pattern, operator in PRICE_PATTERNS:
+            match = pattern.search(query)
+            if match:
+                price[operator] = float(match.group(1).replace(",", "."))
+        if price:
+            filters["price"] = price
+
+        return filters
+
+    def get_filters(self, query: str):
+        """
+        Turns a query into the metadata filter used in the similarity search.
+
+        The filter is looked up in an LRU/TTL cache keyed by the normalized query. On a miss it is
+        extracted with rules when the rule-based fast path is enabled and recognises a color or price,
+        and otherwise generated by the LLM.
+
+        Args:
+            query (str): Query of the user.
+
+        Returns:
+            dict: Metadata filter, or None if no filter applies.
+        """
+        key, filters = self.known_filters(query)
+        if filters is None:
+            filters = self.generate_filters(query)
+            self.filter_cache.set(key, json.dumps(filters))
+        return filters
+
+    async def aget_filters(self, query: str):
+        """
+        Asynchronous version of get_filters.
+        """
+        key, filters = self.known_filters(query)
+        if filters is None:
+            filters = await self.agenerate_filters(query)
+            self.filter_cache.set(key, json.dumps(filters))
+        return filters
+
+    def known_filters(self, query: str):
+        """
+        Looks the filter of a query up in the cache, and otherwise extracts it with rules if enabled.
+
+        Returns:
+            tuple: Normalized query, used as cache key, and its filter, or None if the LLM has to generate it.
+        """
+        key = self.normalize_query(query)
+        filters = self.filter_cache.get(key)
+        if filters is not None:
+            return key, json.loads(filters)
+
+        filters = self.extract_rule_based_filters(key) if self.rule_based_filters else None
+        if not filters:
+            return key, None
+        self.filter_cache.set(key, json.dumps(filters))
+        return key, filters
+
+    def filters_chain(self):
         prompt = ChatPromptTemplate.from_messages(
             [
                 SystemMessage(
@@ -94,35 +363,204 @@ class RAGManager:
             ]
         )
 
-        chain = prompt | self.ai_client
+        return prompt | self.ai_client
 
-        filters = chain.invoke(
-            {
-                "messages": [
-                    HumanMessage(
-                        content=f"Pregunta: {query}"
+    def filters_input(self, query: str):
+        return {"messages": [HumanMessage(content=f"Pregunta: {query}")]}
+
+    def parse_filters(self, filters):
+        logger.debug("Filtros generados: %s", filters.content, extra={"stage": "filter_llm"})
+
+        return json.loads(filters.content)
+
+    def generate_filters(self, query: str):
+        with span("filter_llm"):
+            filters = self.filters_chain().invoke(self.filters_input(query))
+        return self.parse_filters(filters)
+
+    async def agenerate_filters(self, query: str):
+        with span("filter_llm"):
+            filters = await self.filters_chain().ainvoke(self.filters_input(query))
+        return self.parse_filters(filters)
+
+    def search_by_vector(self, embedding: list, k: int, filters: dict = None):
+        """
+        Returns the k documents most similar to an embedding that match the filters.
+
+        Filtered searches fetch `fetch_k` candidates and only widen the fetch (doubling it up to the
+        size of the index) while fewer than k candidates pass the filters. Documents farther than the
+        configured score threshold are discarded.
+
+        Args:
+            embedding (list): Embedding of the query.
+            k (int): Maximum number of documents to return.
+            filters (dict, optional): Metadata filter.
+
+        Returns:
+            list: The matching documents, most similar first.
+        """
+        with self.search_lock:
+            ntotal = self.vectorstore.index.ntotal
+            k = min(k, ntotal)
+            if k <= 0:
+                return []
+
+            fetch_k = min(max(self.fetch_k, k), ntotal)
+            while True:
+                with span("faiss_search"):
+                    result = self.vectorstore.similarity_search_with_score_by_vector(
+                        embedding, k=k, filter=filters, fetch_k=fetch_k, score_threshold=self.score_threshold
                     )
-                ],
-            }
-        )
-        
-        print(filters.content)
-        print(type(filters.content))
+                if filters is None or len(result) >= k or fetch_k >= ntotal:
+                    break
+                fetch_k = min(fetch_k * 2, ntotal)
 
-        filters = json.loads(filters.content)
-        print(filters)
-        print(type(filters))
-        if filters is not None:
-            result = self.vectorstore.similarity_search(
-                query, k=total_len_doc, filter=filters
-            )
-            print(f"filtros: {filters}")
+        return [doc for doc, score in result]
+
+    def search_candidates(self, embedding: list, docstore_ids: list, k: int):
+        """
+        Returns the k documents among some candidates most similar to an embedding.
+
+        Only the vectors of the candidates are compared with the embedding: they are reconstructed from
+        the FAISS index into a temporary flat index with the same metric, instead of searching the whole
+        index and discarding the documents that do not match the filters.
+
+        Args:
+            embedding (list): Embedding of the query.
+            docstore_ids (list): Docstore ids of the candidates.
+            k (int): Maximum number of documents to return.
+
+        Returns:
+            list: The most similar candidates, most similar first.
+        """
+        with self.search_lock:
+            # Kept for the whole search, as the shared mode may swap in a new generation meanwhile
+            vectorstore = self.vectorstore
+            if self.shared is not None:
+                positions = vectorstore.docstore.positions(docstore_ids)
+            else:
+                positions = self.get_docstore_positions()
+            candidates = np.array([positions[docstore_id] for docstore_id in docstore_ids if docstore_id in positions], dtype=np.int64)
+            if len(candidates) == 0 or k <= 0:
+                return []
+
+            with span("faiss_search"):
+                index = faiss.IndexFlat(vectorstore.index.d, vectorstore.index.metric_type)
+                index.add(vectorstore.index.reconstruct_batch(candidates))
+                scores, indices = index.search(np.array([embedding], dtype=np.float32), min(k, len(candidates)))
+
+            inner_product = vectorstore.index.metric_type == faiss.METRIC_INNER_PRODUCT
+            result = []
+            for score, i in zip(scores[0], indices[0]):
+                if self.score_threshold is not None and (score < self.score_threshold if inner_product else score > self.score_threshold):
+                    continue
+                result.append(vectorstore.docstore.search(vectorstore.index_to_docstore_id[int(candidates[i])]))
+            return result
+
+    def hybrid_search(self, query: str, embedding: list, k: int, filters: dict = None):
+        """
+        Returns the k documents most relevant to a query, fusing vector and lexical rankings.
+
+        A filter that can be evaluated in SQL selects the candidates in the lexical index first, and
+        if there are at most RAG_PREFILTER_LIMIT of them only their vectors are compared with the query;
+        otherwise the FAISS search applies the filter. The vector ranking and the BM25 ranking of the
+        names and descriptions are merged with reciprocal rank fusion.
+
+        Args:
+            query (str): Query of the user.
+            embedding (list): Embedding of the query.
+            k (int): Maximum number of documents to return.
+            filters (dict, optional): Metadata filter.
+
+        Returns:
+            list: The most relevant documents, most relevant first.
+        """
+        fetch_k = max(self.fetch_k, k)
+        with span("lexical_search"):
+            candidates = self.lexical_index.candidates(filters) if filters else None
+        if candidates is not None and len(candidates) <= self.prefilter_limit:
+            vector_result = self.search_candidates(embedding, candidates, fetch_k)
         else:
-            result = self.vectorstore.similarity_search(
-                query, k=total_len_doc
-            )
-        print(result)
+            vector_result = self.search_by_vector(embedding, fetch_k, filters)
+        with span("lexical_search"):
+            lexical_ids = self.lexical_index.search(query, fetch_k, filters)
+        # The lexical index may already have documents of a generation not published yet (shared mode)
+        with self.search_lock:
+            lexical_result = [
+                doc for doc in map(self.vectorstore.docstore.search, lexical_ids) if isinstance(doc, Document)
+            ]
 
+        documents = {}
+        rankings = []
+        for result in (vector_result, lexical_result):
+            rankings.append([doc.metadata["id"] for doc in result])
+            for doc in result:
+                documents.setdefault(doc.metadata["id"], doc)
+        return [documents[product_id] for product_id in reciprocal_rank_fusion(rankings)[:k]]
+
+    def search(self, query: str, embedding: list, k: int, filters: dict = None):
+        """
+        Returns the k documents most relevant to a query, with the hybrid search unless RAG_HYBRID is false.
+        """
+        if self.hybrid:
+            return self.hybrid_search(query, embedding, k, filters)
+        return self.search_by_vector(embedding, k, filters)
+
+    def retrieve_data(self, query: str, k: int = None, offset: int = 0):
+        """
+        Retrieves the documents relevant to a query.
+
+        Args:
+            query (str): Query of the user.
+            k (int, optional): Number of documents to return. Defaults to RAG_TOP_K.
+            offset (int): Number of most relevant documents to skip, to paginate the results. Nothing
+                beyond the RAG_MAX_RESULTS most relevant documents is returned.
+
+        Returns:
+            tuple: Ids and texts of the documents.
+        """
+        depth = self.result_depth(k, offset)
+        if depth <= offset:
+            return self.format_results([])
+        filters = self.get_filters(query)
+        with span("embedding"):
+            embedding = self.embedding_function.embed_query(query)
+        result = self.search(query, embedding, depth, filters)
+        logger.debug("filtros: %s", filters, extra={"stage": "retrieval"})
+
+        return self.format_results(result[offset:])
+
+    async def aretrieve_data(self, query: str, k: int = None, offset: int = 0):
+        """
+        Asynchronous version of retrieve_data that does not block the event loop.
+
+        The filter and the query embedding are requested concurrently with `ainvoke`/`aembed_query`,
+        and the FAISS search runs in the default thread pool. At most RAG_MAX_CONCURRENCY requests
+        run the pipeline at the same time.
+        """
+        async with self.semaphore:
+            return await self._aretrieve_data(query, k, offset)
+
+    async def _aretrieve_data(self, query: str, k: int = None, offset: int = 0):
+        depth = self.result_depth(k, offset)
+        if depth <= offset:
+            return self.format_results([])
+        filters, embedding = await asyncio.gather(
+            self.aget_filters(query),
+            timed("embedding", self.embedding_function.aembed_query(query))
+        )
+        result = await asyncio.to_thread(self.search, query, embedding, depth, filters)
+
+        return self.format_results(result[offset:])
+
+    def result_depth(self, k: int, offset: int):
+        """
+        Returns:
+            int: Number of most relevant documents to search to return k of them after offset, at most RAG_MAX_RESULTS.
+        """
+        return min(max(offset, 0) + (k or self.top_k), self.max_results)
+
+    def format_results(self, result: list):
         output_ids = []
         output_text = []
         for doc in result:
@@ -131,45 +569,63 @@ class RAGManager:
 
         return output_ids, output_text
     
-    def call_model(self, state: MessagesState):
-        system_prompt = (
-            "You are a helpful assistant. "
-            "Answer all questions to the best of your ability. "
-            "The provided chat history includes a summary of the earlier conversation."
-        )
-
-        system_message = SystemMessage(content=system_prompt)
+    def summary_request(self, state: MessagesState):
+        """
+        Returns:
+            list: Messages asking the model to summarize the chat history, or None if it is still short.
+        """
         message_history = state["messages"][:-1]  # exclude the most recent user input
-        # Summarize the messages if the chat history reaches a certain size
-        if len(message_history) >= 4:
-            last_human_message = state["messages"][-1]
-            # Invoke the model to generate conversation summary
-            summary_prompt = (
-                "Distill the above chat messages into a single summary message. "
-                "Include as many specific details as you can."
-            )
-            summary_message = self.ai_client.invoke(
-                message_history + [HumanMessage(content=summary_prompt)]
-            )
+        if len(message_history) < 4:
+            return None
+        return message_history + [HumanMessage(content=SUMMARY_PROMPT)]
 
-            # Delete messages that we no longer want to show up
-            delete_messages = [RemoveMessage(id=m.id) for m in state["messages"]]
-            # Re-add user message
-            human_message = HumanMessage(content=last_human_message.content)
-            # Call the model with summary & response
-            response = self.ai_client.invoke([system_message, summary_message, human_message])
-            message_updates = [summary_message, human_message, response] + delete_messages
-        else:
-            message_updates = self.ai_client.invoke([system_message] + state["messages"])
+    def model_messages(self, state: MessagesState, summary_message=None):
+        """
+        Returns:
+            list: Messages sent to the model: the system prompt, then the chat history or its summary
+            followed by the user input.
+        """
+        system_message = SystemMessage(content=SYSTEM_PROMPT)
+        if summary_message is None:
+            return [system_message] + state["messages"]
+        # Re-add user message after the summary
+        return [system_message, summary_message, HumanMessage(content=state["messages"][-1].content)]
 
-        return {"messages": message_updates}
+    def model_updates(self, state: MessagesState, messages: list, response, summary_message=None):
+        """
+        Returns:
+            dict: Update of the graph state with the answer; a summarized history replaces the previous messages.
+        """
+        if summary_message is None:
+            return {"messages": response}
+        # Delete messages that we no longer want to show up
+        delete_messages = [RemoveMessage(id=m.id) for m in state["messages"]]
+        return {"messages": [summary_message, messages[-1], response] + delete_messages}
 
-    def chatbot(self, query: str, thread_number):
-        output_ids, output_text = self.retrieve_data(query)
-        print(f"output_text: {output_text}")
-        print(f"output_ids: {output_ids}")
+    def call_model(self, state: MessagesState):
+        with span("chat_llm"):
+            # Summarize the messages if the chat history reaches a certain size
+            summary_request = self.summary_request(state)
+            summary_message = self.ai_client.invoke(summary_request, config=SUMMARY_CONFIG) if summary_request else None
+            messages = self.model_messages(state, summary_message)
+            response = self.ai_client.invoke(messages)
+
+        return self.model_updates(state, messages, response, summary_message)
+
+    async def acall_model(self, state: MessagesState):
+        """
+        Asynchronous version of call_model, used by the workflow when it is run with `ainvoke`.
+        """
+        with span("chat_llm"):
+            summary_request = self.summary_request(state)
+            summary_message = await self.ai_client.ainvoke(summary_request, config=SUMMARY_CONFIG) if summary_request else None
+            messages = self.model_messages(state, summary_message)
+            response = await self.ai_client.ainvoke(messages)
+
+        return self.model_updates(state, messages, response, summary_message)
 
-        query = f"""Base de datos a usar para la respuesta obtenida por RAG: {output_text}.
+    def chatbot_prompt(self, query: str, output_ids: list, output_text: list):
+        return f"""Base de datos a usar para la respuesta obtenida por RAG: {output_text}.
         Los ids de los elementos de la base de datos son: {output_ids}.
         Necesito que devuelvas los elementos recuperados de la base de datos con formato HTML, por ejemplo:
          
@@ -179,7 +635,12 @@ class RAGManager:
         El contenido del id es el id de los elementos de la base de datos. Si la pregunta no esta relacionada con la base de datos responde a la pregunta sin devolver ningún elemento de la base de datos. Si la pregunta esta relacionada con la base de datos responde a la pregunta devolviendo los elementos de la base de datos. Si la pregunta está relacionada con la base de datos pero no tienes elementos de la base de datos obtenido por RAG, responde educadamente que no tienes elementos con las características deseadas.
         
         Pregunta: {query}"""
-        print(query)
+
+    def chatbot(self, query: str, thread_number):
+        output_ids, output_text = self.retrieve_data(query)
+        logger.debug("output_ids: %s", output_ids, extra={"stage": "retrieval", "chat_thread": thread_number, "ids": output_ids})
+
+        query = self.chatbot_prompt(query, output_ids, output_text)
 
         output_prompt = self.app.invoke(
             {
@@ -189,3 +650,55 @@ class RAGManager:
         )
 
         return output_prompt["messages"][-1].content
+
+    async def achatbot(self, query: str, thread_number):
+        """
+        Asynchronous version of chatbot that does not block the event loop.
+        """
+        async with self.semaphore:
+            output_ids, output_text = await self._aretrieve_data(query)
+            logger.debug("output_ids: %s", output_ids, extra={"stage": "retrieval", "chat_thread": thread_number, "ids": output_ids})
+
+            query = self.chatbot_prompt(query, output_ids, output_text)
+
+            output_prompt = await self.app.ainvoke(
+                {"messages": [HumanMessage(content=query)]},
+                config={"configurable": {"thread_id": f"{thread_number}"}},
+            )
+
+        return output_prompt["messages"][-1].content
+
+    async def astream_chatbot(self, query: str, thread_number):
+        """
+        Streaming version of achatbot.
+
+        Yields the tokens of the answer as they are generated by the model, and the ids enclosed in
+        <product> and <collection> tags as soon as their closing tag has been generated.
+
+        Yields:
+            tuple: (event, data) where event is "token", "product" or "collection".
+        """
+        async with self.semaphore:
+            output_ids, output_text = await self._aretrieve_data(query)
+            logger.debug("output_ids: %s", output_ids, extra={"stage": "retrieval", "chat_thread": thread_number, "ids": output_ids})
+
+            query = self.chatbot_prompt(query, output_ids, output_text)
+
+            answer = ""
+            parsed = 0
+            async for message, metadata in self.app.astream(
+                {"messages": [HumanMessage(content=query)]},
+                config={"configurable": {"thread_id": f"{thread_number}"}},
+                stream_mode="messages",
+            ):
+                # Only the tokens of the answer: the messages the node returns (the summary and the
+                # re-added prompt) are emitted as whole messages, not chunks
+                if metadata.get("langgraph_node") != "model" or not isinstance(message, AIMessageChunk) or not message.content:
+                    continue
+                answer += message.content
+                yield "token", message.content
+
+                start = parsed
+                for match in re.finditer(r"<(product|collection)>\s*([^<]+?)\s*</\1>", answer[start:]):
+                    yield match.group(1), match.group(2)
+                    parsed = start + match.end()
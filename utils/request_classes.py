@@ -1,8 +1,10 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class RetriveRequest(BaseModel):
     query: str
+    page: int = Field(0, ge=0)
+    page_size: int = Field(10, gt=0, le=50)
 
 class GetProduct(BaseModel):
     id: int
@@ -15,6 +17,13 @@ class AddProduct(BaseModel):
     color: str
     price: float
     description: str
+    image: str = None
 
 class Chatbot(BaseModel):
-    text: str
\ No newline at end of file
+    text: str
+    # Returned by the first answer of a conversation; None starts a new one
+    thread: str = Field(None, min_length=1, max_length=128)
+
+class ExplainQuery(BaseModel):
+    table_name: str
+    filters: dict = {}
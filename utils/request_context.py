@@ -0,0 +1,16 @@
+from contextvars import ContextVar
+import threading
+
+# Kept apart from database_manager so that the middlewares and dependency providers can use them
+# without importing SQLAlchemy and pandas when the application starts
+
+# Identifies the request being served, so that each request gets its own session
+request_scope = ContextVar("request_scope", default=None)
+
+
+def session_scope():
+    return request_scope.get() or threading.get_ident()
+
+
+# Counter of the catalog queries run while serving the current request, set by the middleware in main.py
+catalog_queries = ContextVar("catalog_queries", default=None)
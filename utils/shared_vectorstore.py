@@ -0,0 +1,439 @@
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_community.docstore.base import Docstore
+from langchain_core.documents import Document
+from collections.abc import Mapping
+from utils.vectorstore_persistence import VectorstorePersistence, VECTORS_FILE, DOCSTORE_FILE, SETTINGS_FILE
+from utils.lexical_index import matching_documents
+import numpy as np
+import faiss
+import threading
+import operator
+import sqlite3
+import time
+import json
+import os
+import logging
+
+try:
+    # POSIX only: the shared mode elects its writer with an advisory lock on a file
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class MappedFlatIndex:
+    """
+    Read-only flat index over the memory-mapped vectors of a generation.
+
+    The vectors are searched in place with faiss.knn, so every process reading the same generation
+    shares its pages through the page cache instead of holding its own copy of the index.
+    """
+
+    def __init__(self, path: str, metric_type: int):
+        """
+        Args:
+            path (str): Path of the .npy file of the vectors.
+            metric_type (int): FAISS metric of the index the vectors come from.
+        """
+        self.vectors = np.load(path, mmap_mode="r")
+        self.ntotal, self.d = self.vectors.shape
+        self.metric_type = metric_type
+
+    def search(self, x, k: int):
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        if self.ntotal == 0:
+            return np.full((len(x), k), np.nan, dtype=np.float32), np.full((len(x), k), -1, dtype=np.int64)
+        return faiss.knn(x, self.vectors, k, metric=self.metric_type)
+
+    def reconstruct_batch(self, positions):
+        return np.asarray(self.vectors[positions])
+
+    def reconstruct_n(self, start: int, count: int):
+        return np.asarray(self.vectors[start:start + count])
+
+
+class GenerationDocstore(Docstore):
+    """
+    Read-only docstore of a generation, stored in SQLite by the position of each document in the index.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): Path of the docstore.db file of the generation.
+        """
+        # The files of a generation never change once published, so SQLite can skip locking them
+        self.connection = sqlite3.connect(f"file:{path}?mode=ro&immutable=1", uri=True, check_same_thread=False)
+        self.lock = threading.Lock()
+
+    def search(self, search: str):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT page_content, metadata FROM documents WHERE docstore_id = ?", (search,)
+            ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(id=search, page_content=row[0], metadata=json.loads(row[1]))
+
+    def docstore_id(self, position: int):
+        with self.lock:
+            row = self.connection.execute("SELECT docstore_id FROM documents WHERE position = ?", (position,)).fetchone()
+        if row is None:
+            raise KeyError(position)
+        return row[0]
+
+    def documents(self, positions: list):
+        """
+        Returns:
+            dict: Document at each of the positions found in the generation, read with one query per batch.
+        """
+        documents = {}
+        with self.lock:
+            for start in range(0, len(positions), 500):
+                chunk = positions[start:start + 500]
+                rows = self.connection.execute(
+                    f"SELECT position, docstore_id, page_content, metadata FROM documents WHERE position IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                documents.update(
+                    (position, Document(id=docstore_id, page_content=page_content, metadata=json.loads(metadata)))
+                    for position, docstore_id, page_content, metadata in rows
+                )
+        return documents
+
+    def positions(self, docstore_ids: list):
+        """
+        Returns:
+            dict: Position in the index of each of the docstore ids found in the generation.
+        """
+        positions = {}
+        with self.lock:
+            for start in range(0, len(docstore_ids), 500):
+                chunk = docstore_ids[start:start + 500]
+                positions.update(self.connection.execute(
+                    f"SELECT docstore_id, position FROM documents WHERE docstore_id IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall())
+        return positions
+
+    def close(self):
+        self.connection.close()
+
+
+class GenerationIds(Mapping):
+    """
+    index_to_docstore_id of a generation, read from its docstore instead of being held in memory.
+    """
+
+    def __init__(self, docstore: GenerationDocstore, ntotal: int):
+        self.docstore = docstore
+        self.ntotal = ntotal
+
+    def __getitem__(self, position):
+        return self.docstore.docstore_id(int(position))
+
+    def __len__(self):
+        return self.ntotal
+
+    def __iter__(self):
+        return iter(range(self.ntotal))
+
+
+class GenerationFAISS(FAISS):
+    """
+    FAISS vectorstore of a generation, which reads the documents of the positions returned by a search in batches.
+
+    The base search looks each position up in index_to_docstore_id and then in the docstore, i.e. two
+    SQLite queries per position, so a filtered search with a large `fetch_k` costs one query per vector.
+    """
+
+    def similarity_search_with_score_by_vector(self, embedding: list, k: int = 4, filter=None, fetch_k: int = 20, **kwargs):
+        vector = np.array([embedding], dtype=np.float32)
+        if self._normalize_L2:
+            faiss.normalize_L2(vector)
+        scores, indices = self.index.search(vector, k if filter is None else fetch_k)
+        positions = [int(i) for i in indices[0] if i != -1]
+        documents = self.docstore.documents(positions)
+        filter_func = self._create_filter_func(filter) if filter is not None else None
+
+        docs = []
+        for score, position in zip(scores[0], indices[0]):
+            if position == -1:
+                continue
+            doc = documents.get(int(position))
+            if doc is None:
+                raise ValueError(f"Could not find document for position {position}")
+            if filter_func is None or filter_func(doc.metadata):
+                docs.append((doc, score))
+
+        score_threshold = kwargs.get("score_threshold")
+        if score_threshold is not None:
+            cmp = (
+                operator.ge
+                if self.distance_strategy in (DistanceStrategy.MAX_INNER_PRODUCT, DistanceStrategy.JACCARD)
+                else operator.le
+            )
+            docs = [(doc, score) for doc, score in docs if cmp(score, score_threshold)]
+        return docs[:k]
+
+
+def load_generation(path: str, embedding_function):
+    """
+    Opens a generation read-only, with its vectors memory-mapped and its documents in SQLite.
+
+    Args:
+        path (str): Folder of the generation.
+        embedding_function: Embeddings of the queries.
+
+    Returns:
+        GenerationFAISS: Vectorstore of the generation, which only supports searches.
+    """
+    with open(os.path.join(path, SETTINGS_FILE)) as file:
+        settings = json.load(file)
+    index = MappedFlatIndex(os.path.join(path, VECTORS_FILE), settings["metric_type"])
+    docstore = GenerationDocstore(os.path.join(path, DOCSTORE_FILE))
+    return GenerationFAISS(
+        embedding_function,
+        index,
+        docstore,
+        GenerationIds(docstore, index.ntotal),
+        normalize_L2=settings["normalize_L2"],
+        distance_strategy=DistanceStrategy(settings["distance_strategy"])
+    )
+
+
+class MutationQueue:
+    """
+    Mutations of the vectorstore requested by any process and applied, in order, by the writer.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): Path of the SQLite file of the queue.
+        """
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.connection.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS mutations (seq INTEGER PRIMARY KEY AUTOINCREMENT, entry TEXT NOT NULL);
+            """
+        )
+
+    def put(self, entry: dict):
+        with self.lock, self.connection:
+            self.connection.execute("INSERT INTO mutations (entry) VALUES (?)", (json.dumps(entry),))
+
+    def take(self, limit: int = 100):
+        """
+        Returns:
+            list: The oldest mutations, as pairs of sequence number and entry. They stay queued until deleted.
+        """
+        with self.lock:
+            rows = self.connection.execute("SELECT seq, entry FROM mutations ORDER BY seq LIMIT ?", (limit,)).fetchall()
+        return [(seq, json.loads(entry)) for seq, entry in rows]
+
+    def delete(self, last_seq: int):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM mutations WHERE seq <= ?", (last_seq,))
+
+
+class VectorstoreWriter:
+    """
+    Single writer of a shared vectorstore: holds it in memory, applies the queued mutations to it and
+    publishes them as new generations.
+
+    Each generation is a full copy of the index, so the mutations are published together at most every
+    `publish_interval` seconds, or as soon as `flush_size` of them are waiting to be published.
+    """
+
+    def __init__(self, persistence: VectorstorePersistence, queue: MutationQueue, lexical_index, publish_interval: float = 10):
+        """
+        Args:
+            persistence (VectorstorePersistence): Persistence of the vectorstore, writing the shared files.
+            queue (MutationQueue): Queue of the mutations to apply.
+            lexical_index (LexicalIndex): Lexical index kept in sync with the vectorstore.
+            publish_interval (float): Minimum seconds between two published generations.
+        """
+        self.persistence = persistence
+        self.queue = queue
+        self.lexical_index = lexical_index
+        self.publish_interval = publish_interval
+        self.last_publish = time.monotonic()
+        self.vectorstore = persistence.load()
+        if lexical_index.count() != len(self.vectorstore.index_to_docstore_id):
+            lexical_index.rebuild(
+                (docstore_id, self.vectorstore.docstore.search(docstore_id))
+                for docstore_id in self.vectorstore.index_to_docstore_id.values()
+            )
+        if not persistence.published():
+            persistence.snapshot(self.vectorstore, force=True)
+
+    def apply(self, publish: bool = False):
+        """
+        Applies the queued mutations, in order, and publishes a new generation if any mutation is waiting
+        to be published and `publish_interval` seconds have passed since the last one.
+
+        Args:
+            publish (bool): Whether to publish the mutations waiting without waiting for `publish_interval`.
+
+        Returns:
+            int: Number of mutations applied.
+        """
+        applied = 0
+        while True:
+            mutations = self.queue.take()
+            if not mutations:
+                break
+            for seq, entry in mutations:
+                if entry["op"] == "add":
+                    self.persistence.apply(self.vectorstore, {key: entry[key] for key in ("op", "ids", "texts", "embeddings", "metadatas")})
+                    self.lexical_index.add(entry["ids"], entry["metadatas"], entry["names"], entry["descriptions"])
+                elif entry["op"] == "drop":
+                    docstore_ids = matching_documents(self.lexical_index, self.vectorstore, entry["filters"])
+                    if docstore_ids:
+                        self.persistence.apply(self.vectorstore, {"op": "remove", "ids": docstore_ids})
+                        self.lexical_index.remove(docstore_ids)
+                    logger.info(
+                        "%d documentos que cumplen los filtros %s han sido eliminados del vectorstore.", len(docstore_ids), entry["filters"],
+                        extra={"stage": "vectorstore_remove", "documents": len(docstore_ids)}
+                    )
+            # Already in the write-ahead log of the vectorstore, so they can leave the queue
+            self.queue.delete(mutations[-1][0])
+            applied += len(mutations)
+
+        pending = self.persistence.pending
+        if pending and (
+            publish or pending >= self.persistence.flush_size or time.monotonic() - self.last_publish >= self.publish_interval
+        ):
+            self.persistence.snapshot(self.vectorstore)
+            self.last_publish = time.monotonic()
+        return applied
+
+
+class SharedVectorstore:
+    """
+    Vectorstore shared by several processes (e.g. the workers of uvicorn), which keeps the memory used
+    roughly constant as the number of processes grows.
+
+    Every process searches the last published generation, opened read-only: its vectors are memory-mapped,
+    so their pages are shared through the page cache, and its documents are read from SQLite. The
+    mutations are queued, and a single writer process, elected with a lock on `WRITER.lock`, applies them
+    to its in-memory vectorstore and publishes them in a new generation at most every `publish_interval` seconds. The other processes notice the new
+    generation in `CURRENT` and swap it in atomically; searches already running finish on the previous one.
+    If the writer exits, another process takes the lock over and becomes the writer.
+    """
+
+    def __init__(self, folder_path: str, embedding_function, lexical_index, on_generation,
+                 refresh_interval: float = 1.0, timeout: float = 120, flush_interval: float = 300, flush_size: int = 1000,
+                 publish_interval: float = 10):
+        """
+        Args:
+            folder_path (str): Folder of the vectorstore.
+            embedding_function: Embeddings used to load the vectorstore and embed the queries.
+            lexical_index (LexicalIndex): Lexical index shared by the processes, updated by the writer.
+            on_generation (callable): Called with each generation opened, to start searching it.
+            refresh_interval (float): Seconds between checks for queued mutations and new generations.
+            timeout (float): Maximum seconds to wait for the writer to publish the first generation.
+            flush_interval (float): Maximum seconds between snapshots of the writer.
+            flush_size (int): Maximum number of mutations logged by the writer before a snapshot.
+            publish_interval (float): Minimum seconds between two generations published by the writer.
+        """
+        if fcntl is None:
+            raise RuntimeError("El modo compartido del vectorstore solo está disponible en sistemas POSIX.")
+        os.makedirs(folder_path, exist_ok=True)
+        self.persistence = VectorstorePersistence(
+            folder_path, embedding_function, flush_interval=flush_interval, flush_size=flush_size, shared=True, keep_generations=3
+        )
+        self.embedding_function = embedding_function
+        self.lexical_index = lexical_index
+        self.on_generation = on_generation
+        self.refresh_interval = refresh_interval
+        self.publish_interval = publish_interval
+        self.queue = MutationQueue(os.path.join(folder_path, "mutations.db"))
+        self.lock_file = open(os.path.join(folder_path, "WRITER.lock"), "a")
+        self.writer = None
+        self.generation = None
+        self.vectorstore = None
+        self.stopped = threading.Event()
+
+        deadline = time.monotonic() + timeout
+        while True:
+            self.elect()
+            self.refresh()
+            if self.vectorstore is not None:
+                break
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"No se ha publicado ninguna generación del vectorstore en {folder_path}.")
+            time.sleep(0.1)
+
+        self.thread = threading.Thread(target=self.run, name="shared-vectorstore", daemon=True)
+        self.thread.start()
+
+    def elect(self):
+        """
+        Makes this process the writer if no other process holds the writer lock.
+        """
+        if self.writer is not None:
+            return
+        try:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return
+        logger.info("Proceso %d elegido como escritor del vectorstore.", os.getpid(), extra={"stage": "vectorstore_writer", "pid": os.getpid()})
+        self.writer = VectorstoreWriter(self.persistence, self.queue, self.lexical_index, self.publish_interval)
+
+    def refresh(self):
+        """
+        Opens the last published generation if it is not the one being searched.
+        """
+        current = self.persistence.current()
+        if current is None or current["generation"] == self.generation:
+            return
+        path = os.path.join(self.persistence.folder_path, current["generation"])
+        try:
+            vectorstore = load_generation(path, self.embedding_function)
+        except FileNotFoundError:
+            # Not published for the shared mode yet, or already replaced by a newer generation
+            return
+        # The previous generation is closed by the garbage collector once no search is using it
+        self.vectorstore = vectorstore
+        self.generation = current["generation"]
+        self.on_generation(vectorstore)
+        logger.info(
+            "Generación %s del vectorstore abierta con %d vectores.", self.generation, vectorstore.index.ntotal,
+            extra={"stage": "vectorstore_refresh", "generation": self.generation}
+        )
+
+    def run(self):
+        while not self.stopped.wait(self.refresh_interval):
+            try:
+                self.elect()
+                if self.writer is not None:
+                    self.writer.apply()
+                self.refresh()
+            except Exception:
+                logger.exception("Error al sincronizar el vectorstore compartido", extra={"stage": "vectorstore_refresh"})
+
+    def add(self, ids: list, texts: list, embeddings: list, metadatas: list, names: list, descriptions: list):
+        self.queue.put({
+            "op": "add", "ids": ids, "texts": texts, "embeddings": [list(map(float, embedding)) for embedding in embeddings],
+            "metadatas": metadatas, "names": names, "descriptions": descriptions
+        })
+
+    def drop(self, filters: dict):
+        self.queue.put({"op": "drop", "filters": filters})
+
+    def close(self):
+        """
+        Stops synchronizing; the writer applies and publishes the mutations still queued and releases its lock.
+        """
+        self.stopped.set()
+        self.thread.join()
+        if self.writer is not None:
+            self.writer.apply(publish=True)
+            fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+            self.writer = None
+        self.lock_file.close()
@@ -0,0 +1,131 @@
+from langgraph.checkpoint.sqlite import SqliteSaver
+import asyncio
+import sqlite3
+import time
+
+
+class EvictingSqliteSaver(SqliteSaver):
+    """
+    SQLite LangGraph checkpointer that evicts idle conversation threads.
+
+    Conversations are stored in a SQLite file, so they survive restarts and are shared by every uvicorn
+    worker. The last access of each thread is kept in the `thread_access` table; threads idle for more
+    than `ttl` seconds, or beyond the `max_threads` most recently used, are deleted periodically.
+    The async methods run the SQLite calls in the default thread pool, so the workflow can be used
+    with `ainvoke`/`astream` without blocking the event loop.
+    """
+
+    def __init__(self, conn, max_threads: int = 1000, ttl: float = 3600, eviction_interval: float = 60, **kwargs):
+        """
+        Args:
+            conn (sqlite3.Connection): Connection to the checkpoint database.
+            max_threads (int): Maximum number of threads kept in the database.
+            ttl (float): Seconds of inactivity after which a thread is evicted.
+            eviction_interval (float): Minimum seconds between two eviction passes.
+        """
+        super().__init__(conn, **kwargs)
+        self.max_threads = max_threads
+        self.ttl = ttl
+        self.eviction_interval = eviction_interval
+        self.last_eviction = 0
+        self.evicted = 0
+
+    @classmethod
+    def from_path(cls, path: str, **kwargs):
+        conn = sqlite3.connect(path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return cls(conn, **kwargs)
+
+    def setup(self):
+        if self.is_setup:
+            return
+        super().setup()
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS thread_access (thread_id TEXT PRIMARY KEY, last_access REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS ix_thread_access_last_access ON thread_access (last_access)")
+        self.conn.commit()
+
+    def get_tuple(self, config):
+        self.touch(config["configurable"]["thread_id"])
+        return super().get_tuple(config)
+
+    def put(self, config, *args, **kwargs):
+        self.touch(config["configurable"]["thread_id"])
+        return super().put(config, *args, **kwargs)
+
+    def put_writes(self, config, *args, **kwargs):
+        self.touch(config["configurable"]["thread_id"])
+        return super().put_writes(config, *args, **kwargs)
+
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def aput(self, config, *args, **kwargs):
+        return await asyncio.to_thread(self.put, config, *args, **kwargs)
+
+    async def aput_writes(self, config, *args, **kwargs):
+        return await asyncio.to_thread(self.put_writes, config, *args, **kwargs)
+
+    async def alist(self, config, **kwargs):
+        for checkpoint in await asyncio.to_thread(lambda: list(self.list(config, **kwargs))):
+            yield checkpoint
+
+    def touch(self, thread_id: str):
+        """
+        Marks a thread as used now and periodically evicts the idle threads.
+        """
+        now = time.time()
+        with self.cursor() as cur:
+            cur.execute(
+                "INSERT INTO thread_access (thread_id, last_access) VALUES (?, ?) "
+                "ON CONFLICT(thread_id) DO UPDATE SET last_access = excluded.last_access",
+                (thread_id, now),
+            )
+        if now - self.last_eviction >= self.eviction_interval:
+            self.last_eviction = now
+            self.evict_idle()
+
+    def evict_idle(self):
+        with self.cursor() as cur:
+            cur.execute("SELECT thread_id FROM thread_access WHERE last_access < ?", (time.time() - self.ttl,))
+            thread_ids = {row[0] for row in cur.fetchall()}
+            cur.execute(
+                "SELECT thread_id FROM thread_access ORDER BY last_access DESC LIMIT -1 OFFSET ?", (self.max_threads,)
+            )
+            thread_ids.update(row[0] for row in cur.fetchall())
+
+            for thread_id in thread_ids:
+                for table in ("checkpoints", "writes", "thread_access"):
+                    cur.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+        self.evicted += len(thread_ids)
+
+    def thread_usage(self):
+        """
+        Returns:
+            dict: Bytes stored for each active thread.
+        """
+        with self.cursor(transaction=False) as cur:
+            cur.execute(
+                "SELECT thread_id, SUM(LENGTH(checkpoint) + LENGTH(metadata)) FROM checkpoints GROUP BY thread_id"
+            )
+            usage = dict(cur.fetchall())
+            cur.execute("SELECT thread_id, SUM(LENGTH(value)) FROM writes GROUP BY thread_id")
+            for thread_id, size in cur.fetchall():
+                usage[thread_id] = usage.get(thread_id, 0) + (size or 0)
+        return usage
+
+    def stats(self):
+        """
+        Returns:
+            dict: Aggregate counts of the stored threads, which never include the thread ids.
+        """
+        usage = self.thread_usage()
+        return {
+            "backend": "sqlite",
+            "threads": len(usage),
+            "max_threads": self.max_threads,
+            "ttl": self.ttl,
+            "evicted": self.evicted,
+            "bytes": sum(usage.values()),
+        }
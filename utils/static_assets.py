@@ -0,0 +1,194 @@
+from fastapi.staticfiles import StaticFiles
+from fastapi.responses import Response, FileResponse
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+import mimetypes
+import hashlib
+import gzip
+import os
+import logging
+
+try:
+    # In requirements.txt; where it is not installed the assets are only precompressed with gzip
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+COMPRESSIBLE = (".css", ".js", ".svg", ".html", ".json", ".txt")
+
+
+def precompress(body: bytes):
+    """
+    Compresses a payload with every available encoding, keeping only the encodings that make it smaller.
+
+    Returns:
+        dict: Compressed payload for each encoding ("br", "gzip"), in order of preference.
+    """
+    encoded = {}
+    if brotli is not None:
+        encoded["br"] = brotli.compress(body, quality=11)
+    encoded["gzip"] = gzip.compress(body, compresslevel=9, mtime=0)
+    return {encoding: data for encoding, data in encoded.items() if len(data) < len(body)}
+
+
+def negotiate(headers: Headers, encoded: dict):
+    """
+    Returns:
+        str: Preferred encoding of `encoded` accepted by the client, or None to send the payload uncompressed.
+    """
+    accepted = headers.get("accept-encoding", "")
+    return next((encoding for encoding in encoded if encoding in accepted), None)
+
+
+class Asset:
+    def __init__(self, path: str, body: bytes):
+        """
+        Args:
+            path (str): Path of the file on disk.
+            body (bytes): Content of the file.
+        """
+        self.path = path
+        self.digest = hashlib.sha256(body).hexdigest()[:12]
+        self.etag = f'"{self.digest}"'
+        self.media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        self.encoded = precompress(body) if path.endswith(COMPRESSIBLE) else {}
+
+
+class AssetManifest:
+    """
+    Content hashes of the static assets, used to serve them under fingerprinted URLs.
+
+    Every file under `directory` is hashed once and can be requested either by its name
+    (e.g. "styles/style.css") or by its fingerprinted name (e.g. "styles/style.3f2a9c01b7de.css").
+    As the fingerprinted URL changes whenever the content does, it can be cached by the browsers
+    forever. Text assets are also kept precompressed in memory.
+    """
+
+    def __init__(self, directory: str, prefix: str = "/assets"):
+        """
+        Args:
+            directory (str): Directory of the static assets.
+            prefix (str): URL path where the directory is mounted.
+        """
+        self.directory = directory
+        self.prefix = prefix
+        self.assets = {}
+        self.fingerprinted = {}
+        self.urls = {}
+
+        for root, folders, files in os.walk(directory):
+            for file in files:
+                path = os.path.join(root, file)
+                name = os.path.relpath(path, directory).replace(os.sep, "/")
+                with open(path, "rb") as f:
+                    asset = Asset(path, f.read())
+                stem, extension = os.path.splitext(name)
+                fingerprinted_name = f"{stem}.{asset.digest}{extension}"
+                self.assets[name] = asset
+                self.fingerprinted[fingerprinted_name] = name
+                self.urls[name] = f"{prefix}/{fingerprinted_name}"
+
+        logger.info("Se han indexado %d recursos estáticos de %s", len(self.assets), directory, extra={"stage": "static_assets"})
+
+    def url(self, name: str):
+        """
+        Returns the fingerprinted URL of an asset, to be used in the templates.
+
+        Args:
+            name (str): Path of the asset relative to the directory (e.g. "styles/style.css").
+
+        Returns:
+            str: Fingerprinted URL, or the plain URL if the asset is unknown.
+        """
+        return self.urls.get(name, f"{self.prefix}/{name}")
+
+    def resolve(self, name: str):
+        """
+        Returns:
+            tuple: Asset requested and whether it was requested by its fingerprinted name, or (None, False).
+        """
+        if name in self.fingerprinted:
+            return self.assets[self.fingerprinted[name]], True
+        return self.assets.get(name), False
+
+
+class CachedStaticFiles(StaticFiles):
+    """
+    StaticFiles that serves the fingerprinted assets of an AssetManifest.
+
+    Fingerprinted URLs are served with an immutable Cache-Control; plain URLs are revalidated with
+    their ETag on every use. Precompressed payloads are sent to the clients that accept them.
+    """
+
+    def __init__(self, *args, manifest: AssetManifest, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.manifest = manifest
+
+    async def get_response(self, path: str, scope):
+        asset, fingerprinted = self.manifest.resolve(path.replace(os.sep, "/"))
+        if asset is None:
+            response = await super().get_response(path, scope)
+            response.headers.setdefault("Cache-Control", REVALIDATE)
+            return response
+        if scope["method"] not in ("GET", "HEAD"):
+            raise HTTPException(status_code=405)
+
+        request_headers = Headers(scope=scope)
+        headers = {"ETag": asset.etag, "Cache-Control": IMMUTABLE if fingerprinted else REVALIDATE}
+        if asset.encoded:
+            headers["Vary"] = "Accept-Encoding"
+        if asset.etag in request_headers.get("if-none-match", ""):
+            return Response(status_code=304, headers=headers)
+
+        encoding = negotiate(request_headers, asset.encoded)
+        if encoding is not None:
+            return Response(
+                asset.encoded[encoding], media_type=asset.media_type, headers={**headers, "Content-Encoding": encoding}
+            )
+        return FileResponse(asset.path, media_type=asset.media_type, headers=headers)
+
+
+class ViewCache:
+    """
+    Rendered Jinja2 templates that do not depend on the request.
+
+    Each view is rendered once and kept with its precompressed payloads and ETag, so serving it
+    only costs a dictionary lookup and the browsers can revalidate it with If-None-Match.
+    """
+
+    def __init__(self, templates):
+        """
+        Args:
+            templates (Jinja2Templates): Templates of the views.
+        """
+        self.templates = templates
+        self.views = {}
+
+    def render(self, name: str):
+        view = self.views.get(name)
+        if view is None:
+            body = self.templates.get_template(name).render().encode("utf-8")
+            view = (body, precompress(body), f'"{hashlib.sha256(body).hexdigest()[:16]}"')
+            self.views[name] = view
+        return view
+
+    def response(self, request, name: str):
+        """
+        Returns:
+            Response: Cached render of the template, 304 if the client already has it.
+        """
+        body, encoded, etag = self.render(name)
+        headers = {"ETag": etag, "Cache-Control": REVALIDATE, "Vary": "Accept-Encoding"}
+        if etag in request.headers.get("if-none-match", ""):
+            return Response(status_code=304, headers=headers)
+        encoding = negotiate(request.headers, encoded)
+        if encoding is not None:
+            return Response(encoded[encoding], media_type="text/html", headers={**headers, "Content-Encoding": encoding})
+        return Response(body, media_type="text/html", headers=headers)
+
+    def clear(self):
+        self.views.clear()
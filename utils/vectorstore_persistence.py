@@ -0,0 +1,395 @@
+from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_core.documents import Document
+import numpy as np
+import faiss
+import sqlite3
+import base64
+import os
+import re
+import shutil
+import threading
+import time
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+GENERATION_PATTERN = re.compile(r"gen-(\d+)")
+# Segments of the write-ahead log, named after the sequence number of the snapshot they follow
+SEGMENT_PATTERN = re.compile(r"wal-(\d+)\.jsonl")
+# Log of the versions that kept a single segment, replayed before the numbered ones
+LEGACY_WAL_FILE = "wal.jsonl"
+
+# Files of a generation that the processes of the shared mode open read-only (see utils/shared_vectorstore.py)
+VECTORS_FILE = "vectors.npy"
+DOCSTORE_FILE = "docstore.db"
+SETTINGS_FILE = "settings.json"
+
+
+class VectorstorePersistence:
+    """
+    Persists the mutations of a FAISS vectorstore with a write-ahead log and periodic snapshots.
+
+    Every vector added or removed is appended to a write-ahead log before the vectorstore is mutated,
+    including the embedding of the added texts as base64 float32, so that replaying the log never needs
+    the embeddings API. A background thread compacts the log periodically into a new snapshot generation
+    (`index.faiss`/`index.pkl` saved by `FAISS.save_local` inside `gen-XXXXXX/`), which is published by
+    atomically renaming the `CURRENT` file. Each snapshot starts a new log segment, so the entries it
+    covers are dropped by deleting the previous segments, without reading them.
+    On startup the current snapshot is loaded and only the tail of the log written after it is replayed.
+
+    Layout of the vectorstore folder:
+        CURRENT            {"generation": "gen-000003", "seq": 1234}
+        gen-000003/        index.faiss and index.pkl of the snapshot
+        wal-000001234.jsonl  one JSON entry per mutation after seq 1234, with an increasing "seq"
+
+    A folder without `CURRENT` is loaded as a plain `FAISS.save_local` folder, so the existing
+    `data/vectorstore/faiss_index` keeps working and becomes the base of the first generation.
+
+    With `shared`, each generation also contains the vectors as a raw `vectors.npy` array and the
+    documents in a SQLite `docstore.db`, which other processes can open memory-mapped and read-only.
+    """
+
+    def __init__(self, folder_path: str, embedding_function, flush_interval: float = 300, flush_size: int = 1000,
+                 shared: bool = False, keep_generations: int = 1, lock=None):
+        """
+        Args:
+            folder_path (str): Folder of the vectorstore.
+            embedding_function: Embeddings used to load the FAISS vectorstore.
+            flush_interval (float): Maximum seconds between snapshots while there are logged mutations.
+            flush_size (int): Maximum number of logged mutations before a snapshot is taken.
+            shared (bool): Whether to also write the files read by the processes of the shared mode.
+            keep_generations (int): Number of generations kept on disk, so that the processes still
+                reading an older generation can finish opening it.
+            lock (threading.RLock, optional): Lock guarding the in-memory vectorstore, held while a mutation
+                is logged and applied and while the snapshot copies it.
+        """
+        self.folder_path = folder_path
+        self.embedding_function = embedding_function
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.shared = shared
+        self.keep_generations = keep_generations
+        self.current_file = os.path.join(folder_path, "CURRENT")
+        self.wal_file = self._segment(0)
+        self.lock = lock or threading.RLock()
+        # Only one snapshot is written at a time; mutations keep going while it is written
+        self.snapshot_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.generation = None
+        self.seq = 0
+        self.pending = 0
+        self.last_snapshot = time.monotonic()
+
+    def load(self):
+        """
+        Loads the last snapshot and replays the write-ahead log entries written after it.
+
+        Returns:
+            FAISS: The recovered vectorstore.
+        """
+        with self.lock:
+            snapshot_seq = 0
+            snapshot_path = self.folder_path
+            current = self.current()
+            if current is not None:
+                self.generation = current["generation"]
+                snapshot_seq = current["seq"]
+                snapshot_path = os.path.join(self.folder_path, self.generation)
+
+            if os.path.exists(os.path.join(snapshot_path, "index.faiss")):
+                vectorstore = FAISS.load_local(
+                    folder_path=snapshot_path,
+                    embeddings=self.embedding_function,
+                    allow_dangerous_deserialization=True
+                )
+            else:
+                # A new folder (e.g. for another embeddings backend) starts empty and is filled through the log
+                vectorstore = self._create_empty()
+
+            self.seq = snapshot_seq
+            self.pending = 0
+            for path in self._segments():
+                for entry in self._read_wal(path):
+                    if entry["seq"] <= snapshot_seq:
+                        continue
+                    self._apply(vectorstore, entry)
+                    self.seq = entry["seq"]
+                    self.pending += 1
+            # Appended to a new segment, which the next snapshot keeps
+            self.wal_file = self._segment(self.seq)
+
+            self.last_snapshot = time.monotonic()
+
+        logger.info("Vectorstore cargado con %d operaciones del log reproducidas.", self.pending, extra={"stage": "vectorstore_load"})
+        return vectorstore
+
+    def current(self):
+        """
+        Returns:
+            dict: Generation and sequence number of the current snapshot, or None if there is none.
+        """
+        if not os.path.exists(self.current_file):
+            return None
+        with open(self.current_file) as file:
+            return json.load(file)
+
+    def published(self):
+        """
+        Returns:
+            bool: Whether the current snapshot has the files read by the processes of the shared mode.
+        """
+        current = self.current()
+        return current is not None and os.path.exists(os.path.join(self.folder_path, current["generation"], SETTINGS_FILE))
+
+    def apply(self, vectorstore, entry: dict):
+        """
+        Logs a mutation and then applies it to the vectorstore, skipping the documents already added or
+        removed, so that applying the same mutation twice (e.g. when the log is replayed) has no effect.
+
+        The entry is in the log, flushed to disk, before the vectorstore changes, so a mutation that
+        was applied, and therefore acknowledged, is never lost by a crash. Taking the snapshot is left
+        to the background thread started by start.
+
+        Args:
+            vectorstore (FAISS): Vectorstore to mutate.
+            entry (dict): Mutation, with the format of the write-ahead log entries: {"op": "add", "ids",
+                "texts", "embeddings", "metadatas"} or {"op": "remove", "ids"}.
+        """
+        with self.lock:
+            self._log(entry)
+            self._apply(vectorstore, entry)
+
+    def start(self, vectorstore):
+        """
+        Starts the background thread that takes the snapshots of the vectorstore: every `flush_interval`
+        seconds while there are logged mutations, and as soon as `flush_size` mutations are logged.
+
+        Args:
+            vectorstore (FAISS): Vectorstore to save.
+        """
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self._run, args=(vectorstore,), name="vectorstore-snapshot", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stops the background thread of the snapshots, waiting for the snapshot being written, if any.
+        """
+        self.stopped.set()
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def snapshot(self, vectorstore, force: bool = False):
+        """
+        Compacts the write-ahead log into a new snapshot generation of the vectorstore.
+
+        A copy of the vectorstore is taken under the lock and written without it, so the mutations only
+        wait for the copy. The snapshot is written to a temporary folder, renamed to its generation folder
+        and published by atomically replacing `CURRENT`; then the log entries it covers are removed.
+        A crash at any point leaves either the previous snapshot plus the full log, or the new snapshot
+        plus a log whose entries it covers are skipped on load.
+
+        Args:
+            vectorstore (FAISS): Vectorstore to save.
+            force (bool): Whether to save it even if nothing was logged since the last snapshot.
+        """
+        with self.snapshot_lock:
+            with self.lock:
+                if self.pending == 0 and not force:
+                    self.last_snapshot = time.monotonic()
+                    return
+                if self.generation == f"gen-{self.seq:06d}":
+                    # Never overwrite the current snapshot: a forced snapshot without new mutations takes the next number
+                    self.seq += 1
+                seq = self.seq
+                copy = self._copy(vectorstore)
+                # The mutations logged from now on go to a new segment, which is all that is left of the log
+                self.wal_file = self._segment(seq)
+
+            generation = f"gen-{seq:06d}"
+            generation_path = os.path.join(self.folder_path, generation)
+            tmp_path = f"{generation_path}.tmp"
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            shutil.rmtree(generation_path, ignore_errors=True)
+
+            copy.save_local(tmp_path)
+            if self.shared:
+                self._save_shared(copy, tmp_path)
+            del copy
+            for file_name in os.listdir(tmp_path):
+                with open(os.path.join(tmp_path, file_name), "rb") as file:
+                    os.fsync(file.fileno())
+            os.rename(tmp_path, generation_path)
+
+            with self.lock:
+                self._write_atomic(self.current_file, json.dumps({"generation": generation, "seq": seq}))
+                self.generation = generation
+                self.pending = self.seq - seq
+                self.last_snapshot = time.monotonic()
+
+            # The previous segments only have entries covered by the snapshot, and nothing appends to them
+            for path in self._segments():
+                if path != self.wal_file and self._segment_seq(path) < seq:
+                    os.remove(path)
+
+            generations = sorted(
+                (name for name in os.listdir(self.folder_path) if GENERATION_PATTERN.fullmatch(name)),
+                key=lambda name: int(GENERATION_PATTERN.fullmatch(name)[1])
+            )
+            for name in generations[:-self.keep_generations]:
+                shutil.rmtree(os.path.join(self.folder_path, name), ignore_errors=True)
+
+        logger.info("Snapshot %s del vectorstore guardado.", generation, extra={"stage": "vectorstore_snapshot", "generation": generation})
+
+    def _run(self, vectorstore):
+        while not self.stopped.is_set():
+            self.wakeup.wait(max(0.0, self.last_snapshot + self.flush_interval - time.monotonic()))
+            self.wakeup.clear()
+            if self.stopped.is_set():
+                break
+            if self.pending >= self.flush_size or time.monotonic() - self.last_snapshot >= self.flush_interval:
+                try:
+                    self.snapshot(vectorstore)
+                except Exception:
+                    logger.exception("Error al guardar el snapshot del vectorstore", extra={"stage": "vectorstore_snapshot"})
+                    self.last_snapshot = time.monotonic()
+
+    def _log(self, entry: dict):
+        self.seq += 1
+        entry["seq"] = self.seq
+        record = entry
+        if entry["op"] == "add":
+            # float32 bytes in base64 take about 5 characters per dimension, instead of about 20 as JSON numbers
+            record = {**entry, "embeddings": base64.b64encode(np.asarray(entry["embeddings"], dtype=np.float32).tobytes()).decode("ascii")}
+        with open(self.wal_file, "a") as file:
+            file.write(json.dumps(record) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        self.pending += 1
+        if self.pending >= self.flush_size:
+            self.wakeup.set()
+
+    def _copy(self, vectorstore):
+        return FAISS(
+            vectorstore.embedding_function,
+            faiss.clone_index(vectorstore.index),
+            InMemoryDocstore(dict(vectorstore.docstore._dict)),
+            dict(vectorstore.index_to_docstore_id),
+            relevance_score_fn=vectorstore.override_relevance_score_fn,
+            normalize_L2=vectorstore._normalize_L2,
+            distance_strategy=vectorstore.distance_strategy
+        )
+
+    def _save_shared(self, vectorstore, path: str, chunk_size: int = 10000):
+        # Vectors as a raw float32 array, copied in chunks so that the index is never duplicated in memory
+        index = vectorstore.index
+        if index.ntotal:
+            vectors = np.lib.format.open_memmap(
+                os.path.join(path, VECTORS_FILE), mode="w+", dtype=np.float32, shape=(index.ntotal, index.d)
+            )
+            for start in range(0, index.ntotal, chunk_size):
+                count = min(chunk_size, index.ntotal - start)
+                vectors[start:start + count] = index.reconstruct_n(start, count)
+            vectors.flush()
+            del vectors
+        else:
+            np.save(os.path.join(path, VECTORS_FILE), np.zeros((0, index.d), dtype=np.float32))
+
+        connection = sqlite3.connect(os.path.join(path, DOCSTORE_FILE))
+        with connection:
+            connection.execute(
+                "CREATE TABLE documents (position INTEGER PRIMARY KEY, docstore_id TEXT UNIQUE NOT NULL, page_content TEXT, metadata TEXT)"
+            )
+            connection.executemany(
+                "INSERT INTO documents VALUES (?, ?, ?, ?)",
+                (
+                    (position, docstore_id, document.page_content, json.dumps(document.metadata))
+                    for position, docstore_id in vectorstore.index_to_docstore_id.items()
+                    for document in [vectorstore.docstore.search(docstore_id)]
+                )
+            )
+        connection.close()
+
+        # Its presence tells the shared mode that the generation can be opened read-only (see published)
+        with open(os.path.join(path, SETTINGS_FILE), "w") as file:
+            json.dump({
+                "metric_type": int(index.metric_type),
+                "distance_strategy": vectorstore.distance_strategy.value,
+                "normalize_L2": vectorstore._normalize_L2,
+            }, file)
+
+    def _create_empty(self):
+        os.makedirs(self.folder_path, exist_ok=True)
+        dimension = len(self.embedding_function.embed_query("dimension"))
+        return FAISS(self.embedding_function, faiss.IndexFlatL2(dimension), InMemoryDocstore(), {})
+
+    def _write_atomic(self, path: str, content: str):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as file:
+            file.write(content)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+
+    def _segment(self, seq: int):
+        return os.path.join(self.folder_path, f"wal-{seq:09d}.jsonl")
+
+    def _segment_seq(self, path: str):
+        match = SEGMENT_PATTERN.fullmatch(os.path.basename(path))
+        return int(match[1]) if match else -1
+
+    def _segments(self):
+        """
+        Returns:
+            list: Paths of the segments of the write-ahead log, oldest first.
+        """
+        if not os.path.isdir(self.folder_path):
+            return []
+        paths = [
+            os.path.join(self.folder_path, name) for name in os.listdir(self.folder_path)
+            if name == LEGACY_WAL_FILE or SEGMENT_PATTERN.fullmatch(name)
+        ]
+        return sorted(paths, key=self._segment_seq)
+
+    def _read_wal(self, path: str):
+        valid_size = 0
+        with open(path, "rb") as file:
+            for line in file:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                valid_size += len(line)
+                yield entry
+
+        # Drop a torn last line left by a crash while appending, so new entries start on a clean line
+        if valid_size < os.path.getsize(path):
+            logger.warning("Entrada incompleta del log del vectorstore descartada.", extra={"stage": "vectorstore_load"})
+            with open(path, "r+b") as file:
+                file.truncate(valid_size)
+
+    def _apply(self, vectorstore, entry: dict):
+        if entry["op"] == "add":
+            new = [i for i, docstore_id in enumerate(entry["ids"]) if not isinstance(vectorstore.docstore.search(docstore_id), Document)]
+            if new:
+                embeddings = entry["embeddings"]
+                if isinstance(embeddings, str):
+                    # Logged as base64 float32; the entries of the legacy log have JSON numbers
+                    embeddings = np.frombuffer(base64.b64decode(embeddings), dtype=np.float32).reshape(len(entry["ids"]), -1)
+                vectorstore.add_embeddings(
+                    text_embeddings=[(entry["texts"][i], embeddings[i]) for i in new],
+                    metadatas=[entry["metadatas"][i] for i in new],
+                    ids=[entry["ids"][i] for i in new]
+                )
+        elif entry["op"] == "remove":
+            ids = [docstore_id for docstore_id in entry["ids"] if isinstance(vectorstore.docstore.search(docstore_id), Document)]
+            if ids:
+                vectorstore.delete(ids=ids)
@@ -0,0 +1,109 @@
+from concurrent.futures import Future
+import threading
+import queue
+import time
+
+
+class WriteQueue:
+    """
+    Coalesces the inserts submitted concurrently into a single transaction.
+
+    Inserts are queued and written by a background thread, which waits up to `max_delay` seconds for
+    more inserts to arrive and writes up to `max_batch` of them in one transaction, with one
+    executemany statement per table. Ids are allocated by the database and returned with RETURNING,
+    so concurrent writers never collide on them. If the transaction fails, its inserts are retried
+    one by one, so only the inserts that fail on their own raise.
+    """
+
+    def __init__(self, engine, max_batch: int = 100, max_delay: float = 0.005):
+        """
+        Args:
+            engine (Engine): Engine of the database.
+            max_batch (int): Maximum number of inserts written in one transaction.
+            max_delay (float): Seconds to wait for more inserts before writing a batch.
+        """
+        self.engine = engine
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+        self.batches = 0
+        self.writes = 0
+
+    def submit(self, table, row: dict, returning: str = None):
+        """
+        Queues an insert.
+
+        Args:
+            table (Table): Table to insert the row in.
+            row (dict): Values of the row; must have the same keys for every row of the table.
+            returning (str, optional): Column generated by the database whose value is returned (e.g. "id").
+
+        Returns:
+            Future: Resolves to the value of the returning column (None if not given) once committed.
+        """
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="write-queue", daemon=True)
+                self.thread.start()
+        future = Future()
+        self.queue.put((table, row, returning, future))
+        return future
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+    def _write(self, batch: list):
+        try:
+            results = self._insert(batch)
+        except Exception:
+            # A failing row (e.g. a duplicate of a unique column) must not fail the rows coalesced with it:
+            # they are written again one by one, and only the failing ones get the exception
+            results = []
+            for item in batch:
+                try:
+                    results.extend(self._insert([item]))
+                except Exception as e:
+                    item[3].set_exception(e)
+
+        self.batches += 1
+        self.writes += len(results)
+        for (table, row, returning, future), value in results:
+            future.set_result(value)
+
+    def _insert(self, batch: list):
+        """
+        Inserts a batch in one transaction, with one executemany statement per table.
+
+        Returns:
+            list: Pairs of queued item and value of its returning column.
+        """
+        groups = {}
+        for item in batch:
+            table, row, returning, future = item
+            groups.setdefault((table, returning, tuple(row)), []).append(item)
+
+        results = []
+        with self.engine.begin() as connection:
+            for (table, returning, columns), items in groups.items():
+                rows = [row for table, row, returning, future in items]
+                if returning is not None:
+                    statement = table.insert().returning(table.c[returning], sort_by_parameter_order=True)
+                    values = connection.execute(statement, rows).scalars().all()
+                else:
+                    connection.execute(table.insert(), rows)
+                    values = [None] * len(rows)
+                results.extend(zip(items, values))
+        return results